@@ -1,4 +1,4 @@
-__all__ = ["database", "models", "schemas", "Base", "engine", "get_db"]
+__all__ = ["database", "models", "schemas", "schema_upgrade", "Base", "engine", "get_db", "SessionLocal"]
 
-from . import database, models, schemas
-from .database import Base, engine, get_db
\ No newline at end of file
+from . import database, models, schemas, schema_upgrade
+from .database import Base, engine, get_db, SessionLocal
\ No newline at end of file
@@ -11,7 +11,7 @@ Gagawin pa: (the specific transactions to implement)
 - CO11N: Order Confirmation (Confirming the orders yourself para ma mark as completed)
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, Enum
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Enum, JSON, UniqueConstraint, Index
 from .database import Base
 import enum
 from datetime import datetime
@@ -50,6 +50,14 @@ class ProductionOrder(Base):
     routingId = Column(String, nullable=True)
     costCenter = Column(String)
     plant = Column(String)
+    # Running CO11N totals, maintained incrementally by confirmations and reversals
+    confirmedYield = Column(Float, nullable=True)
+    confirmedScrap = Column(Float, nullable=True)
+    finalConfirmations = Column(Integer, nullable=True)
+    eventSequence = Column(Integer, nullable=True)  # Sequence of the last OrderChangeEvent (utils/order_events.py)
+    version = Column(Integer, nullable=False, default=1)  # Optimistic locking (utils/concurrency.py)
+
+    __mapper_args__ = {"version_id_col": version}
 
 class MaterialType(str, enum.Enum):
     RAW = "RAW"
@@ -79,6 +87,7 @@ class Material(Base):
     plant = Column(String)
     storageLocation = Column(String)
     lastMovementDate = Column(DateTime, nullable=True)
+    plannedDeliveryTime = Column(Integer, nullable=True)  # Days from requisition to receipt for purchased materials (MRP)
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
@@ -137,6 +146,9 @@ class Stock(Base):
     storage_location = Column(String)
     on_hand = Column(Float, default=0.0)
     safety_stock = Column(Float, default=0.0)
+    version = Column(Integer, nullable=False, default=1)  # Optimistic locking (utils/concurrency.py)
+
+    __mapper_args__ = {"version_id_col": version}
 
 class Confirmation(Base):
     __tablename__ = "confirmations"
@@ -161,6 +173,7 @@ class GoodsMovement(Base):
     storage_loc = Column(String)
     order_id = Column(String, nullable=True)
     reference = Column(String, nullable=True)
+    confirmation_id = Column(String, index=True, nullable=True)  # CO11N confirmation that posted this movement
     timestamp = Column(DateTime, default=lambda: datetime.now())
 
 # Routing and Operations Models / Step-by-Step Logic 
@@ -188,6 +201,7 @@ class Routing(Base):
     valid_to = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now())
     updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
+    revision = Column(Integer, default=1)  # Bumped on every change of the routing or its operations (routing cache)
 
 class Operation(Base):
     __tablename__ = "operations"
@@ -239,18 +253,66 @@ class PurchaseRequisition(Base):
 
 class OrderChangeHistory(Base):
     __tablename__ = "order_change_history"
+    __table_args__ = (
+        # Keyset pagination of the history search, newest first
+        Index("ix_order_change_history_plant_ts", "plant", "change_timestamp", "id"),
+        Index("ix_order_change_history_changed_by_ts", "changed_by", "change_timestamp", "id"),
+        Index("ix_order_change_history_ts", "change_timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     change_id = Column(String, unique=True, index=True)
     order_id = Column(String, index=True)
+    plant = Column(String, nullable=True)  # Denormalized from the order for history search
+    change_set_id = Column(String, index=True, nullable=True)  # OrderChangeEvent written with this change
     change_type = Column(String)  # QUANTITY, DATE, COMPONENT, OPERATION
-    field_name = Column(String)
+    field_name = Column(String)  # Comma-separated fields of a compact row
     old_value = Column(String, nullable=True)
     new_value = Column(String, nullable=True)
+    changes = Column(JSON, nullable=True)  # Compact row: {field: {"old": ..., "new": ..., "type": ...}} (utils/audit.py)
     reason = Column(String, nullable=True)
     changed_by = Column(String, default="SYSTEM")
     change_timestamp = Column(DateTime, default=lambda: datetime.now())
 
+# One row per change type of a compact audit row that mixes several (its change_type is "BULK"),
+# so the history search by change type still finds it
+class OrderChangeHistoryType(Base):
+    __tablename__ = "order_change_history_types"
+    __table_args__ = (
+        Index("ix_order_change_history_types_type", "change_type", "change_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    change_id = Column(String, index=True)  # OrderChangeHistory.change_id
+    change_type = Column(String)
+
+# Typed change set of one production order (event log, utils/order_events.py)
+class OrderChangeEvent(Base):
+    __tablename__ = "order_change_events"
+    __table_args__ = (
+        UniqueConstraint("order_id", "sequence", name="uq_order_change_events_sequence"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    change_set_id = Column(String, unique=True, index=True)
+    order_id = Column(String, index=True)
+    sequence = Column(Integer)  # Per-order sequence, 1, 2, 3, ...
+    change_type = Column(String)  # QUANTITY, DATE, RELEASE, CONFIRMATION, ROLLBACK, ...
+    changes = Column(JSON)  # {field: {"old": value, "new": value}}
+    reason = Column(String, nullable=True)
+    changed_by = Column(String, default="SYSTEM")
+    change_timestamp = Column(DateTime, default=lambda: datetime.now(), index=True)
+
+# Full production order state after change set `sequence` (0 = state before the first change set)
+class OrderSnapshot(Base):
+    __tablename__ = "order_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(String, index=True)
+    sequence = Column(Integer)
+    state = Column(JSON)
+    snapshot_timestamp = Column(DateTime, default=lambda: datetime.now())
+
 class OperationConfirmation(Base):
     __tablename__ = "operation_confirmations"
 
@@ -267,6 +329,90 @@ class OperationConfirmation(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     confirmation_type = Column(String, default="FINAL")  # PARTIAL, FINAL
-    status = Column(String, default="CONFIRMED")
+    status = Column(String, default="CONFIRMED")  # CONFIRMED, REVERSED
     confirmed_by = Column(String, default="SYSTEM")
-    created_at = Column(DateTime, default=lambda: datetime.now())
\ No newline at end of file
+    ingest_id = Column(String, unique=True, index=True, nullable=True)  # Set when posted from the ingestion journal
+    reversed_at = Column(DateTime, nullable=True)
+    reversal_reason = Column(String, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now())
+
+# Running statistics of actual confirmed times per operation and work center (utils/operation_stats.py)
+class OperationTimeStatistic(Base):
+    __tablename__ = "operation_time_stats"
+    __table_args__ = (
+        UniqueConstraint("routing_id", "operation_id", "work_center_id", name="uq_operation_time_stats_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    routing_id = Column(String, index=True)
+    operation_id = Column(String)
+    work_center_id = Column(String, index=True)
+    sample_count = Column(Integer, default=0)
+    setup_mean = Column(Float, default=0.0)  # Welford running mean / sum of squared deviations
+    setup_m2 = Column(Float, default=0.0)
+    machine_mean = Column(Float, default=0.0)
+    machine_m2 = Column(Float, default=0.0)
+    labor_mean = Column(Float, default=0.0)
+    labor_m2 = Column(Float, default=0.0)
+    sketches = Column(JSON)  # Quantile sketches per metric
+    updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
+
+# Finite-capacity schedule of one order operation (routers/scheduling.py)
+class ScheduledOperation(Base):
+    __tablename__ = "scheduled_operations"
+    __table_args__ = (
+        Index("ix_scheduled_operations_wc_start", "work_center_id", "start_time"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    plant = Column(String, index=True)
+    dispatch_position = Column(Integer, index=True)  # Position of the order in the dispatch sequence
+    order_id = Column(String, index=True)
+    order_fingerprint = Column(String)  # Scheduling inputs of the order; unchanged prefixes are kept
+    operation_id = Column(String)
+    sequence = Column(Integer)
+    work_center_id = Column(String)
+    load_hours = Column(Float)
+    start_time = Column(DateTime)
+    end_time = Column(DateTime)
+    scheduled_at = Column(DateTime, default=lambda: datetime.now())
+
+# Daily production and goods movement totals, maintained by the posting transactions (utils/kpi_rollups.py)
+class DailyKpiRollup(Base):
+    __tablename__ = "daily_kpi_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "plant", "work_center_id", "material_id", name="uq_daily_kpi_rollups_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date)  # Leading column of the unique key, which serves date range queries
+    plant = Column(String, default="")  # "" when unknown, so the key stays unique
+    work_center_id = Column(String, default="")
+    material_id = Column(String, default="")
+    confirmations = Column(Integer, default=0)
+    yield_qty = Column(Float, default=0.0)
+    scrap_qty = Column(Float, default=0.0)
+    goods_movements = Column(Integer, default=0)
+    receipt_qty = Column(Float, default=0.0)
+    issue_qty = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
+
+# OEE inputs per work center and shift from CO11N confirmations, maintained by the posting transactions (utils/oee.py)
+class OEEShiftStatistic(Base):
+    __tablename__ = "oee_shift_stats"
+    __table_args__ = (
+        UniqueConstraint("day", "shift", "work_center_id", name="uq_oee_shift_stats_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date)  # Production day; shifts start at SCHEDULING_SHIFT_START_HOUR
+    shift = Column(Integer)  # 1, 2, ... of OEE_SHIFT_HOURS each
+    work_center_id = Column(String)
+    confirmations = Column(Integer, default=0)
+    setup_minutes = Column(Float, default=0.0)  # Actual setup time
+    run_minutes = Column(Float, default=0.0)  # Actual machine time
+    ideal_minutes = Column(Float, default=0.0)  # Standard machine time x (yield + scrap)
+    yield_qty = Column(Float, default=0.0)
+    scrap_qty = Column(Float, default=0.0)
+    revision = Column(Integer, default=0)  # Bumped by every update; cached days are revalidated on it
+    updated_at = Column(DateTime, default=lambda: datetime.now(), onupdate=lambda: datetime.now())
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+IN-PLACE SCHEMA UPGRADE
+
+create_all only creates missing tables, it never alters existing ones. Columns and
+indexes added to tables that already exist in a deployed database (the Postgres volume
+outlives the container) are added here, idempotently, right after create_all:
+- ADD COLUMN for every listed column the table does not have yet (IF NOT EXISTS on
+  PostgreSQL), typed as in the model, with a server DEFAULT that fills existing rows
+- CREATE INDEX for every index of the upgraded tables that does not exist yet
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# (table, column, server default for existing rows or None) of columns added after the initial schema
+UPGRADE_COLUMNS = [
+    ("production_orders", "confirmedYield", None),
+    ("production_orders", "confirmedScrap", None),
+    ("production_orders", "finalConfirmations", None),
+    ("production_orders", "eventSequence", None),  # NULL marks orders that predate the change log
+    ("production_orders", "version", "1"),
+    ("stock", "version", "1"),
+    ("materials", "plannedDeliveryTime", None),
+    ("goods_movements", "confirmation_id", None),
+    ("routings", "revision", "1"),
+    ("order_change_history", "plant", None),
+    ("order_change_history", "change_set_id", None),
+    ("order_change_history", "changes", None),
+    ("operation_confirmations", "ingest_id", None),
+    ("operation_confirmations", "reversed_at", None),
+    ("operation_confirmations", "reversal_reason", None),
+]
+
+def upgrade_schema(engine: Engine) -> list:
+    """Add missing columns and indexes to existing tables; returns the "table.column" names added"""
+    dialect = engine.dialect
+    quote = dialect.identifier_preparer.quote
+    if_not_exists = "IF NOT EXISTS " if dialect.name == "postgresql" else ""
+    added = []
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        upgraded_tables = set()
+
+        for table_name, column_name, default in UPGRADE_COLUMNS:
+            if table_name not in existing_tables:
+                continue  # created complete by create_all
+            upgraded_tables.add(table_name)
+            if column_name in {c["name"] for c in inspector.get_columns(table_name)}:
+                continue
+
+            column = models.Base.metadata.tables[table_name].c[column_name]
+            ddl = f"{column.type.compile(dialect=dialect)}"
+            if default is not None:
+                ddl += f" DEFAULT {default}"
+            if not column.nullable and default is not None:
+                ddl += " NOT NULL"
+            connection.execute(text(
+                f"ALTER TABLE {quote(table_name)} ADD COLUMN {if_not_exists}{quote(column_name)} {ddl}"
+            ))
+            added.append(f"{table_name}.{column_name}")
+
+        for table_name in sorted(upgraded_tables):
+            for index in models.Base.metadata.tables[table_name].indexes:
+                index.create(connection, checkfirst=True)
+
+    if added:
+        logger.info(f"Schema upgraded, added columns: {', '.join(added)}")
+    return added
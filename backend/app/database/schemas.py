@@ -71,6 +71,7 @@ class MaterialCreate(BaseModel):
     currentStock: Optional[int] = 0
     minStock: Optional[int] = 0
     maxStock: Optional[int] = 1000
+    plannedDeliveryTime: Optional[int] = None  # Days, purchased materials
 
 class MaterialResponse(BaseModel):
     id: int
@@ -86,6 +87,7 @@ class MaterialResponse(BaseModel):
     plant: str
     storageLocation: str
     lastMovementDate: Optional[datetime] = None
+    plannedDeliveryTime: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -118,6 +120,9 @@ class ProductionOrderResponse(BaseModel):
     routingId: Optional[str] = None
     costCenter: Optional[str] = None
     plant: Optional[str] = None
+    confirmedYield: Optional[float] = None
+    confirmedScrap: Optional[float] = None
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -206,6 +211,7 @@ class StockResponse(BaseModel):
     storage_location: str
     on_hand: float
     safety_stock: float
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -388,10 +394,21 @@ class OperationConfirmationResponse(BaseModel):
     status: str
     confirmed_by: str
     created_at: datetime
+    reversed_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class ConfirmationReversalRequest(BaseModel):
+    reason: Optional[str] = None
+
+class MassConfirmationReversalRequest(BaseModel):
+    order_id: Optional[str] = None
+    work_center_id: Optional[str] = None
+    start_time: Optional[datetime] = None  # Shift window start
+    end_time: Optional[datetime] = None    # Shift window end
+    reason: Optional[str] = None
+
 # Enhanced Production Order Schema with Routing
 class ProductionOrderCreateWithRouting(BaseModel):
     material_id: str
@@ -1,11 +1,17 @@
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import time
 import logging
 from sqlalchemy.exc import OperationalError
 from database import Base, engine, models
-from utils.websocket_manager import websocket_endpoint
+from database.schema_upgrade import upgrade_schema
+from utils.websocket_manager import websocket_endpoint, manager as websocket_manager
+from utils.live_snapshot import board_rows, order_snapshot
+import utils.order_board  # noqa: F401 - order board delta hooks
+from utils.confirmation_journal import journal as confirmation_journal
+from utils.event_bus import bus as event_bus
 
 load_dotenv()
 
@@ -20,6 +26,8 @@ def create_tables_with_retry(max_retries=30, delay=2):
         try:
             logger.info(f"Attempting to connect to database (attempt {attempt + 1}/{max_retries})")
             models.Base.metadata.create_all(bind=engine)
+            # create_all does not alter existing tables: add columns and indexes introduced since
+            upgrade_schema(engine)
             logger.info("Database tables created successfully!")
             return True
         except OperationalError as e:
@@ -35,7 +43,7 @@ def create_tables_with_retry(max_retries=30, delay=2):
 create_tables_with_retry()
 
 # Added routing router for routing/operations functionality, order_changes for CO02, and operation_confirmations for CO11N
-from routers import auth, analytics, bom, goods_movements, materials, mrp, production_orders, work_centers, routing, order_changes, operation_confirmations
+from routers import auth, analytics, bom, goods_movements, materials, mrp, production_orders, work_centers, routing, order_changes, operation_confirmations, operation_stats, capacity, scheduling, oee
 
 app = FastAPI(title="SAP Manufacturing System API", version="1.0.0")
 
@@ -60,6 +68,24 @@ app.include_router(work_centers.router)
 app.include_router(routing.router)
 app.include_router(order_changes.router)
 app.include_router(operation_confirmations.router)
+app.include_router(operation_stats.router)
+app.include_router(capacity.router)
+app.include_router(scheduling.router)
+app.include_router(oee.router)
+
+@app.on_event("startup")
+async def start_background_services():
+    # Events published from threadpool endpoints are delivered on this loop
+    event_bus.start(asyncio.get_running_loop())
+    # Reconnecting clients whose missed events were evicted get the open orders instead
+    websocket_manager.snapshot_provider = order_snapshot
+    websocket_manager.board_snapshot_provider = board_rows
+    confirmation_journal.start(operation_confirmations.process_journal_entries)
+
+@app.on_event("shutdown")
+def stop_background_services():
+    confirmation_journal.stop()
+    event_bus.stop()
 
 # WebSocket endpoint
 @app.websocket("/ws/{client_id}")
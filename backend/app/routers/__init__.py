@@ -2,12 +2,16 @@ __all__ = [
     "analytics", 
     "auth", 
     "bom", 
+    "capacity", 
     "goods_movements", 
     "materials", 
     "mrp", 
+    "oee", 
+    "operation_stats", 
     "production_orders", 
     "routing", 
+    "scheduling", 
     "work_centers"
 ]
 
-from . import analytics, auth, bom, goods_movements, materials, mrp, production_orders, routing, work_centers
+from . import analytics, auth, bom, capacity, goods_movements, materials, mrp, oee, operation_stats, production_orders, routing, scheduling, work_centers
@@ -1,12 +1,472 @@
-from fastapi import APIRouter, Depends
+"""
+Endpoints:
+- GET /api/analytics/metrics - Order counts per status/priority/plant, throughput, on-time rate, lead time
+- GET /api/analytics/variances - Confirmation time variances by work center, operation and material
+- GET /api/analytics/trends - Daily/weekly/monthly production and goods movement totals from the KPI rollups
+- POST /api/analytics/rollups/rebuild - Rebuild the daily KPI rollups from posting history
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Date, Float, func, select, and_, case, extract, type_coerce
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
 from database import models, get_db
+from utils.kpi_cache import kpi_cache
+from utils.kpi_rollups import MEASURES, lock_totals, record_confirmations, record_goods_movements
+from datetime import date, datetime, timedelta
+import numpy as np
+import time
 
 router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
 
+VARIANCE_GROUP_COLUMNS = {
+    "work_center": models.OperationConfirmation.work_center_id,
+    "operation": models.OperationConfirmation.operation_id,
+    "material": models.ProductionOrder.materialId,
+}
+
+TREND_GROUP_COLUMNS = {
+    "plant": models.DailyKpiRollup.plant,
+    "work_center": models.DailyKpiRollup.work_center_id,
+    "material": models.DailyKpiRollup.material_id,
+}
+
+TREND_INTERVALS = {
+    "day": lambda d: d,
+    "week": lambda d: d - timedelta(days=d.weekday()),
+    "month": lambda d: d.replace(day=1),
+}
+
+ACTIVE_STATUSES = {"CREATED", "RELEASED", "IN_PROGRESS"}
+
+def order_kpi_groups(db: Session) -> list:
+    """One grouped pass over production orders: counts and completion measures per (plant, status,
+    priority, completion day), independent of the throughput window"""
+    po = models.ProductionOrder
+    completed = po.status == models.OrderStatus.COMPLETED
+    completed_day = case(
+        (and_(completed, po.actualEndDate.isnot(None)), type_coerce(func.date(po.actualEndDate), Date))
+    )
+    due_known = and_(completed, po.actualEndDate.isnot(None), po.dueDate.isnot(None))
+    started = func.coalesce(po.actualStartDate, po.plannedStartDate)
+    lead_known = and_(completed, po.actualEndDate.isnot(None), started.isnot(None))
+
+    rows = db.execute(select(
+        po.plant, po.status, po.priority, completed_day,
+        func.count(),
+        func.coalesce(func.sum(po.quantity), 0),
+        func.count(case((and_(due_known, po.actualEndDate <= po.dueDate), 1))),
+        func.count(case((due_known, 1))),
+        func.sum(case((lead_known, extract("epoch", po.actualEndDate) - extract("epoch", started)))),
+        func.count(case((lead_known, 1)))
+    ).group_by(po.plant, po.status, po.priority, completed_day)).all()
+    return [
+        {
+            "plant": plant,
+            "status": status.value if status else None,
+            "priority": priority.value if priority else None,
+            "completed_day": day,
+            "orders": count,
+            "quantity": float(quantity or 0),
+            "on_time": on_time,
+            "with_due_date": with_due,
+            "lead_seconds": float(lead_seconds or 0),
+            "with_lead_time": with_lead
+        } for plant, status, priority, day, count, quantity, on_time, with_due, lead_seconds, with_lead in rows
+    ]
+
+def summarize_kpis(groups: list, days: int) -> dict:
+    def totals(key):
+        result = {}
+        for group in groups:
+            result[group[key] or "UNKNOWN"] = result.get(group[key] or "UNKNOWN", 0) + group["orders"]
+        return dict(sorted(result.items()))
+
+    total = lambda field: sum(group[field] for group in groups)
+    with_due, with_lead = total("with_due_date"), total("with_lead_time")
+    first_day = date.today() - timedelta(days=days - 1)
+    window = [group for group in groups if group["completed_day"] and group["completed_day"] >= first_day]
+    window_quantity = sum(group["quantity"] for group in window)
+    by_status = totals("status")
+    return {
+        "completed_orders": by_status.get("COMPLETED", 0),
+        "active_orders": sum(count for status, count in by_status.items() if status in ACTIVE_STATUSES),
+        "total_orders": total("orders"),
+        "by_status": by_status,
+        "by_priority": totals("priority"),
+        "by_plant": totals("plant"),
+        "throughput": {
+            "window_days": days,
+            "completed_orders": sum(group["orders"] for group in window),
+            "completed_quantity": window_quantity,
+            "quantity_per_day": round(window_quantity / days, 3)
+        },
+        "on_time_rate_percent": round(total("on_time") / with_due * 100, 1) if with_due else None,
+        "average_lead_time_days": round(total("lead_seconds") / with_lead / 86400, 2) if with_lead else None
+    }
+
 @router.get("/metrics")
-def metrics(db: Session = Depends(get_db)):
-    completed = db.query(models.ProductionOrder).filter(models.ProductionOrder.status == "COMPLETED").count()
-    active = db.query(models.ProductionOrder).filter(models.ProductionOrder.status.in_(["CREATED","RELEASED","IN_PROGRESS"])).count()
-    total_orders = db.query(models.ProductionOrder).count()
-    return {"completed_orders": completed, "active_orders": active, "total_orders": total_orders}
+def metrics(plant: str = None, days: int = 30, db: Session = Depends(get_db)):
+    """Dashboard KPIs from one grouped aggregation, cached (see utils/kpi_cache.py).
+
+    Throughput counts orders completed in the last `days` days (today included); on-time
+    rate and average lead time (actual end - actual or planned start) cover all completed
+    orders. Completed orders are grouped by completion day and the groups are cached
+    once, so `days` and `plant` only select from them and never run another query.
+    """
+    if days < 1 or days > 3660:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 3660")
+
+    def compute():
+        started = time.perf_counter()
+        groups = order_kpi_groups(db)
+        return {"groups": groups, "as_of": datetime.now().isoformat(), "compute_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    cached = kpi_cache.get_or_compute("order_kpis", compute)
+    groups = [g for g in cached["groups"] if g["plant"] == plant] if plant else cached["groups"]
+    return {
+        **summarize_kpis(groups, days),
+        "plant": plant,
+        "as_of": cached["as_of"],
+        "compute_ms": cached["compute_ms"]
+    }
+
+def _variance_percent(variance, planned):
+    """Variance in percent of planned, 0 where nothing was planned (same rule as CO11N)"""
+    planned = np.asarray(planned, dtype=np.float64)
+    return np.where(planned > 0, np.asarray(variance, dtype=np.float64) / np.where(planned > 0, planned, 1.0) * 100, 0.0)
+
+def grouped_percentiles(group_index: np.ndarray, values: np.ndarray, n_groups: int, percentiles: list) -> np.ndarray:
+    """Linear-interpolated percentiles of `values` per group, shape (n_groups, len(percentiles))"""
+    order = np.lexsort((values, group_index))
+    sorted_values = values[order]
+    counts = np.bincount(group_index, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    positions = starts[:, None] + (counts[:, None] - 1) * (np.asarray(percentiles, dtype=np.float64)[None, :] / 100.0)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    fraction = positions - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+def _variance_groups_sql(db: Session, with_filters, group_columns: list, times: list, percentiles: list) -> tuple:
+    """(group keys, [count + 6 time sums] per group, percentiles per group or None) from one GROUP BY (PostgreSQL)"""
+    coalesced = [func.coalesce(t, 0.0) for t in times]
+    actual, planned = sum(coalesced[:3]), sum(coalesced[3:])
+    measures = [func.count(), *(func.sum(t) for t in times)]
+    if percentiles:
+        row_variance_percent = case((planned > 0, (actual - planned) / planned * 100), else_=0.0)
+        measures.append(type_coerce(
+            func.percentile_cont(postgresql.array([p / 100 for p in percentiles])).within_group(row_variance_percent),
+            postgresql.ARRAY(Float)
+        ))
+
+    stmt = with_filters(select(*group_columns, *measures))
+    if group_columns:
+        stmt = stmt.group_by(*group_columns).order_by(*group_columns)
+    n_keys = len(group_columns)
+    rows = [r for r in db.execute(stmt).all() if r[n_keys]]  # drop the empty row of an ungrouped empty result
+
+    group_keys = [tuple(r[:n_keys]) for r in rows]
+    data = np.array([[float(v or 0.0) for v in r[n_keys:n_keys + 7]] for r in rows], dtype=np.float64).reshape(-1, 7)
+    distribution = None
+    if percentiles:
+        distribution = np.array([r[n_keys + 7] for r in rows], dtype=np.float64).reshape(-1, len(percentiles))
+    return group_keys, data, distribution
+
+def _factorize(column: np.ndarray) -> tuple:
+    """(distinct values, code per row) of an object column; None sorts first"""
+    missing = np.equal(column, None)
+    values, inverse = np.unique(column[~missing], return_inverse=True)
+    codes = np.zeros(len(column), dtype=np.int64)
+    codes[~missing] = inverse + 1
+    return [None] + values.tolist(), codes
+
+def _variance_groups_numpy(db: Session, with_filters, group_columns: list, times: list, percentiles: list) -> tuple:
+    """Same result as _variance_groups_sql from one column extract, grouped and aggregated with NumPy"""
+    rows = db.execute(with_filters(select(*group_columns, *times))).all()
+    n_keys = len(group_columns)
+    if not rows:
+        return [], np.zeros((0, 7)), (np.zeros((0, len(percentiles))) if percentiles else None)
+
+    extract = np.array(rows, dtype=object).reshape(len(rows), n_keys + len(times))
+    values = np.nan_to_num(extract[:, n_keys:].astype(np.float64))  # NULL times count as 0, as in SUM
+
+    if n_keys:
+        factorized = [_factorize(extract[:, k]) for k in range(n_keys)]
+        dims = [len(distinct) for distinct, _ in factorized]
+        combined = np.ravel_multi_index([codes for _, codes in factorized], dims)
+        group_ids, group_index = np.unique(combined, return_inverse=True)
+        group_keys = list(zip(*(
+            [factorized[k][0][c] for c in codes.tolist()]
+            for k, codes in enumerate(np.unravel_index(group_ids, dims))
+        )))
+    else:
+        group_index = np.zeros(len(rows), dtype=np.int64)
+        group_keys = [()]
+    n_groups = len(group_keys)
+
+    data = np.column_stack([np.bincount(group_index, minlength=n_groups)] + [
+        np.bincount(group_index, weights=values[:, j], minlength=n_groups) for j in range(len(times))
+    ]).astype(np.float64)
+
+    distribution = None
+    if percentiles:
+        row_actual, row_planned = values[:, :3].sum(axis=1), values[:, 3:].sum(axis=1)
+        row_variance_percent = _variance_percent(row_actual - row_planned, row_planned)
+        distribution = grouped_percentiles(group_index, row_variance_percent, n_groups, percentiles)
+    return group_keys, data, distribution
+
+@router.get("/variances")
+def confirmation_variances(
+    date_from: datetime = None,
+    date_to: datetime = None,
+    group_by: str = "work_center,operation,material",
+    plant: str = None,
+    work_center_id: str = None,
+    percentiles: str = "50,90,95,99",
+    db: Session = Depends(get_db)
+):
+    """Setup/machine/labor variances of all confirmations in a date range, grouped.
+
+    Group totals and the percentile distribution of the per-confirmation total
+    variance-% come from one statement: on PostgreSQL a GROUP BY with percentile_cont,
+    elsewhere a column extract grouped and aggregated with NumPy. Planned times are
+    the routing operation's standard values, as in CO11N.
+    """
+
+    keys = [k.strip() for k in group_by.split(",") if k.strip()]
+    invalid = [k for k in keys if k not in VARIANCE_GROUP_COLUMNS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid group_by {invalid}; use {list(VARIANCE_GROUP_COLUMNS)}"
+        )
+    try:
+        percentile_list = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be a comma-separated list of numbers")
+    if any(p < 0 or p > 100 for p in percentile_list):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    conf = models.OperationConfirmation
+    op = models.Operation
+    order = models.ProductionOrder
+    group_columns = [VARIANCE_GROUP_COLUMNS[k] for k in keys]
+    times = [
+        conf.setup_time_actual, conf.machine_time_actual, conf.labor_time_actual,
+        op.setup_time, op.machine_time, op.labor_time
+    ]
+
+    def with_filters(stmt):
+        stmt = stmt.select_from(conf).join(
+            order, order.orderId == conf.order_id
+        ).join(
+            op, and_(op.routing_id == order.routingId, op.operation_id == conf.operation_id)
+        ).where(conf.status == "CONFIRMED")
+        if date_from:
+            stmt = stmt.where(conf.end_time >= date_from)
+        if date_to:
+            stmt = stmt.where(conf.end_time < date_to)
+        if plant:
+            stmt = stmt.where(order.plant == plant)
+        if work_center_id:
+            stmt = stmt.where(conf.work_center_id == work_center_id)
+        return stmt
+
+    if db.get_bind().dialect.name == "postgresql":
+        group_keys, data, distribution = _variance_groups_sql(db, with_filters, group_columns, times, percentile_list)
+    else:
+        group_keys, data, distribution = _variance_groups_numpy(db, with_filters, group_columns, times, percentile_list)
+    counts = data[:, 0]
+    actual = data[:, 1:4]
+    planned = data[:, 4:7]
+    variance = actual - planned
+    variance_percent = _variance_percent(variance, planned)
+    total_variance = variance.sum(axis=1)
+    total_variance_percent = _variance_percent(total_variance, planned.sum(axis=1))
+
+    groups = []
+    for i, key in enumerate(group_keys):
+        group = {k: v for k, v in zip(keys, key)}
+        group.update({
+            "confirmations": int(counts[i]),
+            "setup_time_actual": actual[i, 0],
+            "setup_time_planned": planned[i, 0],
+            "setup_variance": variance[i, 0],
+            "setup_variance_percent": variance_percent[i, 0],
+            "machine_time_actual": actual[i, 1],
+            "machine_time_planned": planned[i, 1],
+            "machine_variance": variance[i, 1],
+            "machine_variance_percent": variance_percent[i, 1],
+            "labor_time_actual": actual[i, 2],
+            "labor_time_planned": planned[i, 2],
+            "labor_variance": variance[i, 2],
+            "labor_variance_percent": variance_percent[i, 2],
+            "total_variance": total_variance[i],
+            "total_variance_percent": total_variance_percent[i],
+        })
+        if distribution is not None:
+            group["total_variance_percent_distribution"] = {
+                f"p{p:g}": distribution[i, j] for j, p in enumerate(percentile_list)
+            }
+        groups.append({k: (float(v) if isinstance(v, np.floating) else v) for k, v in group.items()})
+
+    total_actual = actual.sum()
+    total_planned = planned.sum()
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "group_by": keys,
+        "summary": {
+            "confirmations": int(counts.sum()),
+            "groups": len(groups),
+            "total_time_actual": float(total_actual),
+            "total_time_planned": float(total_planned),
+            "total_variance": float(total_actual - total_planned),
+            "total_variance_percent": float(_variance_percent(total_actual - total_planned, total_planned))
+        },
+        "groups": groups
+    }
+
+def _rollup_range(date_from: date, date_to: date, default_days: int) -> tuple:
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=default_days - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if (date_to - date_from).days >= 3660:
+        raise HTTPException(status_code=400, detail="Date range is limited to 10 years")
+    return date_from, date_to
+
+def _trend_values(values) -> dict:
+    return {m: int(round(v)) if m in ("confirmations", "goods_movements") else v for m, v in zip(MEASURES, values)}
+
+@router.get("/trends")
+def kpi_trends(
+    date_from: date = None,
+    date_to: date = None,
+    interval: str = "day",
+    group_by: str = "",
+    plant: str = None,
+    work_center_id: str = None,
+    material_id: str = None,
+    db: Session = Depends(get_db)
+):
+    """Confirmation and goods movement totals per day/week/month, optionally one series per group.
+
+    Reads only the daily KPI rollups (utils/kpi_rollups.py). Dates are inclusive and
+    default to the last 90 days; every series has a point for every period.
+    """
+
+    if interval not in TREND_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {list(TREND_INTERVALS)}")
+    keys = [k.strip() for k in group_by.split(",") if k.strip()]
+    invalid = [k for k in keys if k not in TREND_GROUP_COLUMNS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid group_by {invalid}; use {list(TREND_GROUP_COLUMNS)}"
+        )
+    date_from, date_to = _rollup_range(date_from, date_to, 90)
+
+    rollup = models.DailyKpiRollup
+    group_columns = [TREND_GROUP_COLUMNS[k] for k in keys]
+    stmt = select(*group_columns, rollup.day, *(func.sum(getattr(rollup, m)) for m in MEASURES)).where(
+        rollup.day >= date_from, rollup.day <= date_to
+    )
+    if plant:
+        stmt = stmt.where(rollup.plant == plant)
+    if work_center_id:
+        stmt = stmt.where(rollup.work_center_id == work_center_id)
+    if material_id:
+        stmt = stmt.where(rollup.material_id == material_id)
+    rows = db.execute(stmt.group_by(*group_columns, rollup.day)).all()
+
+    period_of = TREND_INTERVALS[interval]
+    periods = []
+    day = date_from
+    while day <= date_to:
+        if not periods or periods[-1] != period_of(day):
+            periods.append(period_of(day))
+        day += timedelta(days=1)
+    period_index = {period: i for i, period in enumerate(periods)}
+
+    n_keys = len(keys)
+    series = {}
+    for row in rows:
+        totals = series.setdefault(tuple(row[:n_keys]), np.zeros((len(periods), len(MEASURES))))
+        totals[period_index[period_of(row[n_keys])]] += [float(v or 0.0) for v in row[n_keys + 1:]]
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "interval": interval,
+        "group_by": keys,
+        "series": [
+            {
+                **{k: v for k, v in zip(keys, key)},
+                "totals": _trend_values(totals.sum(axis=0).tolist()),
+                "points": [
+                    {"period": period, **_trend_values(values)}
+                    for period, values in zip(periods, totals.tolist())
+                ]
+            }
+            for key, totals in sorted(series.items())
+        ]
+    }
+
+@router.post("/rollups/rebuild")
+def rebuild_kpi_rollups(date_from: date = None, date_to: date = None, db: Session = Depends(get_db)):
+    """Rebuild the daily KPI rollups of a date range (default: all history) from the postings.
+
+    Confirmations and goods movements are streamed in one pass each and folded in with
+    the same upserts the posting transactions use; the range is replaced in one transaction,
+    with postings held off until it commits.
+    """
+
+    rollup = models.DailyKpiRollup
+    conf = models.OperationConfirmation
+    gm = models.GoodsMovement
+    if date_from or date_to:
+        date_from, date_to = _rollup_range(date_from, date_to, 1)
+
+    existing = db.query(rollup)
+    confirmations = db.query(
+        conf.order_id, conf.work_center_id, conf.yield_qty, conf.scrap_qty, conf.end_time
+    ).filter(conf.status == "CONFIRMED")
+    movements = db.query(gm.movement_type, gm.material_id, gm.qty, gm.plant, gm.confirmation_id, gm.timestamp)
+    if date_from:
+        start = datetime.combine(date_from, datetime.min.time())
+        end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+        existing = existing.filter(rollup.day >= date_from, rollup.day <= date_to)
+        confirmations = confirmations.filter(conf.end_time >= start, conf.end_time < end)
+        movements = movements.filter(gm.timestamp >= start, gm.timestamp < end)
+    lock_totals(db, rollup.__table__)
+    existing.delete(synchronize_session=False)  # before reading history: locks the table on SQLite
+
+    counts = {}
+    for name, query, record in (
+        ("confirmations", confirmations, record_confirmations),
+        ("goods_movements", movements, record_goods_movements)
+    ):
+        counts[name] = 0
+        chunk = []
+        for row in query.yield_per(5000):
+            chunk.append(row)
+            if len(chunk) >= 5000:
+                record(db, chunk)
+                counts[name] += len(chunk)
+                chunk = []
+        record(db, chunk)
+        counts[name] += len(chunk)
+
+    db.commit()
+
+    return {
+        "message": "KPI rollups rebuilt",
+        "date_from": date_from,
+        "date_to": date_to,
+        **counts,
+        "rollup_rows": db.query(rollup).count()
+    }
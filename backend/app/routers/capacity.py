@@ -0,0 +1,274 @@
+"""
+CAPACITY REQUIREMENTS PLANNING (CM01-style load analysis)
+
+Computes the load of open production orders and MRP planned orders per work center
+and day from routing standard times and compares it with work center capacity.
+
+- Load of an operation (hours) = (setup time + quantity x machine time) / 60
+- An order's operations split its window (plannedStartDate..plannedEndDate, else
+  dueDate - 7 days..dueDate) in sequence, proportionally to their load; each
+  operation's load is spread evenly over its days
+- Daily capacity = WorkCenter.capacity (available hours per day) x efficiency / 100;
+  every day is a working day
+- Operations of in-progress orders with a posted FINAL confirmation carry no load
+
+All operations are scattered into a (work center x day) matrix in one pass with
+NumPy: a difference array filled with np.add.at, then a cumulative sum over days.
+
+API Endpoints:
+- GET /api/capacity/load - Load vs. capacity per work center and day, with overloads
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import models, get_db
+from utils.routing_cache import active_routing_ids, routing_cache
+from datetime import datetime, timedelta
+import numpy as np
+import time
+
+router = APIRouter(prefix="/api/capacity", tags=["Capacity Planning"])
+
+OPEN_ORDER_STATUSES = [models.OrderStatus.CREATED, models.OrderStatus.RELEASED, models.OrderStatus.IN_PROGRESS]
+DEFAULT_LEAD_TIME_DAYS = 7
+
+def order_window(start, end, due):
+    """(start, end) of an order's production window, or None without any date"""
+    end = end or due
+    if end is None:
+        return None
+    start = start or (end - timedelta(days=DEFAULT_LEAD_TIME_DAYS))
+    return (start, end) if start <= end else (end, end)
+
+def finished_operations(db: Session, order_ids) -> set:
+    """(order_id, operation_id) pairs with a posted FINAL confirmation; these need no more capacity"""
+    if not order_ids:
+        return set()
+    return set(db.query(
+        models.OperationConfirmation.order_id, models.OperationConfirmation.operation_id
+    ).filter(
+        models.OperationConfirmation.order_id.in_(order_ids),
+        models.OperationConfirmation.confirmation_type == "FINAL",
+        models.OperationConfirmation.status == "CONFIRMED"
+    ).distinct().all())
+
+def load_demands(db: Session, plant: str = None, include_planned: bool = True):
+    """Open production orders and planned orders as (source, id, material, routing_id, qty, start, end)"""
+    # Plain column tuples: a full plant is loaded without building ORM objects
+    po = models.ProductionOrder
+    query = db.query(
+        po.orderId, po.materialId, po.routingId, po.quantity, po.status,
+        po.plannedStartDate, po.plannedEndDate, po.dueDate
+    ).filter(po.status.in_(OPEN_ORDER_STATUSES))
+    if plant:
+        query = query.filter(po.plant == plant)
+    orders = query.all()
+
+    planned = []
+    if include_planned:
+        pl = models.PlannedOrder
+        query = db.query(
+            pl.planned_order_id, pl.material_id, pl.quantity, pl.start_date, pl.due_date
+        ).filter(pl.status == "PLANNED")
+        if plant:
+            query = query.filter(pl.plant == plant)
+        planned = query.all()
+
+    routing_by_material = active_routing_ids(
+        db, {o.materialId for o in orders if not o.routingId} | {p.material_id for p in planned}
+    )
+
+    demands = []
+    for o in orders:
+        window = order_window(o.plannedStartDate, o.plannedEndDate, o.dueDate)
+        if window:
+            demands.append((
+                "PRODUCTION_ORDER", o.orderId, o.materialId,
+                o.routingId or routing_by_material.get(o.materialId), float(o.quantity or 0), *window
+            ))
+    for p in planned:
+        window = order_window(p.start_date, p.due_date, p.due_date)
+        if window:
+            demands.append((
+                "PLANNED_ORDER", p.planned_order_id, p.material_id,
+                routing_by_material.get(p.material_id), float(p.quantity or 0), *window
+            ))
+
+    in_progress = [o.orderId for o in orders if o.status == models.OrderStatus.IN_PROGRESS]
+    return demands, finished_operations(db, in_progress)
+
+def compute_load_matrix(order_index, wc_index, load_hours, start_day, end_day, n_work_centers: int, n_days: int):
+    """Scatter operation loads into a (work center x day) matrix.
+
+    Rows are operations grouped by order in sequence. Each order's window
+    [start_day, end_day] (day indices relative to the horizon start) is split among
+    its operations proportionally to load. Returns (load matrix, past-due load,
+    load beyond the horizon), the latter two per work center.
+    """
+    n_orders = len(start_day)
+    order_totals = np.bincount(order_index, weights=load_hours, minlength=n_orders)
+    order_offsets = np.concatenate(([0.0], np.cumsum(order_totals)[:-1]))
+    cumulative = np.cumsum(load_hours)
+
+    totals = order_totals[order_index]
+    safe_totals = np.where(totals > 0, totals, 1.0)
+    fraction_start = (cumulative - load_hours - order_offsets[order_index]) / safe_totals
+    fraction_end = (cumulative - order_offsets[order_index]) / safe_totals
+
+    window = (end_day - start_day + 1)[order_index]
+    first = start_day[order_index] + np.floor(fraction_start * window).astype(np.int64)
+    last = start_day[order_index] + np.ceil(fraction_end * window).astype(np.int64) - 1
+    last = np.maximum(last, first)
+    rate = load_hours / (last - first + 1)
+
+    # Parts of an operation before / after the horizon
+    span = last - first + 1
+    past_days = np.clip(-first, 0, span)
+    later_days = np.clip(last - (n_days - 1), 0, span)
+    past_due = np.zeros(n_work_centers)
+    beyond = np.zeros(n_work_centers)
+    np.add.at(past_due, wc_index, rate * past_days)
+    np.add.at(beyond, wc_index, rate * later_days)
+
+    clipped_first = np.maximum(first, 0)
+    clipped_last = np.minimum(last, n_days - 1)
+    inside = clipped_first <= clipped_last
+
+    difference = np.zeros((n_work_centers, n_days + 1))
+    np.add.at(difference, (wc_index[inside], clipped_first[inside]), rate[inside])
+    np.add.at(difference, (wc_index[inside], clipped_last[inside] + 1), -rate[inside])
+    return np.cumsum(difference, axis=1)[:, :n_days], past_due, beyond
+
+@router.get("/load")
+def capacity_load(
+    plant: str = None,
+    date_from: datetime = None,
+    days: int = 28,
+    include_planned: bool = True,
+    overload_threshold: float = 100.0,
+    include_daily: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Capacity load per work center and day over a horizon, with overload detection.
+
+    A day is overloaded when its load exceeds overload_threshold percent of the
+    efficiency-adjusted capacity.
+    """
+
+    if days < 1 or days > 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+
+    started = time.perf_counter()
+    horizon_start = (date_from or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = [horizon_start + timedelta(days=i) for i in range(days)]
+
+    wc_query = db.query(models.WorkCenter)
+    if plant:
+        wc_query = wc_query.filter(models.WorkCenter.plant == plant)
+    work_centers = wc_query.order_by(models.WorkCenter.workCenterId).all()
+    wc_lookup = {wc.workCenterId: i for i, wc in enumerate(work_centers)}
+    capacity = np.array([
+        float(wc.capacity or 0) * float(wc.efficiency if wc.efficiency is not None else 100.0) / 100.0
+        for wc in work_centers
+    ])
+
+    demands, finished = load_demands(db, plant, include_planned)
+    routings = routing_cache.get_many(db, {d[3] for d in demands})
+
+    # Flatten orders x operations into column arrays
+    order_index, wc_index, setup, machine, start_day, end_day, quantity = [], [], [], [], [], [], []
+    unrouted = 0
+    for source, demand_id, material_id, routing_id, qty, start, end in demands:
+        routing = routings.get(routing_id)
+        if routing is None:
+            unrouted += 1
+            continue
+        # Routed but with every operation finished or outside the plant: no load here
+        operations = [
+            op for op in routing.operations
+            if op.work_center_id in wc_lookup and (demand_id, op.operation_id) not in finished
+        ]
+        if not operations:
+            continue
+        index = len(start_day)
+        start_day.append((start.date() - horizon_start.date()).days)
+        end_day.append((end.date() - horizon_start.date()).days)
+        quantity.append(qty)
+        for op in operations:
+            order_index.append(index)
+            wc_index.append(wc_lookup[op.work_center_id])
+            setup.append(op.setup_time or 0.0)
+            machine.append(op.machine_time or 0.0)
+
+    n_wc = len(work_centers)
+    if order_index:
+        order_index = np.array(order_index, dtype=np.int64)
+        load_hours = (np.array(setup) + np.array(quantity)[order_index] * np.array(machine)) / 60.0
+        load, past_due, beyond = compute_load_matrix(
+            order_index, np.array(wc_index, dtype=np.int64), load_hours,
+            np.array(start_day, dtype=np.int64), np.array(end_day, dtype=np.int64), n_wc, days
+        )
+    else:
+        load, past_due, beyond = np.zeros((n_wc, days)), np.zeros(n_wc), np.zeros(n_wc)
+
+    daily_capacity = np.repeat(capacity[:, None], days, axis=1)
+    utilization = np.where(daily_capacity > 0, load / np.where(daily_capacity > 0, daily_capacity, 1.0) * 100, 0.0)
+    overloaded = (load > daily_capacity * overload_threshold / 100.0 + 1e-9)
+
+    overloads = [
+        {
+            "work_center_id": work_centers[i].workCenterId,
+            "date": dates[j].date().isoformat(),
+            "load_hours": round(float(load[i, j]), 3),
+            "capacity_hours": round(float(daily_capacity[i, j]), 3),
+            "excess_hours": round(float(load[i, j] - daily_capacity[i, j]), 3),
+            "utilization_percent": round(float(utilization[i, j]), 1) if daily_capacity[i, j] > 0 else None
+        } for i, j in np.argwhere(overloaded)
+    ]
+
+    results = []
+    for i, wc in enumerate(work_centers):
+        total_load = float(load[i].sum())
+        total_capacity = float(daily_capacity[i].sum())
+        entry = {
+            "work_center_id": wc.workCenterId,
+            "name": wc.name,
+            "capacity_per_day": round(float(capacity[i]), 3),
+            "total_load_hours": round(total_load, 3),
+            "total_capacity_hours": round(total_capacity, 3),
+            "utilization_percent": round(total_load / total_capacity * 100, 1) if total_capacity > 0 else None,
+            "peak_utilization_percent": round(float(utilization[i].max()), 1) if days else 0.0,
+            "past_due_load_hours": round(float(past_due[i]), 3),
+            "load_beyond_horizon_hours": round(float(beyond[i]), 3),
+            "overloaded_days": int(overloaded[i].sum())
+        }
+        if include_daily:
+            entry["daily"] = [
+                {
+                    "date": dates[j].date().isoformat(),
+                    "load_hours": round(float(load[i, j]), 3),
+                    "capacity_hours": round(float(daily_capacity[i, j]), 3),
+                    "utilization_percent": round(float(utilization[i, j]), 1)
+                } for j in range(days)
+            ]
+        results.append(entry)
+
+    return {
+        "horizon": {
+            "date_from": dates[0].date().isoformat(),
+            "date_to": dates[-1].date().isoformat(),
+            "days": days
+        },
+        "summary": {
+            "orders": sum(1 for d in demands if d[0] == "PRODUCTION_ORDER"),
+            "planned_orders": sum(1 for d in demands if d[0] == "PLANNED_ORDER"),
+            "orders_without_routing": unrouted,
+            "operations": len(wc_index),
+            "work_centers": n_wc,
+            "overloaded_work_centers": int(overloaded.any(axis=1).sum()),
+            "overloaded_days": len(overloads),
+            "compute_ms": round((time.perf_counter() - started) * 1000, 1)
+        },
+        "work_centers": results,
+        "overloads": overloads
+    }
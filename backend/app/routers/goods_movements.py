@@ -1,14 +1,35 @@
 import uuid
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from database import models, schemas, get_db
-import utils.websocket_manager as websocket_manager
+from utils.concurrency import conflict
+from utils.event_bus import publish_after_commit
 
 router = APIRouter(prefix="/api/goods-movements", tags=["Goods Movements"])
 
+def commit_movement(db: Session, order_id: str, stock_keys):
+    """Commit a goods movement; 409 with the current order and stock when a versioned row changed concurrently"""
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
+        stocks = [
+            db.query(models.Stock).filter(models.Stock.material_id == material_id, models.Stock.plant == plant).first()
+            for material_id, plant in stock_keys
+        ]
+        raise conflict(
+            f"Order {order_id} or its stock was changed concurrently, retry the goods movement",
+            {
+                "order": schemas.ProductionOrderResponse.model_validate(po).model_dump(mode="json") if po else None,
+                "stock": [schemas.StockResponse.model_validate(s).model_dump(mode="json") for s in stocks if s]
+            }
+        )
+
 @router.post("/issue")
 def goods_issue(payload: schemas.GoodsIssueCreate, db: Session = Depends(get_db)):
-    po = db.query(models.ProductionOrder).filter(models.ProductionOrder.order_id == payload.order_id).first()
+    po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == payload.order_id).first()
     if not po:
         raise HTTPException(status_code=404, detail="order not found")
     for mv in payload.movements:
@@ -18,14 +39,13 @@ def goods_issue(payload: schemas.GoodsIssueCreate, db: Session = Depends(get_db)
         stock.on_hand -= mv.qty
         gm = models.GoodsMovement(id=str(uuid.uuid4()), movement_type="ISSUE", material_id=mv.material_id, qty=mv.qty, plant=mv.plant, storage_loc=mv.storage_loc, order_id=payload.order_id)
         db.add(gm)
-    db.commit()
-    import asyncio
-    asyncio.create_task(websocket_manager.manager.broadcast({"type": "goods_issue", "order_id": payload.order_id}))
+    publish_after_commit(db, {"type": "goods_issue", "order_id": payload.order_id}, topics={"plant": [mv.plant for mv in payload.movements]})
+    commit_movement(db, payload.order_id, [(mv.material_id, mv.plant) for mv in payload.movements])
     return {"message": "issued"}
 
 @router.post("/receipt")
 def goods_receipt(payload: schemas.GoodsReceiptCreate, db: Session = Depends(get_db)):
-    po = db.query(models.ProductionOrder).filter(models.ProductionOrder.order_id == payload.order_id).first()
+    po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == payload.order_id).first()
     if not po:
         raise HTTPException(status_code=404, detail="order not found")
     stock = db.query(models.Stock).filter(models.Stock.material_id == payload.material_id, models.Stock.plant == payload.plant).first()
@@ -39,7 +59,6 @@ def goods_receipt(payload: schemas.GoodsReceiptCreate, db: Session = Depends(get
     # if qty >= order qty, mark completed
     if payload.qty >= po.quantity:
         po.status = models.OrderStatus.COMPLETED
-    db.commit()
-    import asyncio
-    asyncio.create_task(websocket_manager.manager.broadcast({"type": "goods_receipt", "order_id": payload.order_id, "material_id": payload.material_id, "qty": payload.qty}))
+    publish_after_commit(db, {"type": "goods_receipt", "order_id": payload.order_id, "material_id": payload.material_id, "qty": payload.qty, "plant": payload.plant})
+    commit_movement(db, payload.order_id, [(payload.material_id, payload.plant)])
     return {"message": "received", "order_status": po.status.value}
@@ -22,6 +22,7 @@ def create_material(payload: schemas.MaterialCreate, db: Session = Depends(get_d
         "unitPrice": payload.unitPrice,
         "plant": payload.plant,
         "storageLocation": payload.storageLocation,
+        "plannedDeliveryTime": payload.plannedDeliveryTime,
         "status": models.StockStatus.AVAILABLE  # Default status
     }
     
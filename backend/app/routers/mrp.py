@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import or_
 from database import models, schemas, get_db
 from datetime import datetime, timedelta
 from typing import List
+from utils.concurrency import conflict
+from utils.lead_times import LeadTimes
 import uuid
 
 router = APIRouter(prefix="/api/mrp", tags=["MRP"])
@@ -21,12 +24,32 @@ def explode_bom(db: Session, parent_material_id: str, qty: float, accumulator: d
             explode_bom(db, it.component_material_id, need, accumulator)
     return accumulator
 
-def create_planned_order(db: Session, material_id: str, quantity: float, due_date: datetime, plant: str, mrp_run_id: str):
+def add_requirement(requirements: dict, material_id: str, qty: float, need_date: datetime):
+    """Accumulate quantity and earliest need date of a material"""
+    entry = requirements.setdefault(material_id, [0.0, need_date])
+    entry[0] += qty
+    entry[1] = min(entry[1], need_date)
+
+def explode_bom_dated(db: Session, parent_material_id: str, qty: float, start_date: datetime,
+                      lead_times: LeadTimes, requirements: dict):
+    """Recursively explode BOM; components are needed when their parent's production starts"""
+    headers = db.query(models.BOMHeader).filter(models.BOMHeader.parent_material_id == parent_material_id).all()
+    for h in headers:
+        items = db.query(models.BOMItem).filter(models.BOMItem.bom_id == h.bom_id).all()
+        for it in items:
+            need = it.quantity * qty
+            add_requirement(requirements, it.component_material_id, need, start_date)
+            component_start = start_date - timedelta(days=lead_times.lead_time(it.component_material_id, need).days)
+            explode_bom_dated(db, it.component_material_id, need, component_start, lead_times, requirements)
+    return requirements
+
+def create_planned_order(db: Session, material_id: str, quantity: float, due_date: datetime, plant: str, mrp_run_id: str,
+                         start_date: datetime = None):
     """Create a planned order for FINISHED/SEMI_FINISHED materials"""
     planned_order_id = f"PL{uuid.uuid4().hex[:8].upper()}"
     
-    # Calculate start date (simple lead time calculation - can be enhanced later)
-    start_date = due_date - timedelta(days=7)  # Default 7-day lead time
+    # Start date from lead-time scheduling (utils/lead_times.py); 7 days if the caller has none
+    start_date = start_date or due_date - timedelta(days=7)
     
     planned_order = models.PlannedOrder(
         planned_order_id=planned_order_id,
@@ -90,25 +113,28 @@ def run_mrp_enhanced(payload: schemas.MRPRunRequest, db: Session = Depends(get_d
             
         orders = orders_query.all()
         
-        # Calculate material requirements
+        # Calculate material requirements with need dates: an order's material on its due date,
+        # its components when production starts (scheduled start, else backward from the due date)
+        lead_times = LeadTimes(db)
         material_reqs = {}
         for order in orders:
-            material_reqs[order.materialId] = material_reqs.get(order.materialId, 0.0) + order.quantity
-            explode_bom(db, order.materialId, order.quantity, material_reqs)
+            add_requirement(material_reqs, order.materialId, order.quantity, order.dueDate)
+            order_start = order.plannedStartDate or (
+                order.dueDate - timedelta(days=lead_times.lead_time(order.materialId, order.quantity).days)
+            )
+            explode_bom_dated(db, order.materialId, order.quantity, order_start, lead_times, material_reqs)
         
         # Filter materials if specified
         if payload.material_filter:
             material_reqs = {k: v for k, v in material_reqs.items() if k in payload.material_filter}
         
         # Process each material requirement
-        for material_id, required_qty in material_reqs.items():
+        for material_id, (required_qty, need_date) in material_reqs.items():
             try:
                 materials_processed += 1
                 
                 # Get material master data
-                material = db.query(models.Material).filter(
-                    models.Material.materialId == material_id
-                ).first()
+                material = lead_times.material(material_id)
                 
                 if not material:
                     exceptions.append(f"Material {material_id} not found in master data")
@@ -144,10 +170,15 @@ def run_mrp_enhanced(payload: schemas.MRPRunRequest, db: Session = Depends(get_d
                         ).first()
 
                         if payload.create_planned_orders and not existing_po:
-                            due_date = horizon_end  # Simplified - use horizon end as due date
+                            start_date, due_date, lead_time, forward = lead_times.schedule(material_id, shortage, need_date)
+                            if forward:
+                                exceptions.append(
+                                    f"Planned order for {material_id} scheduled forward: needed {need_date.date()}, "
+                                    f"available {due_date.date()} ({lead_time.days} days lead time)"
+                                )
                             planned_order = create_planned_order(
                                 db, material_id, shortage, due_date,
-                                payload.plant or "1000", mrp_run_id
+                                payload.plant or "1000", mrp_run_id, start_date
                             )
                             planned_orders_created += 1
                         # If a firm order exists already, we skip creating a planned order for the FG/SFG.
@@ -156,7 +187,12 @@ def run_mrp_enhanced(payload: schemas.MRPRunRequest, db: Session = Depends(get_d
                     elif material.type == models.MaterialType.RAW:
                         # Create purchase requisition for procurement
                         if payload.create_purchase_reqs:
-                            delivery_date = horizon_end - timedelta(days=3)  # Simplified lead time
+                            _, delivery_date, lead_time, forward = lead_times.schedule(material_id, shortage, need_date)
+                            if forward:
+                                exceptions.append(
+                                    f"Purchase requisition for {material_id} cannot arrive by {need_date.date()}: "
+                                    f"earliest delivery {delivery_date.date()} ({lead_time.days} days planned delivery time)"
+                                )
                             purchase_req = create_purchase_requisition(
                                 db, material_id, shortage, delivery_date,
                                 payload.plant or "1000", mrp_run_id
@@ -219,6 +255,17 @@ def run_mrp_legacy(payload: schemas.MRPRequest, db: Session = Depends(get_db)):
             })
     return {"planning_horizon_days": payload.planning_horizon_days, "procurement_plan": procurement_plan}
 
+@router.get("/lead-times/{material_id}")
+def get_lead_time(material_id: str, quantity: float = 1.0, db: Session = Depends(get_db)):
+    """Lead time MRP schedules a proposal of this material and quantity with"""
+    if quantity <= 0:
+        raise HTTPException(status_code=400, detail="quantity must be positive")
+    lead_times = LeadTimes(db)
+    if not lead_times.material(material_id):
+        raise HTTPException(status_code=404, detail="Material not found")
+    lead_time = lead_times.lead_time(material_id, quantity)
+    return {"material_id": material_id, "quantity": quantity, **lead_time._asdict()}
+
 @router.get("/planned-orders", response_model=List[schemas.PlannedOrderResponse])
 def get_planned_orders(
     plant: str = None,
@@ -369,7 +416,19 @@ def receive_goods_from_purchase_requisition(
     )
     db.add(goods_receipt)
 
-    db.commit()
+    try:
+        db.commit()
+    except StaleDataError:
+        # The stock row (versioned) was updated concurrently
+        db.rollback()
+        stock = db.query(models.Stock).filter(
+            models.Stock.material_id == pr.material_id,
+            models.Stock.plant == pr.plant
+        ).first()
+        raise conflict(
+            f"Stock of {pr.material_id} in plant {pr.plant} was changed concurrently, retry the goods receipt",
+            schemas.StockResponse.model_validate(stock).model_dump(mode="json") if stock else {}
+        )
 
     return {
         "message": "Goods received successfully",
@@ -0,0 +1,209 @@
+"""
+OVERALL EQUIPMENT EFFECTIVENESS
+
+OEE = availability x performance x quality per work center and shift or day, from
+CO11N confirmations, routing standard times and work center capacity. Definitions,
+incremental maintenance and caching are described in utils/oee.py.
+
+API Endpoints:
+- GET /api/oee/series - OEE time series per work center, by shift or day
+- GET /api/oee/leaderboard - Work centers ranked by OEE over a date range
+- GET /api/oee/status - Engine cache statistics
+- POST /api/oee/rebuild - Rebuild the OEE shift totals from confirmation history
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from database import models, get_db
+from utils.oee import MEASURES, oee_engine, oee_factors, rebuild_oee_inputs, shift_of, shift_start_time
+from datetime import date, datetime, timedelta
+import numpy as np
+import time
+
+router = APIRouter(prefix="/api/oee", tags=["OEE"])
+
+GRANULARITIES = ("shift", "day")
+FACTORS = ("availability", "performance", "quality", "oee")
+
+def _date_range(date_from: date, date_to: date, default_days: int) -> tuple:
+    """Production days date_from..date_to (inclusive), ending at the latest with the current one"""
+    current_day = shift_of(datetime.now())[0]
+    date_to = min(date_to or current_day, current_day)
+    date_from = date_from or date_to - timedelta(days=default_days - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to (or today)")
+    if (date_to - date_from).days >= 3660:
+        raise HTTPException(status_code=400, detail="Date range is limited to 10 years")
+    return date_from, date_to
+
+def _load(db: Session, date_from: date, date_to: date, plant: str = None, work_center_id: str = None):
+    """(work centers, planned minutes [wc x day x shift], input totals [wc x day x shift x MEASURES])"""
+    query = db.query(models.WorkCenter)
+    if plant:
+        query = query.filter(models.WorkCenter.plant == plant)
+    if work_center_id:
+        query = query.filter(models.WorkCenter.workCenterId == work_center_id)
+    work_centers = query.order_by(models.WorkCenter.workCenterId).all()
+    if work_center_id and not work_centers:
+        raise HTTPException(status_code=404, detail="Work center not found")
+
+    planned = oee_engine.planned_minutes(work_centers, date_from, date_to)
+    totals = oee_engine.inputs(db, date_from, date_to, [wc.workCenterId for wc in work_centers])
+    return work_centers, planned, totals
+
+def _values(planned: np.ndarray, totals: np.ndarray) -> list:
+    """Per element of `planned`: factors in percent (None where undefined) and the input totals"""
+    factors = oee_factors(planned, totals)
+    columns = [np.round(factors[f] * 100, 1).ravel().tolist() for f in FACTORS]
+    planned_list = np.round(planned, 1).ravel().tolist()
+    totals_list = np.round(totals.reshape(-1, len(MEASURES)), 3).tolist()
+    return [
+        {
+            **{f"{f}_percent": (None if column[i] != column[i] else column[i]) for f, column in zip(FACTORS, columns)},
+            "planned_minutes": planned_list[i],
+            **{m: (int(v) if m == "confirmations" else v) for m, v in zip(MEASURES, totals_list[i])}
+        }
+        for i in range(len(planned_list))
+    ]
+
+def _columns(planned: np.ndarray, totals: np.ndarray) -> list:
+    """Per row of `planned` [work center x period]: one list per factor and input over the periods"""
+    factors = oee_factors(planned, totals)
+    columns = {
+        **{f"{f}_percent": np.round(factors[f] * 100, 1) for f in FACTORS},
+        "planned_minutes": np.round(planned, 1),
+        **{m: np.round(totals[..., k], 3) for k, m in enumerate(MEASURES)}
+    }
+    columns["confirmations"] = columns["confirmations"].astype(np.int64)
+    columns = {name: values.tolist() for name, values in columns.items()}
+    return [
+        {
+            name: [None if v != v else v for v in values[i]] if name.endswith("_percent") else values[i]
+            for name, values in columns.items()
+        }
+        for i in range(planned.shape[0])
+    ]
+
+@router.get("/series")
+def oee_series(
+    date_from: date = None,
+    date_to: date = None,
+    granularity: str = "shift",
+    plant: str = None,
+    work_center_id: str = None,
+    db: Session = Depends(get_db)
+):
+    """OEE per work center and shift (or day), with the total of the range per work center.
+
+    Dates are production days, inclusive, and default to the last 7 days; shifts
+    that have not started yet are left out. Series are columnar: `periods` lists the
+    periods once and each work center has one list per factor and input, in that order.
+    """
+
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
+    date_from, date_to = _date_range(date_from, date_to, 7)
+
+    started = time.perf_counter()
+    work_centers, planned, totals = _load(db, date_from, date_to, plant, work_center_id)
+    n_work_centers, n_days, n_shifts = planned.shape
+    current = shift_of(datetime.now())
+
+    if granularity == "day":
+        planned, totals = planned.sum(axis=2), totals.sum(axis=2)
+        periods = [{"day": (date_from + timedelta(days=d)).isoformat()} for d in range(n_days)]
+    else:
+        planned = planned.reshape(n_work_centers, n_days * n_shifts)
+        totals = totals.reshape(n_work_centers, n_days * n_shifts, len(MEASURES))
+        periods = [
+            {"day": day.isoformat(), "shift": s, "start": shift_start_time(day, s).isoformat()}
+            for day in (date_from + timedelta(days=d) for d in range(n_days))
+            for s in range(1, n_shifts + 1)
+            if (day, s) <= current
+        ]
+    planned, totals = planned[:, :len(periods)], totals[:, :len(periods)]  # Periods are in time order
+
+    series = _columns(planned, totals)
+    overall = _values(planned.sum(axis=1), totals.sum(axis=1))
+
+    # Plain lists of numbers and strings: skip the generic encoder, which dominates on long series
+    return JSONResponse({
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "granularity": granularity,
+        "periods": periods,
+        "work_centers": [
+            {
+                "work_center_id": wc.workCenterId,
+                "name": wc.name,
+                "plant": wc.plant,
+                "total": overall[i],
+                **series[i]
+            }
+            for i, wc in enumerate(work_centers)
+        ],
+        "compute_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@router.get("/leaderboard")
+def oee_leaderboard(
+    date_from: date = None,
+    date_to: date = None,
+    plant: str = None,
+    order: str = "best",
+    limit: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Work centers ranked by OEE over date_from..date_to (default: last 30 days).
+
+    `order=worst` lists the lowest OEE first; work centers without planned time are not ranked.
+    """
+
+    if order not in ("best", "worst"):
+        raise HTTPException(status_code=400, detail="order must be 'best' or 'worst'")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    date_from, date_to = _date_range(date_from, date_to, 30)
+
+    started = time.perf_counter()
+    work_centers, planned, totals = _load(db, date_from, date_to, plant)
+    planned, totals = planned.sum(axis=(1, 2)), totals.sum(axis=(1, 2))
+    oee = oee_factors(planned, totals)["oee"]
+
+    ranked = np.flatnonzero(~np.isnan(oee))
+    ranked = ranked[np.argsort(-oee[ranked] if order == "best" else oee[ranked], kind="stable")][:limit]
+    values = _values(planned, totals)
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "order": order,
+        "leaderboard": [
+            {
+                "rank": rank,
+                "work_center_id": work_centers[i].workCenterId,
+                "name": work_centers[i].name,
+                "plant": work_centers[i].plant,
+                **values[i]
+            }
+            for rank, i in enumerate(ranked.tolist(), start=1)
+        ],
+        "unranked": [wc.workCenterId for wc, value in zip(work_centers, oee.tolist()) if value != value],
+        "compute_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+@router.get("/status")
+def oee_status():
+    """Cached days and hit/load counters of the OEE engine"""
+    return oee_engine.stats()
+
+@router.post("/rebuild")
+def rebuild_oee(db: Session = Depends(get_db)):
+    """Rebuild the OEE shift totals from all posted confirmations (one pass over history)"""
+
+    result = rebuild_oee_inputs(db)
+    db.commit()
+    oee_engine.invalidate()
+
+    return {"message": "OEE shift totals rebuilt", **result}
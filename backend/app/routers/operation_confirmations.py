@@ -15,20 +15,37 @@ API Endpoints:
 - GET /api/operation-confirmations - List confirmations with filtering
 - GET /api/operation-confirmations/{confirmation_id} - Get specific confirmation
 - POST /api/operation-confirmations/{confirmation_id}/reverse - Reverse confirmation
+- POST /api/operation-confirmations/reverse - Mass reversal for an order or shift
 - GET /api/operation-confirmations/order/{order_id} - Get confirmations for order
 - GET /api/operation-confirmations/work-center/{work_center_id} - Get confirmations for work center
 - POST /api/operation-confirmations/batch - Batch confirmation processing
+- POST /api/operation-confirmations/ingest - Queue confirmations in the ingestion journal (high-rate mode)
+- GET /api/operation-confirmations/ingest/status - Ingestion backlog and lag metrics
+- GET /api/operation-confirmations/ingest/{ingest_id} - Result of an ingested confirmation
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from pydantic import ValidationError
+from sqlalchemy import func, case, insert, or_
 from sqlalchemy.orm import Session
-from database import models, schemas, get_db
+from sqlalchemy.orm.exc import StaleDataError
+from database import models, schemas, get_db, SessionLocal
+from utils.concurrency import conflict
+from utils.confirmation_journal import journal
+from utils.operation_stats import record_operation_times
+from utils.kpi_rollups import record_confirmations, record_goods_movements
+from utils.oee import oee_sample, record_oee_inputs
+from utils.order_events import set_change_context
+from utils.routing_cache import routing_cache
 from datetime import datetime, timedelta
 from typing import List, Optional
 import uuid
 
 router = APIRouter(prefix="/api/operation-confirmations", tags=["Operation Confirmations (CO11N)"])
 
+# Reference prefixes of the goods movements a confirmation posts ("<prefix> from confirmation <id>")
+MOVEMENT_REFERENCE_PREFIXES = ("Auto receipt", "Scrap", "Auto issue")
+
 def calculate_variances(actual_setup: float, actual_machine: float, actual_labor: float,
                        planned_setup: float, planned_machine: float, planned_labor: float):
     """Calculate variances between actual and planned times"""
@@ -52,6 +69,97 @@ def calculate_variances(actual_setup: float, actual_machine: float, actual_labor
         "total_variance_percent": (total_variance / total_planned * 100) if total_planned > 0 else 0
     }
 
+def load_bom_components(db: Session, material_ids) -> dict:
+    """Load BOM components for many parent materials in a single query"""
+    
+    components = {}
+    if not material_ids:
+        return components
+    
+    rows = db.query(
+        models.BOMHeader.parent_material_id,
+        models.BOMItem.component_material_id,
+        models.BOMItem.quantity
+    ).join(
+        models.BOMItem, models.BOMItem.bom_id == models.BOMHeader.bom_id
+    ).filter(
+        models.BOMHeader.parent_material_id.in_(set(material_ids))
+    ).all()
+    
+    for parent_material_id, component_material_id, quantity in rows:
+        components.setdefault(parent_material_id, []).append((component_material_id, quantity))
+    
+    return components
+
+def build_goods_movement_rows(confirmation_id: str, order_id: str, confirmation_type: str,
+                              yield_qty: float, scrap_qty: float, end_time: datetime,
+                              order: models.ProductionOrder, components: list) -> list:
+    """Build the automatic goods movements (receipt, scrap, component issues) for one confirmation"""
+    
+    rows = []
+    
+    # For final confirmations, create goods receipt for finished product
+    if confirmation_type == "FINAL" and yield_qty > 0:
+        rows.append({
+            "id": f"GR{uuid.uuid4().hex[:8].upper()}",
+            "movement_type": "RECEIPT",
+            "material_id": order.materialId,
+            "qty": yield_qty,
+            "plant": order.plant,
+            "storage_loc": "FG01",  # Finished goods location
+            "order_id": order_id,
+            "reference": f"Auto receipt from confirmation {confirmation_id}",
+            "confirmation_id": confirmation_id,
+            "timestamp": end_time
+        })
+    
+    # Create scrap movement if scrap quantity exists
+    if scrap_qty and scrap_qty > 0:
+        rows.append({
+            "id": f"GS{uuid.uuid4().hex[:8].upper()}",
+            "movement_type": "ADJUSTMENT",
+            "material_id": order.materialId,
+            "qty": -scrap_qty,  # Negative for scrap
+            "plant": order.plant,
+            "storage_loc": "SCRAP",
+            "order_id": order_id,
+            "reference": f"Scrap from confirmation {confirmation_id}",
+            "confirmation_id": confirmation_id,
+            "timestamp": end_time
+        })
+    
+    # Issue components for this operation (simplified - in real SAP this is more complex)
+    if confirmation_type in ["FINAL", "PARTIAL"]:
+        for component_material_id, quantity in components:
+            # Calculate component consumption based on yield
+            consumption_qty = quantity * yield_qty
+            
+            if consumption_qty > 0:
+                rows.append({
+                    "id": f"GI{uuid.uuid4().hex[:8].upper()}",
+                    "movement_type": "ISSUE",
+                    "material_id": component_material_id,
+                    "qty": consumption_qty,
+                    "plant": order.plant,
+                    "storage_loc": "RM01",  # Raw materials location
+                    "order_id": order_id,
+                    "reference": f"Auto issue from confirmation {confirmation_id}",
+                    "confirmation_id": confirmation_id,
+                    "timestamp": end_time
+                })
+    
+    return rows
+
+def summarize_movement(row: dict) -> dict:
+    """Short movement summary returned to clients"""
+    movement_type = "SCRAP" if row["storage_loc"] == "SCRAP" else row["movement_type"]
+    return {
+        "movement_id": row["id"],
+        "type": movement_type,
+        "material_id": row["material_id"],
+        "quantity": abs(row["qty"])
+    }
+
 def create_automatic_goods_movements(db: Session, confirmation: models.OperationConfirmation):
     """Create automatic goods movements based on operation confirmation"""
     
@@ -66,92 +174,14 @@ def create_automatic_goods_movements(db: Session, confirmation: models.Operation
         if not order:
             return movements_created
         
-        # For final confirmations, create goods receipt for finished product
-        if confirmation.confirmation_type == "FINAL" and confirmation.yield_qty > 0:
-            receipt_id = f"GR{uuid.uuid4().hex[:8].upper()}"
-            
-            goods_receipt = models.GoodsMovement(
-                id=receipt_id,
-                movement_type="RECEIPT",
-                material_id=order.materialId,
-                qty=confirmation.yield_qty,
-                plant=order.plant,
-                storage_loc="FG01",  # Finished goods location
-                order_id=confirmation.order_id,
-                reference=f"Auto receipt from confirmation {confirmation.confirmation_id}",
-                timestamp=confirmation.end_time
-            )
-            
-            db.add(goods_receipt)
-            movements_created.append({
-                "movement_id": receipt_id,
-                "type": "RECEIPT",
-                "material_id": order.materialId,
-                "quantity": confirmation.yield_qty
-            })
+        components = load_bom_components(db, [order.materialId]).get(order.materialId, [])
         
-        # Create scrap movement if scrap quantity exists
-        if confirmation.scrap_qty > 0:
-            scrap_id = f"GS{uuid.uuid4().hex[:8].upper()}"
-            
-            scrap_movement = models.GoodsMovement(
-                id=scrap_id,
-                movement_type="ADJUSTMENT",
-                material_id=order.materialId,
-                qty=-confirmation.scrap_qty,  # Negative for scrap
-                plant=order.plant,
-                storage_loc="SCRAP",
-                order_id=confirmation.order_id,
-                reference=f"Scrap from confirmation {confirmation.confirmation_id}",
-                timestamp=confirmation.end_time
-            )
-            
-            db.add(scrap_movement)
-            movements_created.append({
-                "movement_id": scrap_id,
-                "type": "SCRAP",
-                "material_id": order.materialId,
-                "quantity": confirmation.scrap_qty
-            })
-        
-        # Issue components for this operation (simplified - in real SAP this is more complex)
-        if confirmation.confirmation_type in ["FINAL", "PARTIAL"]:
-            # Get BOM components for the material
-            bom_headers = db.query(models.BOMHeader).filter(
-                models.BOMHeader.parent_material_id == order.materialId
-            ).all()
-            
-            for bom_header in bom_headers:
-                bom_items = db.query(models.BOMItem).filter(
-                    models.BOMItem.bom_id == bom_header.bom_id
-                ).all()
-                
-                for item in bom_items:
-                    # Calculate component consumption based on yield
-                    consumption_qty = item.quantity * confirmation.yield_qty
-                    
-                    if consumption_qty > 0:
-                        issue_id = f"GI{uuid.uuid4().hex[:8].upper()}"
-                        
-                        component_issue = models.GoodsMovement(
-                            id=issue_id,
-                            movement_type="ISSUE",
-                            material_id=item.component_material_id,
-                            qty=consumption_qty,
-                            plant=order.plant,
-                            storage_loc="RM01",  # Raw materials location
-                            order_id=confirmation.order_id,
-                            reference=f"Auto issue from confirmation {confirmation.confirmation_id}",
-                            timestamp=confirmation.end_time
-                        )
-                        
-                        db.add(component_issue)
-                        movements_created.append({
-                            "movement_id": issue_id,
-                            "type": "ISSUE",
-                            "material_id": item.component_material_id,
-                            "quantity": consumption_qty
-                        })
+        for row in build_goods_movement_rows(
+            confirmation.confirmation_id, confirmation.order_id, confirmation.confirmation_type,
+            confirmation.yield_qty, confirmation.scrap_qty, confirmation.end_time, order, components
+        ):
+            db.add(models.GoodsMovement(**row))
+            movements_created.append(summarize_movement(row))
         
         return movements_created
         
@@ -160,6 +190,126 @@ def create_automatic_goods_movements(db: Session, confirmation: models.Operation
         print(f"Error creating automatic goods movements: {str(e)}")
         return movements_created
 
+def ensure_order_totals(db: Session, orders):
+    """Initialize the running confirmation totals of orders confirmed before they were tracked"""
+    
+    missing = {o.orderId: o for o in orders if o.finalConfirmations is None}
+    if not missing:
+        return
+    
+    totals = {
+        order_id: (final_count, total_yield, total_scrap)
+        for order_id, final_count, total_yield, total_scrap in db.query(
+            models.OperationConfirmation.order_id,
+            func.sum(case((models.OperationConfirmation.confirmation_type == "FINAL", 1), else_=0)),
+            func.sum(models.OperationConfirmation.yield_qty),
+            func.sum(models.OperationConfirmation.scrap_qty)
+        ).filter(
+            models.OperationConfirmation.order_id.in_(missing.keys()),
+            models.OperationConfirmation.status == "CONFIRMED"
+        ).group_by(models.OperationConfirmation.order_id).all()
+    }
+    
+    for order_id, order in missing.items():
+        final_count, total_yield, total_scrap = totals.get(order_id, (0, 0.0, 0.0))
+        order.finalConfirmations = final_count or 0
+        order.confirmedYield = total_yield or 0.0
+        order.confirmedScrap = total_scrap or 0.0
+
+def concurrent_posting_conflict(db: Session, order_ids) -> HTTPException:
+    """409 for a posting that raced another update of the same order(s)"""
+    db.rollback()
+    orders = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId.in_(set(order_ids))).all()
+    return conflict(
+        "Order was changed concurrently, retry the posting",
+        {
+            "orders": [
+                schemas.ProductionOrderResponse.model_validate(o).model_dump(mode="json") for o in orders
+            ]
+        }
+    )
+
+def order_state(order: models.ProductionOrder) -> dict:
+    """Mutable copy of the order fields that confirmations and reversals update"""
+    return {
+        "status": order.status,
+        "progress": order.progress,
+        "actualStartDate": order.actualStartDate,
+        "actualEndDate": order.actualEndDate,
+        "final_count": order.finalConfirmations or 0,
+        "total_yield": order.confirmedYield or 0.0,
+        "total_scrap": order.confirmedScrap or 0.0
+    }
+
+def store_order_state(order: models.ProductionOrder, state: dict):
+    order.status = state["status"]
+    order.progress = state["progress"]
+    order.actualStartDate = state["actualStartDate"]
+    order.actualEndDate = state["actualEndDate"]
+    order.finalConfirmations = state["final_count"]
+    order.confirmedYield = state["total_yield"]
+    order.confirmedScrap = state["total_scrap"]
+
+def apply_order_progress(state: dict, confirmation_type: str, total_operations: int, quantity: int,
+                         start_time: datetime, end_time: datetime):
+    """Update an order's status/progress state after a confirmation.
+    
+    `state` comes from order_state() and its running totals already include the
+    new confirmation.
+    """
+    
+    if confirmation_type == "FINAL":
+        if state["final_count"] >= total_operations:
+            state["status"] = models.OrderStatus.COMPLETED
+            state["progress"] = 100
+            state["actualEndDate"] = end_time
+        else:
+            state["status"] = models.OrderStatus.IN_PROGRESS
+            state["progress"] = min(95, (state["final_count"] / total_operations) * 100)
+    
+    elif confirmation_type == "PARTIAL":
+        state["status"] = models.OrderStatus.IN_PROGRESS
+        # Update progress based on confirmed quantity vs order quantity
+        state["progress"] = min(90, (state["total_yield"] / quantity) * 100) if quantity else 0
+    
+    # Set actual start date if not set
+    if not state["actualStartDate"]:
+        state["actualStartDate"] = start_time
+
+def add_confirmation_to_state(state: dict, confirmation_type: str, yield_qty: float, scrap_qty: float, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) a confirmation from an order's running totals"""
+    if confirmation_type == "FINAL":
+        state["final_count"] += sign
+    state["total_yield"] += sign * yield_qty
+    state["total_scrap"] += sign * (scrap_qty or 0.0)
+
+def revert_order_progress(state: dict, previous_final_count: int, total_operations: int, quantity: int):
+    """Recompute an order's status/progress from its running totals after reversals.
+    
+    Only a status the confirmations set is rolled back: IN_PROGRESS, or COMPLETED
+    when every operation had been finally confirmed. Orders completed, cancelled or
+    delayed by other means keep their status.
+    """
+    
+    if state["status"] == models.OrderStatus.COMPLETED:
+        if previous_final_count < total_operations or state["final_count"] >= total_operations:
+            return
+    elif state["status"] != models.OrderStatus.IN_PROGRESS:
+        return
+    
+    state["actualEndDate"] = None
+    if state["final_count"] > 0:
+        state["status"] = models.OrderStatus.IN_PROGRESS
+        state["progress"] = min(95, (state["final_count"] / total_operations) * 100)
+    elif state["total_yield"] > 0:
+        state["status"] = models.OrderStatus.IN_PROGRESS
+        state["progress"] = min(90, (state["total_yield"] / quantity) * 100) if quantity else 0
+    else:
+        # Nothing confirmed any more
+        state["status"] = models.OrderStatus.RELEASED
+        state["progress"] = 0
+        state["actualStartDate"] = None
+
 @router.post("", response_model=schemas.OperationConfirmationResponse)
 def create_operation_confirmation(
     confirmation_data: schemas.OperationConfirmationCreate,
@@ -175,13 +325,9 @@ def create_operation_confirmation(
     if not order:
         raise HTTPException(status_code=404, detail="Production order not found")
     
-    # Verify operation exists in routing
-    operation = None
-    if order.routingId:
-        operation = db.query(models.Operation).filter(
-            models.Operation.routing_id == order.routingId,
-            models.Operation.operation_id == confirmation_data.operation_id
-        ).first()
+    # Verify operation exists in routing (routing master data comes from the cache)
+    routing = routing_cache.get(db, order.routingId)
+    operation = routing.find_operation(confirmation_data.operation_id) if routing else None
     
     if not operation:
         raise HTTPException(
@@ -213,6 +359,10 @@ def create_operation_confirmation(
     
     # Generate confirmation ID
     confirmation_id = f"CNF{uuid.uuid4().hex[:8].upper()}"
+    set_change_context(db, "CONFIRMATION", f"Confirmation {confirmation_id}")
+    
+    # Initialize running totals before the new confirmation is flushed
+    ensure_order_totals(db, [order])
     
     # Calculate variances
     variances = calculate_variances(
@@ -243,45 +393,39 @@ def create_operation_confirmation(
     )
     
     db.add(confirmation)
-    db.flush()  # Get the confirmation ID
+    try:
+        db.flush()  # Get the confirmation ID; writes the order's running totals (version-checked)
+    except StaleDataError:
+        raise concurrent_posting_conflict(db, [order.orderId])
     
     # Create automatic goods movements
     movements_created = create_automatic_goods_movements(db, confirmation)
     
-    # Update order status and progress
-    if confirmation_data.confirmation_type == "FINAL":
-        # Check if all operations are confirmed
-        total_confirmed_qty = db.query(models.OperationConfirmation).filter(
-            models.OperationConfirmation.order_id == confirmation_data.order_id,
-            models.OperationConfirmation.confirmation_type == "FINAL"
-        ).count()
-        
-        # Get total operations in routing
-        total_operations = db.query(models.Operation).filter(
-            models.Operation.routing_id == order.routingId
-        ).count() if order.routingId else 1
-        
-        if total_confirmed_qty >= total_operations:
-            order.status = models.OrderStatus.COMPLETED
-            order.progress = 100
-            order.actualEndDate = confirmation_data.end_time
-        else:
-            order.status = models.OrderStatus.IN_PROGRESS
-            order.progress = min(95, (total_confirmed_qty / total_operations) * 100)
+    # Get total operations in routing
+    total_operations = len(routing.operations) if order.routingId else 1
     
-    elif confirmation_data.confirmation_type == "PARTIAL":
-        order.status = models.OrderStatus.IN_PROGRESS
-        # Update progress based on confirmed quantity vs order quantity
-        total_confirmed = sum(c.yield_qty for c in db.query(models.OperationConfirmation).filter(
-            models.OperationConfirmation.order_id == confirmation_data.order_id
-        ).all())
-        order.progress = min(90, (total_confirmed / order.quantity) * 100)
+    # Update order status, progress and running totals
+    state = order_state(order)
+    add_confirmation_to_state(
+        state, confirmation_data.confirmation_type, confirmation_data.yield_qty, confirmation_data.scrap_qty
+    )
+    apply_order_progress(
+        state, confirmation_data.confirmation_type, total_operations, order.quantity,
+        confirmation_data.start_time, confirmation_data.end_time
+    )
+    store_order_state(order, state)
     
-    # Set actual start date if not set
-    if not order.actualStartDate:
-        order.actualStartDate = confirmation_data.start_time
+    # Update rolling statistics of actual operation times
+    record_operation_times(db, [(
+        order.routingId, confirmation_data.operation_id, confirmation_data.work_center_id,
+        confirmation_data.setup_time_actual, confirmation_data.machine_time_actual, confirmation_data.labor_time_actual
+    )])
+    record_oee_inputs(db, [oee_sample(confirmation, operation)])
     
-    db.commit()
+    try:
+        db.commit()
+    except StaleDataError:
+        raise concurrent_posting_conflict(db, [order.orderId])
     db.refresh(confirmation)
     
     # Prepare response
@@ -368,18 +512,16 @@ def get_order_confirmations_with_details(order_id: str, db: Session = Depends(ge
     ).order_by(models.OperationConfirmation.created_at).all()
     
     # Get routing operations for comparison
-    operations = []
-    if order.routingId:
-        operations = db.query(models.Operation).filter(
-            models.Operation.routing_id == order.routingId
-        ).order_by(models.Operation.sequence).all()
-    
-    # Calculate summary statistics
-    total_yield = sum(c.yield_qty for c in confirmations)
-    total_scrap = sum(c.scrap_qty for c in confirmations)
+    routing = routing_cache.get(db, order.routingId)
+    operations = routing.operations if routing else ()
+    
+    # Calculate summary statistics (reversed confirmations no longer count)
+    posted = [c for c in confirmations if c.status == "CONFIRMED"]
+    total_yield = sum(c.yield_qty for c in posted)
+    total_scrap = sum(c.scrap_qty for c in posted)
     total_actual_time = sum(
         c.setup_time_actual + c.machine_time_actual + c.labor_time_actual 
-        for c in confirmations
+        for c in posted
     )
     
     # Calculate planned time from operations
@@ -432,45 +574,191 @@ def get_order_confirmations_with_details(order_id: str, db: Session = Depends(ge
         ]
     }
 
+def post_confirmation_batch(db: Session, confirmations: List[schemas.OperationConfirmationCreate],
+                            ingest_ids: Optional[List[str]] = None) -> list:
+    """Validate and post a batch of confirmations with set-based reads and bulk writes.
+    
+    Same CO11N rules as the single endpoint, applied in request order. Returns one
+    result per row without committing; `ingest_ids` are stored on confirmations
+    posted from the ingestion journal.
+    """
+    
+    if not confirmations:
+        return []
+    
+    order_ids = {c.order_id for c in confirmations}
+    orders = {
+        o.orderId: o for o in db.query(models.ProductionOrder).filter(
+            models.ProductionOrder.orderId.in_(order_ids)
+        ).all()
+    }
+    
+    routings = routing_cache.get_many(db, {o.routingId for o in orders.values()})
+    operations = {
+        (routing_id, op.operation_id): op
+        for routing_id, routing in routings.items() for op in routing.operations
+    }
+    operation_counts = {
+        routing_id: len(routing.operations) for routing_id, routing in routings.items() if routing.operations
+    }
+    
+    work_center_ids = {
+        wc_id for (wc_id,) in db.query(models.WorkCenter.workCenterId).filter(
+            models.WorkCenter.workCenterId.in_({c.work_center_id for c in confirmations})
+        ).all()
+    }
+    
+    components = load_bom_components(db, {o.materialId for o in orders.values()})
+    
+    # Running totals per order
+    set_change_context(db, "CONFIRMATION", f"Batch of {len(confirmations)} confirmations")
+    ensure_order_totals(db, orders.values())
+    order_states = {order_id: order_state(order) for order_id, order in orders.items()}
+    
+    results = []
+    confirmation_rows = []
+    movement_rows = []
+    
+    for index, confirmation_data in enumerate(confirmations):
+        errors = []
+        order = orders.get(confirmation_data.order_id)
+        operation = None
+        
+        if not order:
+            errors.append("Production order not found")
+        else:
+            if order.routingId:
+                operation = operations.get((order.routingId, confirmation_data.operation_id))
+            if not operation:
+                errors.append(f"Operation {confirmation_data.operation_id} not found in routing")
+        
+        if confirmation_data.work_center_id not in work_center_ids:
+            errors.append("Work center not found")
+        
+        if confirmation_data.yield_qty <= 0:
+            errors.append("Yield quantity must be greater than 0")
+        
+        if confirmation_data.start_time >= confirmation_data.end_time:
+            errors.append("End time must be after start time")
+        
+        state = order_states.get(confirmation_data.order_id)
+        if state and state["status"] not in [models.OrderStatus.RELEASED, models.OrderStatus.IN_PROGRESS]:
+            errors.append(f"Cannot confirm order in {state['status']} status")
+        
+        if errors:
+            results.append({
+                "index": index,
+                "order_id": confirmation_data.order_id,
+                "operation_id": confirmation_data.operation_id,
+                "status": "FAILED",
+                "errors": errors
+            })
+            continue
+        
+        confirmation_id = f"CNF{uuid.uuid4().hex[:8].upper()}"
+        
+        variances = calculate_variances(
+            confirmation_data.setup_time_actual,
+            confirmation_data.machine_time_actual,
+            confirmation_data.labor_time_actual,
+            operation.setup_time,
+            operation.machine_time,
+            operation.labor_time
+        )
+        
+        confirmation_rows.append({
+            "confirmation_id": confirmation_id,
+            "order_id": confirmation_data.order_id,
+            "operation_id": confirmation_data.operation_id,
+            "work_center_id": confirmation_data.work_center_id,
+            "yield_qty": confirmation_data.yield_qty,
+            "scrap_qty": confirmation_data.scrap_qty,
+            "setup_time_actual": confirmation_data.setup_time_actual,
+            "machine_time_actual": confirmation_data.machine_time_actual,
+            "labor_time_actual": confirmation_data.labor_time_actual,
+            "start_time": confirmation_data.start_time,
+            "end_time": confirmation_data.end_time,
+            "confirmation_type": confirmation_data.confirmation_type,
+            "status": "CONFIRMED",
+            "confirmed_by": "SYSTEM",
+            "ingest_id": ingest_ids[index] if ingest_ids else None
+        })
+        
+        movements = build_goods_movement_rows(
+            confirmation_id, confirmation_data.order_id, confirmation_data.confirmation_type,
+            confirmation_data.yield_qty, confirmation_data.scrap_qty, confirmation_data.end_time,
+            order, components.get(order.materialId, [])
+        )
+        movement_rows.extend(movements)
+        
+        add_confirmation_to_state(
+            state, confirmation_data.confirmation_type, confirmation_data.yield_qty, confirmation_data.scrap_qty
+        )
+        apply_order_progress(
+            state, confirmation_data.confirmation_type,
+            operation_counts.get(order.routingId, 1), order.quantity,
+            confirmation_data.start_time, confirmation_data.end_time
+        )
+        
+        results.append({
+            "index": index,
+            "confirmation_id": confirmation_id,
+            "order_id": confirmation_data.order_id,
+            "operation_id": confirmation_data.operation_id,
+            "status": "SUCCESS",
+            "variances": variances,
+            "goods_movements": [summarize_movement(m) for m in movements]
+        })
+    
+    if confirmation_rows:
+        db.execute(insert(models.OperationConfirmation), confirmation_rows)
+    if movement_rows:
+        db.execute(insert(models.GoodsMovement), movement_rows)
+    
+    # Apply status/progress and running totals once per touched order
+    for order_id in {row["order_id"] for row in confirmation_rows}:
+        store_order_state(orders[order_id], order_states[order_id])
+    
+    record_operation_times(db, [
+        (
+            orders[row["order_id"]].routingId, row["operation_id"], row["work_center_id"],
+            row["setup_time_actual"], row["machine_time_actual"], row["labor_time_actual"]
+        ) for row in confirmation_rows
+    ])
+    
+    # Bulk inserts bypass the flush hook of the daily KPI rollups
+    record_confirmations(db, confirmation_rows)
+    record_goods_movements(db, movement_rows, {row["confirmation_id"]: row["work_center_id"] for row in confirmation_rows})
+    record_oee_inputs(db, [
+        oee_sample(row, operations.get((orders[row["order_id"]].routingId, row["operation_id"])))
+        for row in confirmation_rows
+    ])
+    
+    return results
+
 @router.post("/batch")
 def batch_confirmation_processing(
     confirmations: List[schemas.OperationConfirmationCreate],
     db: Session = Depends(get_db)
 ):
-    """Process multiple operation confirmations in a single transaction"""
+    """Process multiple operation confirmations in a single transaction.
     
-    results = []
+    The whole batch is rejected if any confirmation fails validation.
+    """
     
     try:
-        for confirmation_data in confirmations:
-            # Create each confirmation (reusing the logic from single confirmation)
-            confirmation_id = f"CNF{uuid.uuid4().hex[:8].upper()}"
-            
-            confirmation = models.OperationConfirmation(
-                confirmation_id=confirmation_id,
-                order_id=confirmation_data.order_id,
-                operation_id=confirmation_data.operation_id,
-                work_center_id=confirmation_data.work_center_id,
-                yield_qty=confirmation_data.yield_qty,
-                scrap_qty=confirmation_data.scrap_qty,
-                setup_time_actual=confirmation_data.setup_time_actual,
-                machine_time_actual=confirmation_data.machine_time_actual,
-                labor_time_actual=confirmation_data.labor_time_actual,
-                start_time=confirmation_data.start_time,
-                end_time=confirmation_data.end_time,
-                confirmation_type=confirmation_data.confirmation_type,
-                status="CONFIRMED",
-                confirmed_by="SYSTEM"
+        results = post_confirmation_batch(db, confirmations)
+        
+        failed = [r for r in results if r["status"] == "FAILED"]
+        if failed:
+            db.rollback()
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "message": f"{len(failed)} of {len(confirmations)} confirmations failed validation",
+                    "errors": failed
+                }
             )
-            
-            db.add(confirmation)
-            
-            results.append({
-                "confirmation_id": confirmation_id,
-                "order_id": confirmation_data.order_id,
-                "operation_id": confirmation_data.operation_id,
-                "status": "SUCCESS"
-            })
         
         # Commit all confirmations
         db.commit()
@@ -480,6 +768,322 @@ def batch_confirmation_processing(
             "confirmations_processed": results
         }
         
+    except HTTPException:
+        raise
+    except StaleDataError:
+        raise concurrent_posting_conflict(db, [c.order_id for c in confirmations])
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Batch confirmation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Batch confirmation failed: {str(e)}")
+
+def reverse_confirmations(db: Session, confirmations: List[models.OperationConfirmation], reason: Optional[str] = None) -> dict:
+    """Reverse posted confirmations with bulk compensating goods movements.
+    
+    Every goods movement posted for the confirmations (receipt, scrap, component
+    issues) is offset by a movement with the negated quantity in one bulk insert,
+    the confirmations are marked REVERSED in one UPDATE and each affected order's
+    running totals and status are adjusted once. Raises 409 if any of them is no
+    longer CONFIRMED (reversed concurrently). Nothing is committed here.
+    """
+    
+    if not confirmations:
+        return {"confirmations_reversed": 0, "movements_posted": 0, "orders": []}
+    
+    now = datetime.now()
+    confirmation_ids = [c.confirmation_id for c in confirmations]
+    
+    orders = {
+        o.orderId: o for o in db.query(models.ProductionOrder).filter(
+            models.ProductionOrder.orderId.in_({c.order_id for c in confirmations})
+        ).all()
+    }
+    # Must run before the confirmations are marked REVERSED
+    set_change_context(db, "REVERSAL", reason or f"{len(confirmations)} confirmations reversed")
+    ensure_order_totals(db, orders.values())
+    
+    # Marking them first locks the rows; a confirmation reversed concurrently fails the whole reversal
+    reversed_count = db.query(models.OperationConfirmation).filter(
+        models.OperationConfirmation.confirmation_id.in_(confirmation_ids),
+        models.OperationConfirmation.status == "CONFIRMED"
+    ).update({
+        models.OperationConfirmation.status: "REVERSED",
+        models.OperationConfirmation.reversed_at: now,
+        models.OperationConfirmation.reversal_reason: reason
+    }, synchronize_session=False)
+    if reversed_count != len(confirmation_ids):
+        raise conflict(
+            "Confirmations were reversed concurrently, reload and retry",
+            {"confirmation_ids": confirmation_ids}
+        )
+    
+    routings = routing_cache.get_many(db, {o.routingId for o in orders.values()})
+    operation_counts = {
+        routing_id: len(routing.operations) for routing_id, routing in routings.items() if routing.operations
+    }
+    
+    # Movements posted by the confirmations; older movements are matched by their reference text
+    confirmation_by_reference = {
+        f"{prefix} from confirmation {confirmation_id}": confirmation_id
+        for confirmation_id in confirmation_ids
+        for prefix in MOVEMENT_REFERENCE_PREFIXES
+    }
+    movements = db.query(models.GoodsMovement).filter(
+        or_(
+            models.GoodsMovement.confirmation_id.in_(confirmation_ids),
+            models.GoodsMovement.reference.in_(list(confirmation_by_reference))
+        )
+    ).all()
+    
+    reversal_rows = []
+    for movement in movements:
+        confirmation_id = movement.confirmation_id or confirmation_by_reference.get(movement.reference)
+        reversal_rows.append({
+            "id": f"RV{uuid.uuid4().hex[:8].upper()}",
+            "movement_type": movement.movement_type,
+            "material_id": movement.material_id,
+            "qty": -movement.qty,
+            "plant": movement.plant,
+            "storage_loc": movement.storage_loc,
+            "order_id": movement.order_id,
+            "reference": f"Reversal of {movement.id} from confirmation {confirmation_id}",
+            "confirmation_id": confirmation_id,
+            "timestamp": now
+        })
+    
+    if reversal_rows:
+        db.execute(insert(models.GoodsMovement), reversal_rows)
+    
+    # Adjust running totals and status once per order
+    order_states = {order_id: order_state(order) for order_id, order in orders.items()}
+    previous_final_counts = {order_id: state["final_count"] for order_id, state in order_states.items()}
+    for confirmation in confirmations:
+        state = order_states.get(confirmation.order_id)
+        if state:
+            add_confirmation_to_state(
+                state, confirmation.confirmation_type, confirmation.yield_qty, confirmation.scrap_qty, sign=-1
+            )
+    
+    record_operation_times(db, [
+        (
+            orders[c.order_id].routingId if c.order_id in orders else None, c.operation_id, c.work_center_id,
+            c.setup_time_actual, c.machine_time_actual, c.labor_time_actual
+        ) for c in confirmations
+    ], sign=-1)
+    
+    record_confirmations(db, confirmations, sign=-1)
+    record_goods_movements(db, reversal_rows, {c.confirmation_id: c.work_center_id for c in confirmations})
+    record_oee_inputs(db, [
+        oee_sample(c, routings[orders[c.order_id].routingId].find_operation(c.operation_id)
+                   if c.order_id in orders and orders[c.order_id].routingId in routings else None)
+        for c in confirmations
+    ], sign=-1)
+    
+    order_results = []
+    for order_id, order in orders.items():
+        state = order_states[order_id]
+        revert_order_progress(
+            state, previous_final_counts[order_id], operation_counts.get(order.routingId, 1), order.quantity
+        )
+        store_order_state(order, state)
+        order_results.append({
+            "order_id": order_id,
+            "status": state["status"],
+            "progress": state["progress"],
+            "confirmed_yield": state["total_yield"],
+            "confirmed_scrap": state["total_scrap"]
+        })
+    
+    return {
+        "confirmations_reversed": len(confirmation_ids),
+        "confirmation_ids": confirmation_ids,
+        "movements_posted": len(reversal_rows),
+        "orders": order_results
+    }
+
+@router.post("/reverse")
+def mass_reverse_confirmations(
+    payload: schemas.MassConfirmationReversalRequest,
+    db: Session = Depends(get_db)
+):
+    """Reverse all confirmations of an order, or of a shift (time window, optionally per work center)"""
+    
+    if not payload.order_id and not (payload.start_time and payload.end_time):
+        raise HTTPException(
+            status_code=400,
+            detail="Specify an order_id or a shift window (start_time and end_time)"
+        )
+    
+    query = db.query(models.OperationConfirmation).filter(
+        models.OperationConfirmation.status == "CONFIRMED"
+    )
+    
+    if payload.order_id:
+        query = query.filter(models.OperationConfirmation.order_id == payload.order_id)
+    if payload.work_center_id:
+        query = query.filter(models.OperationConfirmation.work_center_id == payload.work_center_id)
+    if payload.start_time:
+        query = query.filter(models.OperationConfirmation.end_time >= payload.start_time)
+    if payload.end_time:
+        query = query.filter(models.OperationConfirmation.end_time < payload.end_time)
+    
+    confirmations = query.all()
+    if not confirmations:
+        raise HTTPException(status_code=404, detail="No confirmations to reverse")
+    
+    order_ids = {c.order_id for c in confirmations}
+    try:
+        result = reverse_confirmations(db, confirmations, payload.reason)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except StaleDataError:
+        raise concurrent_posting_conflict(db, order_ids)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Mass reversal failed: {str(e)}")
+    
+    return {
+        "message": f"Reversed {result['confirmations_reversed']} confirmations",
+        **result
+    }
+
+@router.post("/{confirmation_id}/reverse")
+def reverse_operation_confirmation(
+    confirmation_id: str,
+    payload: Optional[schemas.ConfirmationReversalRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """Reverse a confirmation and post its compensating goods movements"""
+    
+    confirmation = db.query(models.OperationConfirmation).filter(
+        models.OperationConfirmation.confirmation_id == confirmation_id
+    ).first()
+    
+    if not confirmation:
+        raise HTTPException(status_code=404, detail="Operation confirmation not found")
+    
+    if confirmation.status != "CONFIRMED":
+        raise HTTPException(status_code=400, detail=f"Cannot reverse confirmation in {confirmation.status} status")
+    
+    order_id = confirmation.order_id
+    try:
+        result = reverse_confirmations(db, [confirmation], payload.reason if payload else None)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except StaleDataError:
+        raise concurrent_posting_conflict(db, [order_id])
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Reversal failed: {str(e)}")
+    
+    return {
+        "message": f"Confirmation {confirmation_id} reversed",
+        **result
+    }
+
+def process_journal_entries(entries: list) -> list:
+    """Post one micro-batch of journaled confirmations in a single transaction.
+    
+    Invalid confirmations are reported as FAILED without blocking the rest of the
+    batch. Entries whose ingest_id was already posted (a batch replayed after a
+    crash) are reported as DUPLICATE.
+    """
+    
+    db = SessionLocal()
+    try:
+        posted = {
+            ingest_id for (ingest_id,) in db.query(models.OperationConfirmation.ingest_id).filter(
+                models.OperationConfirmation.ingest_id.in_([e["ingest_id"] for e in entries])
+            ).all()
+        }
+        
+        results = []
+        confirmations = []
+        ingest_ids = []
+        for entry in entries:
+            if entry["ingest_id"] in posted:
+                results.append({"ingest_id": entry["ingest_id"], "status": "DUPLICATE"})
+                continue
+            try:
+                confirmations.append(schemas.OperationConfirmationCreate(**entry["payload"]))
+                ingest_ids.append(entry["ingest_id"])
+            except ValidationError as e:
+                results.append({
+                    "ingest_id": entry["ingest_id"],
+                    "order_id": entry["payload"].get("order_id"),
+                    "status": "FAILED",
+                    "errors": [str(e)]
+                })
+        
+        for ingest_id, result in zip(ingest_ids, post_confirmation_batch(db, confirmations, ingest_ids)):
+            result["ingest_id"] = ingest_id
+            results.append(result)
+        
+        db.commit()
+        return results
+    
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@router.post("/ingest", status_code=202)
+def ingest_confirmations(confirmations: List[schemas.OperationConfirmationCreate]):
+    """Queue confirmations for asynchronous posting (high-rate terminal mode).
+    
+    Confirmations are acknowledged once durably written to the ingestion journal;
+    they are posted in micro-batches by the journal consumer.
+    """
+    
+    for confirmation_data in confirmations:
+        if confirmation_data.yield_qty <= 0:
+            raise HTTPException(status_code=400, detail="Yield quantity must be greater than 0")
+        if confirmation_data.start_time >= confirmation_data.end_time:
+            raise HTTPException(status_code=400, detail="End time must be after start time")
+    
+    ingest_ids = journal.append([c.model_dump(mode="json") for c in confirmations])
+    
+    return {
+        "message": f"Queued {len(ingest_ids)} confirmations",
+        "ingest_ids": ingest_ids
+    }
+
+@router.get("/ingest/status")
+def get_ingestion_status():
+    """Backlog and lag metrics of the confirmation ingestion queue"""
+    return journal.stats()
+
+@router.get("/ingest/{ingest_id}")
+def get_ingested_confirmation(ingest_id: str, db: Session = Depends(get_db)):
+    """Get the posting result of an ingested confirmation.
+    
+    Full results (variances, failures) are kept in memory by the consumer process;
+    other workers, and the consumer after a restart, answer from the posted
+    confirmation carrying the ingest_id or from the journal's failed entries.
+    """
+    
+    result = journal.get_result(ingest_id)
+    if result:
+        return result
+    
+    confirmation = db.query(models.OperationConfirmation).filter(
+        models.OperationConfirmation.ingest_id == ingest_id
+    ).first()
+    if not confirmation:
+        failed = journal.get_failed_result(ingest_id)
+        if failed:
+            return failed
+        raise HTTPException(status_code=404, detail="Ingested confirmation not processed yet or unknown")
+    
+    return {
+        "ingest_id": ingest_id,
+        "confirmation_id": confirmation.confirmation_id,
+        "order_id": confirmation.order_id,
+        "operation_id": confirmation.operation_id,
+        "status": "SUCCESS",
+        "confirmation_status": confirmation.status
+    }
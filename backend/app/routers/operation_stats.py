@@ -0,0 +1,195 @@
+"""
+OPERATION TIME STATISTICS
+
+Rolling statistics of actual confirmed operation times per routing operation and
+work center, maintained incrementally by CO11N postings (see utils/operation_stats.py).
+Used to compare routing standard times with reality and to propose new standards.
+
+API Endpoints:
+- GET /api/operation-stats - List statistics with filtering
+- GET /api/operation-stats/proposals - Proposed standard times from actual times
+- GET /api/operation-stats/{routing_id}/{operation_id} - Statistics of one routing operation
+- POST /api/operation-stats/rebuild - Rebuild statistics from confirmation history
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import models, get_db
+from utils.operation_stats import METRICS, record_operation_times, sketch_quantile, summarize
+
+router = APIRouter(prefix="/api/operation-stats", tags=["Operation Statistics"])
+
+def _parse_percentiles(percentiles: str) -> list:
+    try:
+        values = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be a comma-separated list of numbers")
+    if any(p < 0 or p > 100 for p in values):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    return values
+
+@router.get("")
+def list_operation_stats(
+    routing_id: str = None,
+    operation_id: str = None,
+    work_center_id: str = None,
+    min_samples: int = 1,
+    percentiles: str = "50,90",
+    limit: int = 500,
+    db: Session = Depends(get_db)
+):
+    """List rolling time statistics with optional filtering"""
+
+    percentile_list = _parse_percentiles(percentiles)
+    query = db.query(models.OperationTimeStatistic).filter(
+        models.OperationTimeStatistic.sample_count >= min_samples
+    )
+
+    if routing_id:
+        query = query.filter(models.OperationTimeStatistic.routing_id == routing_id)
+    if operation_id:
+        query = query.filter(models.OperationTimeStatistic.operation_id == operation_id)
+    if work_center_id:
+        query = query.filter(models.OperationTimeStatistic.work_center_id == work_center_id)
+
+    stats = query.order_by(
+        models.OperationTimeStatistic.routing_id,
+        models.OperationTimeStatistic.operation_id
+    ).limit(limit).all()
+
+    return [summarize(stat, percentile_list) for stat in stats]
+
+@router.get("/proposals")
+def propose_standard_times(
+    routing_id: str = None,
+    work_center_id: str = None,
+    min_samples: int = 30,
+    basis: str = "median",
+    threshold_percent: float = 10.0,
+    db: Session = Depends(get_db)
+):
+    """Propose updated standard times where actual times deviate from the routing.
+
+    The proposal is the median (or mean) actual time; operations are listed when
+    any of setup/machine/labor deviates more than threshold_percent from standard.
+    """
+
+    if basis not in ("median", "mean"):
+        raise HTTPException(status_code=400, detail="basis must be 'median' or 'mean'")
+
+    query = db.query(models.OperationTimeStatistic).filter(
+        models.OperationTimeStatistic.sample_count >= min_samples
+    )
+    if routing_id:
+        query = query.filter(models.OperationTimeStatistic.routing_id == routing_id)
+    if work_center_id:
+        query = query.filter(models.OperationTimeStatistic.work_center_id == work_center_id)
+    stats = query.all()
+
+    operations = {}
+    if stats:
+        operations = {
+            (op.routing_id, op.operation_id): op
+            for op in db.query(models.Operation).filter(
+                models.Operation.routing_id.in_({s.routing_id for s in stats})
+            ).all()
+        }
+
+    proposals = []
+    for stat in stats:
+        operation = operations.get((stat.routing_id, stat.operation_id))
+        if not operation:
+            continue
+
+        metrics = {}
+        deviates = False
+        for metric in METRICS:
+            standard = getattr(operation, f"{metric}_time") or 0.0
+            if basis == "median":
+                proposed = sketch_quantile((stat.sketches or {}).get(metric), 0.5)
+            else:
+                proposed = getattr(stat, f"{metric}_mean")
+            deviation = ((proposed - standard) / standard * 100) if standard > 0 and proposed is not None else None
+            if deviation is not None and abs(deviation) > threshold_percent:
+                deviates = True
+            metrics[f"{metric}_time"] = {
+                "standard": standard,
+                "proposed": proposed,
+                "deviation_percent": deviation
+            }
+
+        if deviates:
+            proposals.append({
+                "routing_id": stat.routing_id,
+                "operation_id": stat.operation_id,
+                "work_center_id": stat.work_center_id,
+                "sample_count": stat.sample_count,
+                "basis": basis,
+                **metrics
+            })
+
+    return {
+        "min_samples": min_samples,
+        "threshold_percent": threshold_percent,
+        "proposals": proposals
+    }
+
+@router.get("/{routing_id}/{operation_id}")
+def get_operation_stats(
+    routing_id: str,
+    operation_id: str,
+    percentiles: str = "10,50,90,95",
+    db: Session = Depends(get_db)
+):
+    """Get rolling time statistics of a routing operation (per work center)"""
+
+    percentile_list = _parse_percentiles(percentiles)
+    stats = db.query(models.OperationTimeStatistic).filter(
+        models.OperationTimeStatistic.routing_id == routing_id,
+        models.OperationTimeStatistic.operation_id == operation_id
+    ).all()
+
+    if not stats:
+        raise HTTPException(status_code=404, detail="No statistics for this operation")
+
+    return [summarize(stat, percentile_list) for stat in stats]
+
+@router.post("/rebuild")
+def rebuild_operation_stats(db: Session = Depends(get_db)):
+    """Rebuild all statistics from the posted confirmations (one pass over history)"""
+
+    db.query(models.OperationTimeStatistic).delete()
+
+    rows = db.query(
+        models.ProductionOrder.routingId,
+        models.OperationConfirmation.operation_id,
+        models.OperationConfirmation.work_center_id,
+        models.OperationConfirmation.setup_time_actual,
+        models.OperationConfirmation.machine_time_actual,
+        models.OperationConfirmation.labor_time_actual
+    ).join(
+        models.ProductionOrder, models.ProductionOrder.orderId == models.OperationConfirmation.order_id
+    ).filter(
+        models.OperationConfirmation.status == "CONFIRMED"
+    ).yield_per(5000)
+
+    samples = 0
+    chunk = []
+    for row in rows:
+        chunk.append(tuple(row))
+        if len(chunk) >= 5000:
+            record_operation_times(db, chunk)
+            db.flush()
+            samples += len(chunk)
+            chunk = []
+    if chunk:
+        record_operation_times(db, chunk)
+        samples += len(chunk)
+
+    db.commit()
+
+    return {
+        "message": "Operation statistics rebuilt",
+        "samples": samples,
+        "statistics": db.query(models.OperationTimeStatistic).count()
+    }
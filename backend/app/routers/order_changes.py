@@ -12,35 +12,133 @@ Features:
 API Endpoints:
 - POST /api/order-changes/{order_id}/change - Submit order change request
 - GET /api/order-changes/{order_id}/history - Get change history for order
-- GET /api/order-changes/history - Get all change history with filtering
+- GET /api/order-changes/history - Search all change history (list, or NDJSON export)
+- GET /api/order-changes/history/page - Search all change history with keyset pagination
+- POST /api/order-changes/history/backfill-plant - Fill plant on history rows written before it existed
 - POST /api/order-changes/{change_id}/approve - Approve pending change
 - POST /api/order-changes/{change_id}/reject - Reject pending change
 - GET /api/order-changes/{order_id}/impact-analysis - Analyze change impact
+- POST /api/order-changes/impact-analysis - Analyze many proposed changes together
+- GET /api/order-changes/{order_id}/change-sets - Typed change sets (event log) of an order
+- GET /api/order-changes/{order_id}/as-of - Order state at a point in time
+- POST /api/order-changes/{order_id}/rollback/{change_set_id} - Restore the order as of a change set
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, or_, select, tuple_, update
 from sqlalchemy.orm import Session
-from database import models, schemas, get_db
+from sqlalchemy.orm.exc import StaleDataError
+from database import models, schemas, get_db, SessionLocal
 from datetime import datetime
 from typing import List, Optional
-import uuid
+from utils.audit import buffered_change, expand_history_row, record_change
+from utils.concurrency import check_if_match, conflict, set_etag
+from utils.order_events import ROLLBACK_FIELDS, encode_value, replay_order_state, set_change_context
+from utils.routing_cache import routing_cache
+import base64
+import json
 
 router = APIRouter(prefix="/api/order-changes", tags=["Order Changes (CO02)"])
 
-def analyze_change_impact(db: Session, order_id: str, change_type: str, field_name: str, new_value: str):
-    """Analyze the impact of a proposed change on the production order"""
+def order_state(order: models.ProductionOrder) -> dict:
+    """JSON-serializable current state of an order (409 conflict responses)"""
+    return schemas.ProductionOrderResponse.model_validate(order).model_dump(mode="json")
+
+def concurrent_change_conflict(db: Session, order_id: str):
+    """409 for an order that another writer updated between our read and our commit"""
+    db.rollback()
+    order = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
+    return conflict(f"Order {order_id} was changed concurrently, reload and retry", order_state(order) if order else {})
+
+# Order fields CO02 may change; status, progress, confirmation totals, the event
+# sequence and the optimistic-locking version are maintained by the system
+CHANGEABLE_FIELDS = [
+    "quantity", "dueDate", "plannedStartDate", "plannedEndDate", "priority",
+    "routingId", "description", "workCenterId", "costCenter"
+]
+
+def check_changeable(field_name: str):
+    if field_name not in CHANGEABLE_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Field {field_name} cannot be changed (changeable fields: {', '.join(CHANGEABLE_FIELDS)})"
+        )
+
+def apply_field_change(order: models.ProductionOrder, field_name: str, new_value: str):
+    """Set a changeable order field from the string value of a change request"""
+    if field_name == "quantity":
+        order.quantity = int(new_value)
+    elif field_name in ("dueDate", "plannedStartDate", "plannedEndDate"):
+        setattr(order, field_name, datetime.fromisoformat(new_value.replace('Z', '+00:00')))
+    elif field_name == "priority":
+        order.priority = models.OrderPriority(new_value)
+    else:
+        setattr(order, field_name, new_value)
+
+def load_impact_snapshot(db: Session, orders) -> dict:
+    """Load BOM components and plant stock availability for a set of orders.
+    
+    Two queries regardless of the number of orders/components. Availability is
+    on-hand minus safety stock summed per (material, plant).
+    """
+    
+    snapshot = {"components": {}, "available": {}}
+    material_ids = {o.materialId for o in orders}
+    if not material_ids:
+        return snapshot
+    
+    for parent_material_id, component_material_id, quantity in db.query(
+        models.BOMHeader.parent_material_id,
+        models.BOMItem.component_material_id,
+        models.BOMItem.quantity
+    ).join(
+        models.BOMItem, models.BOMItem.bom_id == models.BOMHeader.bom_id
+    ).filter(
+        models.BOMHeader.parent_material_id.in_(material_ids)
+    ).all():
+        snapshot["components"].setdefault(parent_material_id, []).append((component_material_id, quantity))
+    
+    component_ids = {c for items in snapshot["components"].values() for c, _ in items}
+    if component_ids:
+        for material_id, plant, available in db.query(
+            models.Stock.material_id,
+            models.Stock.plant,
+            func.sum(models.Stock.on_hand - models.Stock.safety_stock)
+        ).filter(
+            models.Stock.material_id.in_(component_ids),
+            models.Stock.plant.in_({o.plant for o in orders})
+        ).group_by(models.Stock.material_id, models.Stock.plant).all():
+            snapshot["available"][(material_id, plant)] = available or 0.0
+    
+    return snapshot
+
+def analyze_change_impact(db: Session, order_id: str, change_type: str, field_name: str, new_value: str,
+                          order: models.ProductionOrder = None, snapshot: dict = None, proposed: dict = None):
+    """Analyze the impact of a proposed change on the production order
     
-    order = db.query(models.ProductionOrder).filter(
-        models.ProductionOrder.orderId == order_id
-    ).first()
+    `snapshot` (from load_impact_snapshot) is shared across analyses: quantity
+    increases consume component availability from it and decreases release it, so
+    later analyses see what earlier ones used. `proposed` holds field values set by
+    earlier changes to the same order in the same evaluation.
+    """
+    
+    if order is None:
+        order = db.query(models.ProductionOrder).filter(
+            models.ProductionOrder.orderId == order_id
+        ).first()
     
     if not order:
         return {"error": "Order not found"}
     
+    if snapshot is None:
+        snapshot = load_impact_snapshot(db, [order])
+    proposed = proposed if proposed is not None else {}
+    
     impact_analysis = {
         "change_type": change_type,
         "field_name": field_name,
-        "current_value": getattr(order, field_name, None),
+        "current_value": proposed.get(field_name, getattr(order, field_name, None)),
         "proposed_value": new_value,
         "impacts": [],
         "warnings": [],
@@ -49,9 +147,14 @@ def analyze_change_impact(db: Session, order_id: str, change_type: str, field_na
     
     # Analyze different types of changes
     if change_type == "QUANTITY":
-        current_qty = order.quantity
-        new_qty = int(new_value)
+        current_qty = proposed.get("quantity", order.quantity)
+        try:
+            new_qty = int(new_value)
+        except ValueError:
+            impact_analysis["blocking_issues"].append("Invalid quantity")
+            new_qty = current_qty
         qty_diff = new_qty - current_qty
+        proposed["quantity"] = new_qty
         
         if qty_diff > 0:
             impact_analysis["impacts"].append(f"Quantity increase of {qty_diff} units")
@@ -60,38 +163,25 @@ def analyze_change_impact(db: Session, order_id: str, change_type: str, field_na
         elif qty_diff < 0:
             impact_analysis["impacts"].append(f"Quantity decrease of {abs(qty_diff)} units")
             impact_analysis["impacts"].append("May result in excess material allocation")
-            
-        # Check material availability for quantity increases
-        if qty_diff > 0:
-            # Get BOM components
-            bom_headers = db.query(models.BOMHeader).filter(
-                models.BOMHeader.parent_material_id == order.materialId
-            ).all()
-            
-            for bom_header in bom_headers:
-                bom_items = db.query(models.BOMItem).filter(
-                    models.BOMItem.bom_id == bom_header.bom_id
-                ).all()
-                
-                for item in bom_items:
-                    additional_need = item.quantity * qty_diff
-                    stock = db.query(models.Stock).filter(
-                        models.Stock.material_id == item.component_material_id,
-                        models.Stock.plant == order.plant
-                    ).first()
-                    
-                    available = stock.on_hand - stock.safety_stock if stock else 0
-                    if available < additional_need:
-                        impact_analysis["warnings"].append(
-                            f"Insufficient stock for material {item.component_material_id}: "
-                            f"need {additional_need}, available {available}"
-                        )
+        
+        # Check material availability for quantity increases; decreases release components
+        for component_material_id, quantity in snapshot["components"].get(order.materialId, []):
+            additional_need = quantity * qty_diff
+            key = (component_material_id, order.plant)
+            available = snapshot["available"].get(key, 0)
+            if qty_diff > 0 and available < additional_need:
+                impact_analysis["warnings"].append(
+                    f"Insufficient stock for material {component_material_id}: "
+                    f"need {additional_need}, available {available}"
+                )
+            snapshot["available"][key] = available - additional_need
     
     elif change_type == "DATE":
         if field_name == "dueDate":
-            current_date = order.dueDate
+            current_date = proposed.get("dueDate", order.dueDate)
             try:
                 new_date = datetime.fromisoformat(new_value.replace('Z', '+00:00'))
+                proposed["dueDate"] = new_date
                 if new_date < current_date:
                     impact_analysis["impacts"].append("Due date moved earlier - may require expediting")
                     impact_analysis["warnings"].append("Check capacity availability for earlier date")
@@ -102,8 +192,29 @@ def analyze_change_impact(db: Session, order_id: str, change_type: str, field_na
     
     elif change_type == "ROUTING":
         impact_analysis["impacts"].append("Routing change will affect operation sequence")
-        impact_analysis["impacts"].append("May require different work centers")
-        impact_analysis["warnings"].append("Verify new routing is valid for this material")
+        if field_name == "routingId":
+            routing = routing_cache.get(db, new_value)
+            material_id = proposed.get("materialId", order.materialId)
+            if not routing:
+                impact_analysis["blocking_issues"].append(f"Routing {new_value} not found")
+            elif routing.material_id != material_id:
+                impact_analysis["blocking_issues"].append(
+                    f"Routing {new_value} is for material {routing.material_id}, not {material_id}"
+                )
+            else:
+                if routing.status != models.RoutingStatus.ACTIVE:
+                    impact_analysis["warnings"].append(f"Routing {new_value} is {routing.status.value}")
+                current = routing_cache.get(db, proposed.get("routingId", order.routingId))
+                current_centers = {op.work_center_id or "" for op in current.operations} if current else set()
+                new_centers = {op.work_center_id or "" for op in routing.operations}
+                if new_centers - current_centers:
+                    impact_analysis["impacts"].append(
+                        f"New work centers: {', '.join(sorted(new_centers - current_centers))}"
+                    )
+                proposed["routingId"] = new_value
+        else:
+            impact_analysis["impacts"].append("May require different work centers")
+            impact_analysis["warnings"].append("Verify new routing is valid for this material")
     
     # Check if order can be changed based on status
     if order.status in [models.OrderStatus.COMPLETED, models.OrderStatus.CANCELLED]:
@@ -118,9 +229,15 @@ def analyze_change_impact(db: Session, order_id: str, change_type: str, field_na
 def submit_order_change(
     order_id: str,
     change_request: schemas.OrderChangeRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Submit a change request for a production order (CO02 Transaction)"""
+    """Submit a change request for a production order (CO02 Transaction).
+    
+    Send the order version read by the client in If-Match; the change is rejected
+    with 409 and the current order if someone else changed it in the meantime.
+    """
     
     # Verify order exists
     order = db.query(models.ProductionOrder).filter(
@@ -130,13 +247,13 @@ def submit_order_change(
     if not order:
         raise HTTPException(status_code=404, detail="Production order not found")
     
+    check_if_match(if_match, order.version, order_state(order))
+    
     # Validate change request
     if change_request.order_id != order_id:
         raise HTTPException(status_code=400, detail="Order ID mismatch")
     
-    # Check if field exists on the order model
-    if not hasattr(order, change_request.field_name):
-        raise HTTPException(status_code=400, detail=f"Invalid field name: {change_request.field_name}")
+    check_changeable(change_request.field_name)
     
     # Get current value
     current_value = str(getattr(order, change_request.field_name, ""))
@@ -154,55 +271,37 @@ def submit_order_change(
             detail=f"Change blocked: {'; '.join(impact['blocking_issues'])}"
         )
     
-    # Generate change ID
-    change_id = f"CHG{uuid.uuid4().hex[:8].upper()}"
-    
-    # Create change history record
-    change_record = models.OrderChangeHistory(
-        change_id=change_id,
-        order_id=order_id,
-        change_type=change_request.change_type,
-        field_name=change_request.field_name,
-        old_value=current_value,
-        new_value=change_request.new_value,
-        reason=change_request.reason,
-        changed_by="SYSTEM",  # In real implementation, get from auth context
-        change_timestamp=datetime.now()
+    # Buffer the change history record (written at commit)
+    change_id = record_change(
+        db, order, change_request.change_type, change_request.field_name,
+        current_value, change_request.new_value, change_request.reason,
+        changed_by="SYSTEM"  # In real implementation, get from auth context
     )
     
-    db.add(change_record)
-    
     # Apply the change immediately (in real SAP, this might require approval)
     try:
-        if change_request.field_name == "quantity":
-            order.quantity = int(change_request.new_value)
-        elif change_request.field_name == "dueDate":
-            order.dueDate = datetime.fromisoformat(change_request.new_value.replace('Z', '+00:00'))
-        elif change_request.field_name == "priority":
-            order.priority = models.OrderPriority(change_request.new_value)
-        elif change_request.field_name == "routingId":
-            order.routingId = change_request.new_value
-        elif change_request.field_name == "description":
-            order.description = change_request.new_value
-        else:
-            setattr(order, change_request.field_name, change_request.new_value)
+        apply_field_change(order, change_request.field_name, change_request.new_value)
         
+        set_change_context(db, change_request.change_type, change_request.reason)
+        change_timestamp = buffered_change(db, order_id)["change_timestamp"]  # as stored at commit
         db.commit()
-        db.refresh(change_record)
+        set_etag(response, order.version)
         
         return schemas.OrderChangeResponse(
-            change_id=change_record.change_id,
-            order_id=change_record.order_id,
-            change_type=change_record.change_type,
-            field_name=change_record.field_name,
-            old_value=change_record.old_value,
-            new_value=change_record.new_value,
-            reason=change_record.reason,
-            changed_by=change_record.changed_by,
-            change_timestamp=change_record.change_timestamp,
+            change_id=change_id,
+            order_id=order_id,
+            change_type=change_request.change_type,
+            field_name=change_request.field_name,
+            old_value=current_value,
+            new_value=change_request.new_value,
+            reason=change_request.reason,
+            changed_by="SYSTEM",
+            change_timestamp=change_timestamp,
             status="SUCCESS"
         )
         
+    except StaleDataError:
+        raise concurrent_change_conflict(db, order_id)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to apply change: {str(e)}")
@@ -225,61 +324,195 @@ def get_order_change_history(order_id: str, db: Session = Depends(get_db)):
     
     return [
         schemas.OrderChangeResponse(
-            change_id=change.change_id,
-            order_id=change.order_id,
-            change_type=change.change_type,
-            field_name=change.field_name,
-            old_value=change.old_value,
-            new_value=change.new_value,
-            reason=change.reason,
-            changed_by=change.changed_by,
-            change_timestamp=change.change_timestamp,
+            change_id=entry["change_id"],
+            order_id=entry["order_id"],
+            change_type=entry["change_type"],
+            field_name=entry["field_name"],
+            old_value=entry["old_value"],
+            new_value=entry["new_value"],
+            reason=entry["reason"],
+            changed_by=entry["changed_by"],
+            change_timestamp=entry["change_timestamp"],
             status="SUCCESS"
-        ) for change in changes
+        ) for change in changes for entry in expand_history_row(change)
     ]
 
+def encode_history_cursor(change: models.OrderChangeHistory) -> str:
+    """Opaque keyset cursor: position after this row in (change_timestamp, id) descending order"""
+    timestamp = change.change_timestamp.isoformat() if change.change_timestamp else ""
+    return base64.urlsafe_b64encode(f"{timestamp}|{change.id}".encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def history_search_query(db: Session, plant: str = None, change_type: str = None, changed_by: str = None,
+                         order_id: str = None, date_from: datetime = None, date_to: datetime = None):
+    """Filtered history query in keyset order (newest first), served by the composite indexes"""
+    history = models.OrderChangeHistory
+    query = db.query(history)
+    if plant:
+        query = query.filter(history.plant == plant)
+    if change_type:
+        # Rows of mixed types ("BULK") match through the types listed for them
+        mixed = select(models.OrderChangeHistoryType.change_id).where(
+            models.OrderChangeHistoryType.change_type == change_type
+        )
+        query = query.filter(or_(
+            history.change_type == change_type,
+            and_(history.change_type == "BULK", history.change_id.in_(mixed))
+        ))
+    if changed_by:
+        query = query.filter(history.changed_by == changed_by)
+    if order_id:
+        query = query.filter(history.order_id == order_id)
+    if date_from:
+        query = query.filter(history.change_timestamp >= date_from)
+    if date_to:
+        query = query.filter(history.change_timestamp < date_to)
+    return query.order_by(history.change_timestamp.desc(), history.id.desc())
+
+def history_items(changes: list, change_type: str = None) -> list:
+    """Per-field items of history rows; with a change type filter, only the fields of that type"""
+    return [
+        entry for change in changes for entry in expand_history_row(change)
+        if change_type in (None, entry["change_type"], change.change_type)
+    ]
+
+def history_page(db: Session, filters: dict, position, limit: int) -> list:
+    """Up to `limit` rows after a keyset position (None: from the newest).
+
+    Rows without a timestamp cannot be compared by (change_timestamp, id); they
+    follow all others, newest id first, with a cursor of (None, id).
+    """
+    history = models.OrderChangeHistory
+    rows = []
+    if position is None or position[0] is not None:
+        query = history_search_query(db, **filters).filter(history.change_timestamp.isnot(None))
+        if position:
+            query = query.filter(tuple_(history.change_timestamp, history.id) < tuple_(*position))
+        rows = query.limit(limit).all()
+    if len(rows) < limit:
+        query = history_search_query(db, **filters).filter(history.change_timestamp.is_(None))
+        if position and position[0] is None:
+            query = query.filter(history.id < position[1])
+        rows += query.limit(limit - len(rows)).all()
+    return rows
+
 @router.get("/history")
 def get_all_change_history(
     plant: str = None,
     change_type: str = None,
     changed_by: str = None,
+    order_id: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
     limit: int = 100,
+    format: str = "json",
     db: Session = Depends(get_db)
 ):
-    """Get change history for all orders with optional filtering"""
+    """Search change history of all orders, newest first.
     
-    query = db.query(models.OrderChangeHistory)
+    Returns the newest `limit` audit rows as a list, one item per changed field (a
+    compact row of a change set expands to several items). format=ndjson streams
+    every matching row (one JSON object per line) for bulk audit exports; `limit` is
+    then the page size used internally. Use /history/page to page through results.
+    """
     
-    # Apply filters
-    if plant:
-        # Join with ProductionOrder to filter by plant
-        query = query.join(models.ProductionOrder, 
-                          models.OrderChangeHistory.order_id == models.ProductionOrder.orderId)
-        query = query.filter(models.ProductionOrder.plant == plant)
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
     
-    if change_type:
-        query = query.filter(models.OrderChangeHistory.change_type == change_type)
+    filters = dict(plant=plant, change_type=change_type, changed_by=changed_by,
+                   order_id=order_id, date_from=date_from, date_to=date_to)
     
-    if changed_by:
-        query = query.filter(models.OrderChangeHistory.changed_by == changed_by)
+    if format == "ndjson":
+        page_size = min(limit, 1000)
+        
+        def export():
+            # Own session: the stream outlives the request-scoped one
+            export_db = SessionLocal()
+            try:
+                position = None
+                while True:
+                    page = history_page(export_db, filters, position, page_size)
+                    if not page:
+                        break
+                    yield "".join(json.dumps(entry, default=str) + "\n" for entry in history_items(page, change_type))
+                    position = (page[-1].change_timestamp, page[-1].id)
+                    export_db.expunge_all()
+            finally:
+                export_db.close()
+        
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    
+    changes = history_search_query(db, **filters).limit(limit).all()
+    return history_items(changes, change_type)
+
+@router.get("/history/page")
+def get_change_history_page(
+    plant: str = None,
+    change_type: str = None,
+    changed_by: str = None,
+    order_id: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    cursor: str = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Search change history with keyset pagination (same filters as /history).
     
-    changes = query.order_by(
-        models.OrderChangeHistory.change_timestamp.desc()
-    ).limit(limit).all()
+    `limit` counts audit rows (at most 1000). Pass the returned next_cursor to get
+    the following page; it is null on the last one.
+    """
     
-    return [
-        {
-            "change_id": change.change_id,
-            "order_id": change.order_id,
-            "change_type": change.change_type,
-            "field_name": change.field_name,
-            "old_value": change.old_value,
-            "new_value": change.new_value,
-            "reason": change.reason,
-            "changed_by": change.changed_by,
-            "change_timestamp": change.change_timestamp
-        } for change in changes
-    ]
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    
+    filters = dict(plant=plant, change_type=change_type, changed_by=changed_by,
+                   order_id=order_id, date_from=date_from, date_to=date_to)
+    position = decode_history_cursor(cursor) if cursor else None
+    
+    changes = history_page(db, filters, position, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    return {
+        "items": history_items(changes, change_type),
+        "next_cursor": encode_history_cursor(changes[-1]) if has_more else None,
+        "limit": limit
+    }
+
+@router.post("/history/backfill-plant")
+def backfill_change_history_plant(batch_size: int = 5000, db: Session = Depends(get_db)):
+    """Fill the denormalized plant of history rows written before the column existed"""
+    
+    history = models.OrderChangeHistory
+    updated = 0
+    last_id = 0
+    while True:
+        ids = [row_id for (row_id,) in db.query(history.id).filter(
+            history.plant.is_(None), history.id > last_id
+        ).order_by(history.id).limit(batch_size).all()]
+        if not ids:
+            break
+        last_id = ids[-1]
+        result = db.execute(
+            update(history).where(history.id.in_(ids)).values(
+                plant=select(models.ProductionOrder.plant).where(
+                    models.ProductionOrder.orderId == history.order_id
+                ).scalar_subquery()
+            )
+        )
+        db.commit()
+        updated += result.rowcount
+    
+    return {"message": "Change history plant backfilled", "rows_updated": updated}
 
 @router.get("/{order_id}/impact-analysis")
 def get_change_impact_analysis(
@@ -307,9 +540,11 @@ def get_change_impact_analysis(
 def submit_bulk_order_changes(
     order_id: str,
     changes: List[schemas.OrderChangeRequest],
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Submit multiple changes to a production order in a single transaction"""
+    """Submit multiple changes to a production order in a single transaction (If-Match as for single changes)"""
     
     # Verify order exists
     order = db.query(models.ProductionOrder).filter(
@@ -319,51 +554,28 @@ def submit_bulk_order_changes(
     if not order:
         raise HTTPException(status_code=404, detail="Production order not found")
     
+    check_if_match(if_match, order.version, order_state(order))
+    
+    for change_request in changes:
+        if change_request.order_id != order_id:
+            raise HTTPException(status_code=400, detail="Order ID mismatch in bulk change")
+        check_changeable(change_request.field_name)
+    
     change_results = []
     
     try:
         for change_request in changes:
-            # Validate each change
-            if change_request.order_id != order_id:
-                raise HTTPException(status_code=400, detail="Order ID mismatch in bulk change")
-            
-            if not hasattr(order, change_request.field_name):
-                raise HTTPException(status_code=400, detail=f"Invalid field name: {change_request.field_name}")
-            
             # Get current value
             current_value = str(getattr(order, change_request.field_name, ""))
             
-            # Generate change ID
-            change_id = f"CHG{uuid.uuid4().hex[:8].upper()}"
-            
-            # Create change history record
-            change_record = models.OrderChangeHistory(
-                change_id=change_id,
-                order_id=order_id,
-                change_type=change_request.change_type,
-                field_name=change_request.field_name,
-                old_value=current_value,
-                new_value=change_request.new_value,
-                reason=change_request.reason,
-                changed_by="SYSTEM",
-                change_timestamp=datetime.now()
+            # Buffer the change; all fields share one compact history row
+            change_id = record_change(
+                db, order, change_request.change_type, change_request.field_name,
+                current_value, change_request.new_value, change_request.reason
             )
             
-            db.add(change_record)
-            
             # Apply the change
-            if change_request.field_name == "quantity":
-                order.quantity = int(change_request.new_value)
-            elif change_request.field_name == "dueDate":
-                order.dueDate = datetime.fromisoformat(change_request.new_value.replace('Z', '+00:00'))
-            elif change_request.field_name == "priority":
-                order.priority = models.OrderPriority(change_request.new_value)
-            elif change_request.field_name == "routingId":
-                order.routingId = change_request.new_value
-            elif change_request.field_name == "description":
-                order.description = change_request.new_value
-            else:
-                setattr(order, change_request.field_name, change_request.new_value)
+            apply_field_change(order, change_request.field_name, change_request.new_value)
             
             change_results.append({
                 "change_id": change_id,
@@ -371,15 +583,198 @@ def submit_bulk_order_changes(
                 "status": "SUCCESS"
             })
         
-        # Commit all changes
+        # Commit all changes as one change set
+        change_types = {c.change_type for c in changes}
+        change_set_id = set_change_context(
+            db, change_types.pop() if len(change_types) == 1 else "BULK",
+            "; ".join(c.reason for c in changes if c.reason) or None
+        )
         db.commit()
+        set_etag(response, order.version)
         
         return {
             "message": f"Successfully applied {len(changes)} changes to order {order_id}",
             "order_id": order_id,
+            "change_set_id": change_set_id,
             "changes_applied": change_results
         }
         
+    except StaleDataError:
+        raise concurrent_change_conflict(db, order_id)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Bulk change failed: {str(e)}")
+
+@router.post("/impact-analysis")
+def analyze_change_impact_batch(
+    changes: List[schemas.OrderChangeRequest],
+    db: Session = Depends(get_db)
+):
+    """Analyze many proposed changes (e.g. a customer schedule change) together.
+    
+    Orders, BOM structure and plant stock are loaded once. Changes are evaluated in
+    request order against cumulative component availability: stock consumed by an
+    earlier quantity increase is no longer available to later ones.
+    """
+    
+    orders = {
+        o.orderId: o for o in db.query(models.ProductionOrder).filter(
+            models.ProductionOrder.orderId.in_({c.order_id for c in changes})
+        ).all()
+    } if changes else {}
+    
+    snapshot = load_impact_snapshot(db, orders.values())
+    available_before = dict(snapshot["available"])
+    proposed = {order_id: {} for order_id in orders}
+    
+    results = []
+    for index, change in enumerate(changes):
+        order = orders.get(change.order_id)
+        if not order:
+            results.append({"index": index, "order_id": change.order_id, "error": "Order not found"})
+            continue
+        
+        analysis = analyze_change_impact(
+            db, change.order_id, change.change_type, change.field_name, change.new_value,
+            order=order, snapshot=snapshot, proposed=proposed[change.order_id]
+        )
+        results.append({"index": index, "order_id": change.order_id, **analysis})
+    
+    component_availability = []
+    # Plant or material can be None (stock rows without one): sort them first instead of comparing None to str
+    for (material_id, plant), available_after in sorted(
+        snapshot["available"].items(), key=lambda item: (item[0][0] or "", item[0][1] or "")
+    ):
+        before = available_before.get((material_id, plant), 0)
+        component_availability.append({
+            "material_id": material_id,
+            "plant": plant,
+            "available_before": before,
+            "net_change_requirement": before - available_after,
+            "available_after": available_after,
+            "shortage": max(0, -available_after)
+        })
+    
+    return {
+        "summary": {
+            "changes": len(changes),
+            "orders": len(orders),
+            "with_warnings": sum(1 for r in results if r.get("warnings")),
+            "blocked": sum(1 for r in results if r.get("blocking_issues") or r.get("error")),
+            "components_short": sum(1 for c in component_availability if c["shortage"] > 0)
+        },
+        "changes": results,
+        "component_availability": component_availability
+    }
+
+@router.get("/{order_id}/change-sets")
+def get_order_change_sets(order_id: str, limit: int = 100, db: Session = Depends(get_db)):
+    """Typed change sets of an order, newest first"""
+    
+    events = db.query(models.OrderChangeEvent).filter(
+        models.OrderChangeEvent.order_id == order_id
+    ).order_by(models.OrderChangeEvent.sequence.desc()).limit(limit).all()
+    
+    if not events and not db.query(models.ProductionOrder.id).filter(
+        models.ProductionOrder.orderId == order_id
+    ).first():
+        raise HTTPException(status_code=404, detail="Production order not found")
+    
+    return [
+        {
+            "change_set_id": e.change_set_id,
+            "order_id": e.order_id,
+            "sequence": e.sequence,
+            "change_type": e.change_type,
+            "changes": e.changes,
+            "reason": e.reason,
+            "changed_by": e.changed_by,
+            "change_timestamp": e.change_timestamp
+        } for e in events
+    ]
+
+@router.get("/{order_id}/as-of")
+def get_order_as_of(order_id: str, timestamp: datetime, db: Session = Depends(get_db)):
+    """Rebuild the order's state as it was at `timestamp` (nearest snapshot + later change sets)"""
+    
+    replayed = replay_order_state(db, order_id, as_of=timestamp)
+    if not replayed:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No change history for order {order_id} at or before {timestamp.isoformat()}"
+        )
+    
+    state, sequence = replayed
+    return {
+        "order_id": order_id,
+        "as_of": timestamp,
+        "sequence": sequence,
+        "state": state
+    }
+
+@router.post("/{order_id}/rollback/{change_set_id}")
+def rollback_to_change_set(
+    order_id: str,
+    change_set_id: str,
+    reason: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Restore the order's planning fields to their values right after a change set.
+    
+    Status, progress and confirmation totals are left alone, they follow the CO11N
+    postings. The rollback itself is recorded as a new ROLLBACK change set.
+    """
+    
+    order = db.query(models.ProductionOrder).filter(
+        models.ProductionOrder.orderId == order_id
+    ).first()
+    
+    if not order:
+        raise HTTPException(status_code=404, detail="Production order not found")
+    
+    if order.status in (models.OrderStatus.COMPLETED, models.OrderStatus.CANCELLED):
+        raise HTTPException(status_code=400, detail=f"Cannot roll back a {order.status.value} order")
+    
+    target = db.query(models.OrderChangeEvent).filter(
+        models.OrderChangeEvent.order_id == order_id,
+        models.OrderChangeEvent.change_set_id == change_set_id
+    ).first()
+    
+    if not target:
+        raise HTTPException(status_code=404, detail="Change set not found for this order")
+    
+    state, _ = replay_order_state(db, order_id, sequence=target.sequence)
+    reason = reason or f"Rollback to change set {change_set_id}"
+    
+    restored = []
+    for field in ROLLBACK_FIELDS:
+        old_value = getattr(order, field)
+        if encode_value(field, old_value) == encode_value(field, state.get(field)):
+            continue
+        setattr(order, field, state.get(field))
+        restored.append(field)
+        record_change(db, order, "ROLLBACK", field, str(old_value), str(state.get(field)), reason)
+    
+    if not restored:
+        return {
+            "message": f"Order {order_id} already matches change set {change_set_id}",
+            "order_id": order_id,
+            "change_set_id": None,
+            "restored_fields": []
+        }
+    
+    try:
+        rollback_set_id = set_change_context(db, "ROLLBACK", reason)
+        db.commit()
+    except StaleDataError:
+        raise concurrent_change_conflict(db, order_id)
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Bulk change failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Rollback failed: {str(e)}")
+    
+    return {
+        "message": f"Order {order_id} rolled back to change set {change_set_id}",
+        "order_id": order_id,
+        "change_set_id": rollback_set_id,
+        "restored_fields": restored
+    }
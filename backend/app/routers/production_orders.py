@@ -1,12 +1,32 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from database import models, schemas, get_db
-import utils.websocket_manager as websocket_manager
+from utils.event_bus import bus, publish_after_commit
+from utils.concurrency import check_if_match, conflict, set_etag
+from utils.order_events import set_change_context
 from datetime import datetime
+from typing import Optional
 
 router = APIRouter(prefix="/api/production-orders", tags=["Production Orders"])
 
+def order_state(po: models.ProductionOrder) -> dict:
+    """JSON-serializable current state of an order (409 conflict responses)"""
+    return schemas.ProductionOrderResponse.model_validate(po).model_dump(mode="json")
+
+def commit_or_conflict(db: Session, order_id: str, flush_only: bool = False):
+    """Commit (or only flush); a concurrent update of a versioned row is answered with 409 and the current order"""
+    try:
+        if flush_only:
+            db.flush()
+        else:
+            db.commit()
+    except StaleDataError:
+        db.rollback()
+        po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
+        raise conflict(f"Order {order_id} was changed concurrently, reload and retry", order_state(po) if po else {})
+
 @router.post("", response_model=schemas.ProductionOrderResponse)
 def create_order(payload: schemas.ProductionOrderCreate, db: Session = Depends(get_db)):
     order_id = f"PO{uuid.uuid4().hex[:8].upper()}"
@@ -26,17 +46,10 @@ def create_order(payload: schemas.ProductionOrderCreate, db: Session = Depends(g
     )
     
     db.add(po)
+    # notify websocket clients once the order is committed
+    publish_after_commit(db, {"type": "order_created", "order_id": po.orderId, "material_id": po.materialId, "quantity": po.quantity, "status": po.status.value, "plant": po.plant})
     db.commit()
     db.refresh(po)
-    
-    # notify websocket clients
-    message = {"type": "order_created", "order_id": po.orderId, "material_id": po.materialId, "quantity": po.quantity, "status": po.status.value}
-    # best-effort broadcast
-    try:
-        import asyncio
-        asyncio.create_task(websocket_manager.manager.broadcast(message))
-    except Exception:
-        pass
     return po
 
 @router.get("", response_model=list[schemas.ProductionOrderResponse])
@@ -46,18 +59,27 @@ def list_orders(status: str = None, db: Session = Depends(get_db)):
         q = q.filter(models.ProductionOrder.status == status)
     return q.all()
 
+@router.get("/{order_id}", response_model=schemas.ProductionOrderResponse)
+def get_order(order_id: str, response: Response, db: Session = Depends(get_db)):
+    po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
+    if not po:
+        raise HTTPException(status_code=404, detail="order not found")
+    set_etag(response, po.version)
+    return po
+
 @router.post("/{order_id}/release")
-def release_order(order_id: str, db: Session = Depends(get_db)):
+def release_order(order_id: str, response: Response, if_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
     if not po:
         raise HTTPException(status_code=404, detail="order not found")
+    check_if_match(if_match, po.version, order_state(po))
     if po.status != models.OrderStatus.CREATED:
         raise HTTPException(status_code=400, detail="only CREATED orders can be released")
     po.status = models.OrderStatus.RELEASED
-    db.commit()
-    # TODO: Add websocket broadcast back later
-    # import asyncio
-    # asyncio.create_task(websocket_manager.manager.broadcast({"type": "order_released", "order_id": po.orderId, "status": po.status.value}))
+    set_change_context(db, "RELEASE")
+    publish_after_commit(db, {"type": "order_released", "order_id": po.orderId, "status": po.status.value, "plant": po.plant})
+    commit_or_conflict(db, order_id)
+    set_etag(response, po.version)
     return {"order_id": po.orderId, "status": po.status.value}
 
 @router.post("/{order_id}/confirm")
@@ -72,13 +94,14 @@ def confirm_order(order_id: str, payload: schemas.ConfirmationCreate, db: Sessio
     total_yield = sum(c.yield_qty for c in db.query(models.Confirmation).filter(models.Confirmation.order_id == order_id).all())
     if total_yield >= po.quantity:
         po.status = models.OrderStatus.COMPLETED
-        db.commit()
-    import asyncio
-    asyncio.create_task(websocket_manager.manager.broadcast({"type": "confirmation", "order_id": order_id, "yield_total": total_yield, "order_status": po.status.value}))
+        set_change_context(db, "COMPLETION", "Confirmed yield reached order quantity")
+        commit_or_conflict(db, order_id)
+    # confirmation (and completion) are committed at this point
+    bus.publish({"type": "confirmation", "order_id": order_id, "yield_total": total_yield, "order_status": po.status.value, "plant": po.plant})
     return {"message": "confirmation posted", "order_status": po.status.value}
 
 @router.post("/{order_id}/complete")
-def complete_order(order_id: str, db: Session = Depends(get_db)):
+def complete_order(order_id: str, response: Response, if_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
     """
     One-click completion for demo:
     - Goods Issue: issue BOM components (reduces component stock)
@@ -88,6 +111,7 @@ def complete_order(order_id: str, db: Session = Depends(get_db)):
     po = db.query(models.ProductionOrder).filter(models.ProductionOrder.orderId == order_id).first()
     if not po:
         raise HTTPException(status_code=404, detail="order not found")
+    check_if_match(if_match, po.version, order_state(po))
 
     finished_mat = db.query(models.Material).filter(models.Material.materialId == po.materialId).first()
     if not finished_mat:
@@ -119,7 +143,7 @@ def complete_order(order_id: str, db: Session = Depends(get_db)):
                         safety_stock=0.0
                     )
                     db.add(comp_stock)
-                    db.flush()
+                    commit_or_conflict(db, order_id, flush_only=True)  # also writes earlier stock updates
 
                 comp_stock.on_hand = float(comp_stock.on_hand) - issue_qty
 
@@ -156,7 +180,7 @@ def complete_order(order_id: str, db: Session = Depends(get_db)):
             safety_stock=0.0
         )
         db.add(fg_stock)
-        db.flush()
+        commit_or_conflict(db, order_id, flush_only=True)
 
     fg_stock.on_hand = float(fg_stock.on_hand) + float(po.quantity)
     finished_mat.currentStock = int((finished_mat.currentStock or 0) + int(po.quantity))
@@ -178,20 +202,17 @@ def complete_order(order_id: str, db: Session = Depends(get_db)):
     po.status = models.OrderStatus.COMPLETED
     po.progress = 100
     po.actualEndDate = now
-    db.commit()
-
-    # Best-effort broadcast
-    try:
-        import asyncio
-        asyncio.create_task(websocket_manager.manager.broadcast({
-            "type": "order_completed",
-            "order_id": po.orderId,
-            "material_id": po.materialId,
-            "quantity": po.quantity,
-            "status": po.status.value
-        }))
-    except Exception:
-        pass
+    set_change_context(db, "COMPLETION")
+    publish_after_commit(db, {
+        "type": "order_completed",
+        "order_id": po.orderId,
+        "material_id": po.materialId,
+        "quantity": po.quantity,
+        "status": po.status.value,
+        "plant": po.plant
+    })
+    commit_or_conflict(db, order_id)
+    set_etag(response, po.version)
 
     return {
         "message": "order completed",
@@ -8,15 +8,23 @@ ROUTING API ENDPOINTS
 - PUT /api/routing/{routing_id}/operations/{operation_id} - Update operation
 - DELETE /api/routing/{routing_id} - Delete routing
 - GET /api/routing/material/{material_id} - Get routings for material
+- POST /api/routing/import - Bulk upsert routings and operations from a CSV or NDJSON file
 
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.exc import SQLAlchemyError
 from database import models, schemas, get_db
+from utils.routing_cache import bump_revision, routing_cache
+import csv
+import io
+import json
+import time
 import uuid
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/routing", tags=["Routing"])
 
@@ -33,6 +41,15 @@ def create_routing(payload: schemas.RoutingCreate, db: Session = Depends(get_db)
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
     
+    # Validate all work centers with one query
+    requested = {op.work_center_id for op in payload.operations}
+    known = {wc_id for (wc_id,) in db.query(models.WorkCenter.workCenterId).filter(
+        models.WorkCenter.workCenterId.in_(requested)
+    )}
+    missing = sorted(requested - known)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Work center {missing[0]} not found")
+    
     # Create routing
     routing = models.Routing(
         routing_id=payload.routing_id,
@@ -48,16 +65,6 @@ def create_routing(payload: schemas.RoutingCreate, db: Session = Depends(get_db)
     
     # Create operations
     for op_data in payload.operations:
-        # Validate work center exists
-        work_center = db.query(models.WorkCenter).filter(
-            models.WorkCenter.workCenterId == op_data.work_center_id
-        ).first()
-        if not work_center:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Work center {op_data.work_center_id} not found"
-            )
-        
         operation = models.Operation(
             operation_id=op_data.operation_id,
             routing_id=payload.routing_id,
@@ -73,6 +80,7 @@ def create_routing(payload: schemas.RoutingCreate, db: Session = Depends(get_db)
         db.add(operation)
     
     db.commit()
+    routing_cache.invalidate(payload.routing_id)
     db.refresh(routing)
     
     return routing
@@ -95,35 +103,26 @@ def list_routings(
 
 @router.get("/{routing_id}", response_model=schemas.RoutingWithOperations)
 def get_routing_with_operations(routing_id: str, db: Session = Depends(get_db)):
-    """Get routing with all its operations"""
+    """Get routing with all its operations (served from the routing cache)"""
     
-    routing = db.query(models.Routing).filter(models.Routing.routing_id == routing_id).first()
+    routing = routing_cache.get(db, routing_id)
     if not routing:
         raise HTTPException(status_code=404, detail="Routing not found")
     
-    operations = db.query(models.Operation).filter(
-        models.Operation.routing_id == routing_id
-    ).order_by(models.Operation.sequence).all()
-    
     return {
         "routing": routing,
-        "operations": operations
+        "operations": routing.operations
     }
 
 @router.get("/{routing_id}/operations", response_model=List[schemas.OperationResponse])
 def get_routing_operations(routing_id: str, db: Session = Depends(get_db)):
-    """Get all operations for a routing"""
+    """Get all operations for a routing (served from the routing cache)"""
     
-    # Verify routing exists
-    routing = db.query(models.Routing).filter(models.Routing.routing_id == routing_id).first()
+    routing = routing_cache.get(db, routing_id)
     if not routing:
         raise HTTPException(status_code=404, detail="Routing not found")
     
-    operations = db.query(models.Operation).filter(
-        models.Operation.routing_id == routing_id
-    ).order_by(models.Operation.sequence).all()
-    
-    return operations
+    return routing.operations
 
 @router.post("/{routing_id}/operations", response_model=schemas.OperationResponse)
 def add_operation_to_routing(
@@ -173,7 +172,9 @@ def add_operation_to_routing(
     )
     
     db.add(operation)
+    bump_revision(db, routing_id)
     db.commit()
+    routing_cache.invalidate(routing_id)
     db.refresh(operation)
     
     return operation
@@ -216,7 +217,9 @@ def update_operation(
     operation.control_key = payload.control_key
     operation.updated_at = datetime.now()
     
+    bump_revision(db, routing_id)
     db.commit()
+    routing_cache.invalidate(routing_id)
     db.refresh(operation)
     
     return operation
@@ -246,6 +249,7 @@ def delete_routing(routing_id: str, db: Session = Depends(get_db)):
     # Delete routing
     db.delete(routing)
     db.commit()
+    routing_cache.invalidate(routing_id)
     
     return {"message": f"Routing {routing_id} deleted successfully"}
 
@@ -263,4 +267,304 @@ def get_routings_for_material(material_id: str, db: Session = Depends(get_db)):
         models.Routing.status == models.RoutingStatus.ACTIVE
     ).all()
     
-    return routings
\ No newline at end of file
+    return routings
+
+
+# ---------------------------------------------------------------------------
+# Bulk import (legacy migration)
+# ---------------------------------------------------------------------------
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+def iter_import_rows(stream, format: str):
+    """Yield (line number, raw row dict) from a CSV or NDJSON byte stream, one line at a time.
+
+    CSV: one row per operation, routing columns repeated (routing_id, material_id,
+    routing_description, version, plant, status, operation_id, work_center_id,
+    operation_description, sequence, setup_time, machine_time, labor_time, control_key).
+    NDJSON: one routing per line, shaped like RoutingCreate. A row without
+    operation_id only upserts the routing header. Unparseable lines yield a ValueError.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="" if format == "csv" else None)
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for raw in reader:
+            yield reader.line_num, raw
+        return
+
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            routing = json.loads(line)
+            if not isinstance(routing, dict):
+                raise ValueError("line is not a JSON object")
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+            continue
+        header = {
+            "routing_id": routing.get("routing_id"),
+            "material_id": routing.get("material_id"),
+            "routing_description": routing.get("description"),
+            "version": routing.get("version"),
+            "plant": routing.get("plant"),
+            "status": routing.get("status")
+        }
+        operations = routing.get("operations") or []
+        if not isinstance(operations, list):
+            yield line_no, ValueError("operations must be a list")
+            continue
+        if not operations:
+            yield line_no, header
+        for op in operations:
+            if not isinstance(op, dict):
+                yield line_no, ValueError("operation is not a JSON object")
+                continue
+            yield line_no, {**header, **op, "operation_description": op.get("description")}
+
+def _text(raw: dict, key: str, required: bool = False):
+    value = raw.get(key)
+    value = str(value).strip() if value is not None else ""
+    if not value:
+        if required:
+            raise ValueError(f"{key} is required")
+        return None
+    return value
+
+def _minutes(raw: dict, key: str) -> float:
+    value = _text(raw, key)
+    if value is None:
+        return 0.0
+    try:
+        minutes = float(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a number")
+    if minutes < 0:
+        raise ValueError(f"{key} must not be negative")
+    return minutes
+
+def parse_import_row(raw: dict) -> dict:
+    """Validated, typed import row; raises ValueError"""
+    status = _text(raw, "status")
+    try:
+        status = models.RoutingStatus(status.upper()) if status else None
+    except ValueError:
+        raise ValueError(f"unknown routing status {status}")
+
+    row = {
+        "routing_id": _text(raw, "routing_id", required=True),
+        "material_id": _text(raw, "material_id", required=True),
+        "description": _text(raw, "routing_description") or _text(raw, "description"),
+        "version": _text(raw, "version"),
+        "plant": _text(raw, "plant"),
+        "status": status,
+        "operation": None
+    }
+    operation_id = _text(raw, "operation_id")
+    if operation_id:
+        sequence = _text(raw, "sequence", required=True)
+        try:
+            sequence = int(sequence)
+        except ValueError:
+            raise ValueError("sequence must be an integer")
+        row["operation"] = {
+            "operation_id": operation_id,
+            "work_center_id": _text(raw, "work_center_id", required=True),
+            "description": _text(raw, "operation_description"),
+            "sequence": sequence,
+            "setup_time": _minutes(raw, "setup_time"),
+            "machine_time": _minutes(raw, "machine_time"),
+            "labor_time": _minutes(raw, "labor_time"),
+            "control_key": _text(raw, "control_key") or "PP01"
+        }
+    return row
+
+class ImportReport:
+    """Counters and a bounded list of row errors of one import"""
+
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.counts = {
+            "rows_read": 0, "rows_failed": 0, "chunks": 0,
+            "routings_created": 0, "routings_updated": 0,
+            "operations_created": 0, "operations_updated": 0
+        }
+        self.errors = []
+
+    def error(self, line: int, row: Optional[dict], message: str):
+        self.counts["rows_failed"] += 1
+        if len(self.errors) < self.max_errors:
+            operation = (row or {}).get("operation") or {}
+            self.errors.append({
+                "line": line,
+                "routing_id": (row or {}).get("routing_id"),
+                "operation_id": operation.get("operation_id"),
+                "error": message
+            })
+
+def import_chunk(db: Session, rows: list, work_centers: set, known_materials: set,
+                 report: ImportReport, dry_run: bool = False):
+    """Validate and upsert one chunk of parsed rows with set lookups and executemany statements"""
+    unseen = {row["material_id"] for _, row in rows} - known_materials
+    if unseen:
+        known_materials.update(m for (m,) in db.query(models.Material.materialId).filter(
+            models.Material.materialId.in_(unseen)
+        ))
+
+    existing_routings = {
+        routing_id: material_id for routing_id, material_id in db.query(
+            models.Routing.routing_id, models.Routing.material_id
+        ).filter(models.Routing.routing_id.in_({row["routing_id"] for _, row in rows}))
+    }
+
+    headers, operations, lines = {}, {}, []
+    for line, row in rows:
+        routing_id, material_id = row["routing_id"], row["material_id"]
+        if material_id not in known_materials:
+            report.error(line, row, f"Material {material_id} not found")
+            continue
+        owner = existing_routings.get(routing_id) or headers.get(routing_id, {}).get("material_id")
+        if owner and owner != material_id:
+            report.error(line, row, f"Routing {routing_id} belongs to material {owner}")
+            continue
+        operation = row["operation"]
+        if operation and operation["work_center_id"] not in work_centers:
+            report.error(line, row, f"Work center {operation['work_center_id']} not found")
+            continue
+
+        header = headers.setdefault(routing_id, {"routing_id": routing_id, "material_id": material_id})
+        for field in ("description", "version", "plant", "status"):
+            if row[field] is not None:
+                header[field] = row[field]
+        if operation:
+            operations[(routing_id, operation["operation_id"])] = {**operation, "routing_id": routing_id}
+        lines.append((line, row))
+
+    existing_operations = {}
+    if operations:
+        existing_operations = {
+            (routing_id, operation_id): op_pk for op_pk, routing_id, operation_id in db.query(
+                models.Operation.id, models.Operation.routing_id, models.Operation.operation_id
+            ).filter(models.Operation.routing_id.in_({key[0] for key in operations}))
+        }
+
+    new_routings = [h for routing_id, h in headers.items() if routing_id not in existing_routings]
+    changed_routings = [h for routing_id, h in headers.items() if routing_id in existing_routings]
+    new_operations = [op for key, op in operations.items() if key not in existing_operations]
+    changed_operations = [
+        {**op, "op_pk": existing_operations[key]} for key, op in operations.items() if key in existing_operations
+    ]
+
+    if not dry_run:
+        routings = models.Routing.__table__
+        operations_table = models.Operation.__table__
+        try:
+            if new_routings:
+                db.execute(insert(routings), [{
+                    "description": None, "version": "001", "plant": None,
+                    "status": models.RoutingStatus.ACTIVE, **h, "revision": 1
+                } for h in new_routings])
+            # One executemany per set of supplied header fields; every touched routing gets a new revision
+            by_fields = {}
+            for h in changed_routings:
+                by_fields.setdefault(tuple(sorted(set(h) - {"routing_id", "material_id"})), []).append(h)
+            for fields, params in by_fields.items():
+                db.execute(
+                    update(routings).where(routings.c.routing_id == bindparam("b_routing_id")).values(
+                        revision=func.coalesce(routings.c.revision, 1) + 1,
+                        **{field: bindparam(f"b_{field}") for field in fields}
+                    ),
+                    [{f"b_{key}": value for key, value in h.items() if key != "material_id"} for h in params]
+                )
+            if new_operations:
+                db.execute(insert(operations_table), [
+                    {**op, "status": models.OperationStatus.ACTIVE} for op in new_operations
+                ])
+            if changed_operations:
+                fields = ("work_center_id", "description", "sequence", "setup_time", "machine_time", "labor_time", "control_key")
+                db.execute(
+                    update(operations_table).where(operations_table.c.id == bindparam("b_op_pk")).values(
+                        **{field: bindparam(f"b_{field}") for field in fields}
+                    ),
+                    [{f"b_{field}": op[field] for field in fields + ("op_pk",)} for op in changed_operations]
+                )
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            for line, row in lines:
+                report.error(line, row, f"Chunk failed: {e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e}")
+            return
+        for routing_id in headers:
+            routing_cache.invalidate(routing_id)
+
+    report.counts["routings_created"] += len(new_routings)
+    report.counts["routings_updated"] += len(changed_routings)
+    report.counts["operations_created"] += len(new_operations)
+    report.counts["operations_updated"] += len(changed_operations)
+
+@router.post("/import")
+def import_routings(
+    file: UploadFile = File(...),
+    format: str = None,
+    chunk_size: int = 1000,
+    dry_run: bool = False,
+    max_errors: int = 1000,
+    db: Session = Depends(get_db)
+):
+    """Streaming bulk upsert of routings and operations from a CSV or NDJSON file.
+
+    The file is parsed line by line and written in chunks of about chunk_size rows
+    (cut between routings), each committed on its own, so memory stays bounded by
+    the chunk size. Routings are
+    upserted by routing_id, operations by (routing_id, operation_id). Rows that fail
+    validation are skipped and reported (up to max_errors); dry_run only validates.
+    """
+
+    if chunk_size < 1 or chunk_size > 10000:
+        raise HTTPException(status_code=400, detail="chunk_size must be between 1 and 10000")
+    if max_errors < 0 or max_errors > 100000:
+        raise HTTPException(status_code=400, detail="max_errors must be between 0 and 100000")
+
+    filename = (file.filename or "").lower()
+    if format is None:
+        if filename.endswith(".csv") or (file.content_type or "").endswith("csv"):
+            format = "csv"
+        elif filename.endswith((".ndjson", ".jsonl")) or "ndjson" in (file.content_type or ""):
+            format = "ndjson"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+
+    started = time.perf_counter()
+    report = ImportReport(max_errors)
+    work_centers = {wc_id for (wc_id,) in db.query(models.WorkCenter.workCenterId)}
+    known_materials = set()
+
+    chunk = []
+    for line, raw in iter_import_rows(file.file, format):
+        report.counts["rows_read"] += 1
+        if isinstance(raw, ValueError):
+            report.error(line, None, str(raw))
+            continue
+        try:
+            row = parse_import_row(raw)
+        except ValueError as e:
+            report.error(line, {"routing_id": raw.get("routing_id")}, str(e))
+            continue
+        # Cut chunks between routings so a routing's rows are written together
+        if len(chunk) >= chunk_size and row["routing_id"] != chunk[-1][1]["routing_id"]:
+            import_chunk(db, chunk, work_centers, known_materials, report, dry_run)
+            report.counts["chunks"] += 1
+            chunk = []
+        chunk.append((line, row))
+    if chunk:
+        import_chunk(db, chunk, work_centers, known_materials, report, dry_run)
+        report.counts["chunks"] += 1
+
+    return {
+        "format": format,
+        "dry_run": dry_run,
+        **report.counts,
+        "errors": report.errors,
+        "errors_truncated": report.counts["rows_failed"] > len(report.errors),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -0,0 +1,336 @@
+"""
+FINITE CAPACITY SCHEDULING (CM21-style)
+
+Sequences the operations of released and in-progress production orders onto their
+work centers with finite capacity and writes the resulting plannedStartDate /
+plannedEndDate back to the orders.
+
+- Orders are dispatched from a heap by priority (URGENT first), then due date
+- An order's operations are scheduled in Operation.sequence order: each starts when
+  its predecessor has ended and its work center has capacity left (forward scheduling)
+- Daily capacity = WorkCenter.capacity (hours) x efficiency / 100, available from
+  SCHEDULING_SHIFT_START_HOUR on; operation load = (setup + quantity x machine) / 60 hours
+- Operations with a posted FINAL confirmation are done and not scheduled
+- A run for one plant first books the stored operations of other plants' orders on
+  the work centers it uses, so shared work centers are not double-booked
+
+Incremental rescheduling: every scheduled operation is stored with its order's
+position in the dispatch sequence and a fingerprint of the order's scheduling inputs
+(priority, due date, quantity, routing revision, finished operations, work center
+capacities and other plants' bookings on them). A run keeps the bookings of the longest unchanged prefix of the dispatch
+sequence and reschedules only from the first changed, added or removed order on, or
+from the first order whose stored bookings start before the scheduling start.
+
+API Endpoints:
+- POST /api/scheduling/run - Schedule orders (mode=incremental|full), write back planned dates
+- GET /api/scheduling/operations - Scheduled operations (dispatch list), by work center
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import insert, or_
+from database import models, get_db
+from routers.capacity import finished_operations
+from utils import config
+from utils.order_events import bulk_update_orders
+from utils.routing_cache import active_routing_ids, routing_cache
+from datetime import datetime, date, timedelta
+import hashlib
+import heapq
+import time
+
+router = APIRouter(prefix="/api/scheduling", tags=["Capacity Scheduling"])
+
+SCHEDULED_STATUSES = [models.OrderStatus.RELEASED, models.OrderStatus.IN_PROGRESS]
+PRIORITY_RANK = {
+    models.OrderPriority.URGENT: 0,
+    models.OrderPriority.HIGH: 1,
+    models.OrderPriority.MEDIUM: 2,
+    models.OrderPriority.LOW: 3
+}
+EPSILON = 1e-9
+
+class WorkCenterCalendar:
+    """Booked capacity of one work center, as a fill level in hours per day"""
+
+    def __init__(self, hours_per_day: float, shift_start: float):
+        self.hours_per_day = hours_per_day
+        self.shift_start = shift_start
+        # Clock hours over which a day's capacity is laid out
+        self.span = min(hours_per_day, 24.0 - shift_start)
+        self.booked = {}  # day ordinal -> booked hours
+
+    def _position(self, moment: datetime):
+        """(day ordinal, capacity hours of that day before `moment`)"""
+        day = moment.date()
+        offset = (moment - datetime.combine(day, datetime.min.time())).total_seconds() / 3600 - self.shift_start
+        return day.toordinal(), min(max(offset, 0.0), self.span) / self.span * self.hours_per_day
+
+    def _moment(self, day: int, hours: float) -> datetime:
+        return datetime.combine(date.fromordinal(day), datetime.min.time()) + timedelta(
+            hours=self.shift_start + hours / self.hours_per_day * self.span
+        )
+
+    def book(self, ready: datetime, load_hours: float):
+        """Book load_hours at the earliest capacity from `ready` on; returns (start, end)"""
+        day, position = self._position(ready)
+        position = max(position, self.booked.get(day, 0.0))
+        while position >= self.hours_per_day - EPSILON:
+            day += 1
+            position = self.booked.get(day, 0.0)
+        start = self._moment(day, position)
+
+        remaining = load_hours
+        while remaining > self.hours_per_day - position + EPSILON:
+            remaining -= self.hours_per_day - position
+            self.booked[day] = self.hours_per_day
+            day += 1
+            position = self.booked.get(day, 0.0)
+        position += remaining
+        self.booked[day] = position
+        return start, self._moment(day, position)
+
+def dispatch_key(order: models.ProductionOrder):
+    return (PRIORITY_RANK.get(order.priority, 2), order.dueDate or datetime.max, order.orderId)
+
+def order_fingerprint(order: models.ProductionOrder, routing, operations, capacity: dict, reserved: dict) -> str:
+    """Hash of everything the order's schedule depends on besides the orders dispatched before it"""
+    inputs = (
+        order.orderId, order.priority, order.dueDate, order.quantity, routing.routing_id, routing.revision,
+        tuple(
+            (op.operation_id, op.work_center_id, capacity[op.work_center_id], reserved.get(op.work_center_id))
+            for op in operations
+        )
+    )
+    return hashlib.sha1(repr(inputs).encode()).hexdigest()[:16]
+
+def scheduled_rows_query(db: Session, plant: str = None):
+    query = db.query(models.ScheduledOperation)
+    if plant:
+        query = query.filter(models.ScheduledOperation.plant == plant)
+    return query
+
+@router.post("/run")
+def run_scheduling(plant: str = None, mode: str = "incremental", start: datetime = None, db: Session = Depends(get_db)):
+    """Finite forward scheduling of released orders, writing back planned start/end dates.
+
+    mode=incremental keeps the stored schedule of orders ahead of the first changed
+    order in the dispatch sequence, as long as it starts at or after `start`; mode=full reschedules everything from `start`
+    (default now).
+    """
+
+    if mode not in ("incremental", "full"):
+        raise HTTPException(status_code=400, detail="mode must be 'incremental' or 'full'")
+
+    started = time.perf_counter()
+    schedule_start = start or datetime.now()
+
+    query = db.query(models.ProductionOrder).filter(models.ProductionOrder.status.in_(SCHEDULED_STATUSES))
+    if plant:
+        query = query.filter(models.ProductionOrder.plant == plant)
+    orders = query.all()
+
+    routing_by_material = active_routing_ids(db, {o.materialId for o in orders if not o.routingId})
+    routing_ids = {o.orderId: o.routingId or routing_by_material.get(o.materialId) for o in orders}
+    routings = routing_cache.get_many(db, set(routing_ids.values()))
+    finished = finished_operations(
+        db, [o.orderId for o in orders if o.status == models.OrderStatus.IN_PROGRESS]
+    )
+
+    shift_start = config.settings.scheduling_shift_start_hour
+    capacity = {
+        wc.workCenterId: float(wc.capacity or 0) * float(wc.efficiency if wc.efficiency is not None else 100.0) / 100.0
+        for wc in db.query(models.WorkCenter).all()
+    }
+    calendars = {}
+
+    def calendar(work_center_id: str) -> WorkCenterCalendar:
+        if work_center_id not in calendars:
+            calendars[work_center_id] = WorkCenterCalendar(capacity[work_center_id], shift_start)
+        return calendars[work_center_id]
+
+    # Plant-scoped run: other plants' orders keep their stored bookings on shared work centers
+    reserved = {}  # work center -> hash of the bookings of other plants
+    if plant:
+        used = {op.work_center_id for routing in routings.values() if routing for op in routing.operations}
+        bookings = {}
+        for row in db.query(
+            models.ScheduledOperation.work_center_id, models.ScheduledOperation.start_time,
+            models.ScheduledOperation.load_hours
+        ).filter(
+            or_(models.ScheduledOperation.plant != plant, models.ScheduledOperation.plant.is_(None)),
+            models.ScheduledOperation.work_center_id.in_(used),
+            models.ScheduledOperation.end_time > schedule_start
+        ).order_by(models.ScheduledOperation.start_time, models.ScheduledOperation.id).all():
+            if capacity.get(row.work_center_id, 0.0) > 0:
+                calendar(row.work_center_id).book(row.start_time, row.load_hours)
+                bookings.setdefault(row.work_center_id, []).append((row.start_time, row.load_hours))
+        reserved = {wc: hashlib.sha1(repr(rows).encode()).hexdigest()[:16] for wc, rows in bookings.items()}
+
+    # Dispatch heap of (priority, due date, order) over all schedulable orders
+    heap, jobs, unscheduled = [], {}, []
+    for order in orders:
+        routing = routings.get(routing_ids[order.orderId])
+        if not routing or not routing.operations:
+            unscheduled.append({"order_id": order.orderId, "reason": "no routing with operations"})
+            continue
+        operations = [op for op in routing.operations if (order.orderId, op.operation_id) not in finished]
+        if not operations:
+            unscheduled.append({"order_id": order.orderId, "reason": "all operations finally confirmed"})
+            continue
+        blocked = next((op.work_center_id for op in operations if capacity.get(op.work_center_id, 0.0) <= 0), None)
+        if blocked:
+            unscheduled.append({"order_id": order.orderId, "reason": f"work center {blocked} has no capacity"})
+            continue
+        jobs[order.orderId] = (order, operations, order_fingerprint(order, routing, operations, capacity, reserved))
+        heap.append((dispatch_key(order), order.orderId))
+    heapq.heapify(heap)
+
+    previous = []  # [(order_id, fingerprint, rows)] in dispatch order
+    if mode == "incremental":
+        for row in scheduled_rows_query(db, plant).with_entities(
+            models.ScheduledOperation.id, models.ScheduledOperation.dispatch_position,
+            models.ScheduledOperation.order_id, models.ScheduledOperation.order_fingerprint,
+            models.ScheduledOperation.work_center_id, models.ScheduledOperation.load_hours,
+            models.ScheduledOperation.start_time, models.ScheduledOperation.end_time
+        ).order_by(
+            models.ScheduledOperation.dispatch_position, models.ScheduledOperation.order_id,
+            models.ScheduledOperation.sequence
+        ).all():
+            if not previous or (previous[-1][0], previous[-1][2][0].dispatch_position) != (row.order_id, row.dispatch_position):
+                previous.append((row.order_id, row.order_fingerprint, []))
+            previous[-1][2].append(row)
+
+    kept = 0
+    new_rows, order_dates = [], {}
+    now = datetime.now()
+    while heap:
+        _, order_id = heapq.heappop(heap)
+        order, operations, fingerprint = jobs[order_id]
+        position = len(order_dates)
+
+        if (position == kept and kept < len(previous) and previous[kept][:2] == (order_id, fingerprint)
+                and previous[kept][2][0].dispatch_position == kept
+                and min(row.start_time for row in previous[kept][2]) >= schedule_start):
+            # Unchanged prefix not yet started: replay the stored bookings into the calendars
+            for row in previous[kept][2]:
+                calendar(row.work_center_id).book(row.start_time, row.load_hours)
+            order_dates[order_id] = (previous[kept][2][0].start_time, previous[kept][2][-1].end_time)
+            kept += 1
+            continue
+
+        ready = schedule_start
+        first_start = None
+        for op in operations:
+            load_hours = ((op.setup_time or 0.0) + float(order.quantity or 0) * (op.machine_time or 0.0)) / 60.0
+            op_start, ready = calendar(op.work_center_id).book(ready, load_hours)
+            first_start = first_start or op_start
+            new_rows.append({
+                "plant": order.plant,
+                "dispatch_position": position,
+                "order_id": order_id,
+                "order_fingerprint": fingerprint,
+                "operation_id": op.operation_id,
+                "sequence": op.sequence,
+                "work_center_id": op.work_center_id,
+                "load_hours": load_hours,
+                "start_time": op_start,
+                "end_time": ready,
+                "scheduled_at": now
+            })
+        order_dates[order_id] = (first_start, ready)
+
+    # Write back: stored schedule from the first change on, planned dates of orders that moved
+    scheduled_rows_query(db, plant).filter(
+        models.ScheduledOperation.dispatch_position >= kept
+    ).delete(synchronize_session=False)
+    stale_ids = [row.id for _, _, rows in previous[kept:] for row in rows if row.dispatch_position < kept]
+    if stale_ids:
+        db.query(models.ScheduledOperation).filter(
+            models.ScheduledOperation.id.in_(stale_ids)
+        ).delete(synchronize_session=False)
+    if new_rows:
+        db.execute(insert(models.ScheduledOperation.__table__), new_rows)
+
+    updates, late = [], []
+    for order_id, (planned_start, planned_end) in order_dates.items():
+        order = jobs[order_id][0]
+        values = {"plannedEndDate": planned_end}
+        if order.actualStartDate is None:
+            values["plannedStartDate"] = planned_start
+        updates.append((order, values))
+        if order.dueDate and planned_end > order.dueDate:
+            late.append({
+                "order_id": order_id,
+                "priority": order.priority.value if order.priority else None,
+                "due_date": order.dueDate,
+                "planned_end_date": planned_end,
+                "days_late": round((planned_end - order.dueDate).total_seconds() / 86400, 2)
+            })
+
+    try:
+        updated = bulk_update_orders(db, updates, "SCHEDULING", "Finite capacity scheduling run")
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Orders were changed while scheduling; run the scheduling again")
+
+    return {
+        "mode": mode,
+        "schedule_start": schedule_start,
+        "summary": {
+            "orders": len(orders),
+            "scheduled_orders": len(order_dates),
+            "kept_orders": kept,
+            "rescheduled_orders": len(order_dates) - kept,
+            "operations_scheduled": len(new_rows),
+            "updated_orders": updated,
+            "late_orders": len(late),
+            "unscheduled_orders": len(unscheduled),
+            "compute_ms": round((time.perf_counter() - started) * 1000, 1)
+        },
+        "late_orders": sorted(late, key=lambda entry: -entry["days_late"]),
+        "unscheduled": unscheduled
+    }
+
+@router.get("/operations")
+def list_scheduled_operations(
+    work_center_id: str = None,
+    plant: str = None,
+    order_id: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    limit: int = 500,
+    db: Session = Depends(get_db)
+):
+    """Dispatch list: scheduled operations in start time order"""
+
+    if limit < 1 or limit > 5000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 5000")
+
+    query = scheduled_rows_query(db, plant)
+    if work_center_id:
+        query = query.filter(models.ScheduledOperation.work_center_id == work_center_id)
+    if order_id:
+        query = query.filter(models.ScheduledOperation.order_id == order_id)
+    if date_from:
+        query = query.filter(models.ScheduledOperation.end_time >= date_from)
+    if date_to:
+        query = query.filter(models.ScheduledOperation.start_time <= date_to)
+
+    return [
+        {
+            "order_id": row.order_id,
+            "operation_id": row.operation_id,
+            "sequence": row.sequence,
+            "work_center_id": row.work_center_id,
+            "dispatch_position": row.dispatch_position,
+            "load_hours": round(row.load_hours, 3),
+            "start_time": row.start_time,
+            "end_time": row.end_time,
+            "scheduled_at": row.scheduled_at
+        } for row in query.order_by(
+            models.ScheduledOperation.start_time, models.ScheduledOperation.dispatch_position
+        ).limit(limit).all()
+    ]
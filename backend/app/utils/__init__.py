@@ -1,3 +1,3 @@
-__all__ = ["config", "websocket_manager"]
+__all__ = ["config", "websocket_manager", "event_bus", "confirmation_journal"]
 
-from . import config, websocket_manager
\ No newline at end of file
+from . import config, websocket_manager, event_bus, confirmation_journal
\ No newline at end of file
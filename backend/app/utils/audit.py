@@ -0,0 +1,112 @@
+"""
+WRITE-BEHIND AUDIT LOG FOR ORDER CHANGES (CO02)
+
+Field changes are collected in memory on the session while a request runs
+(record_change) and written when it commits, inside the same transaction: one
+compact OrderChangeHistory row per order and transaction, holding a JSON diff
+{field: {"old": ..., "new": ..., "type": ...}}, in a single executemany. Audit rows are therefore
+durable exactly when the change is, without one row per field. A row whose fields
+were changed with different change types is stored as change_type "BULK", with its
+types listed in order_change_history_types for the history search.
+
+Readers use expand_history_row(), which turns compact rows into the per-field
+entries of the history API and passes legacy per-field rows through unchanged.
+"""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from database import models
+
+def record_change(db: Session, order: models.ProductionOrder, change_type: str, field_name: str,
+                  old_value: Optional[str], new_value: Optional[str], reason: Optional[str] = None,
+                  changed_by: str = "SYSTEM") -> str:
+    """Buffer one field change of an order; returns the change ID of the order's audit row"""
+    buffer: Dict[str, Dict[str, Any]] = db.info.setdefault("audit_buffer", {})
+    entry = buffer.get(order.orderId)
+    if entry is None:
+        entry = buffer[order.orderId] = {
+            "change_id": f"CHG{uuid.uuid4().hex[:8].upper()}",
+            "order_id": order.orderId,
+            "plant": order.plant,
+            "change_types": [],
+            "reasons": [],
+            "changes": {},
+            "changed_by": changed_by,
+            "change_timestamp": datetime.now()
+        }
+
+    if change_type not in entry["change_types"]:
+        entry["change_types"].append(change_type)
+    if reason and reason not in entry["reasons"]:
+        entry["reasons"].append(reason)
+    if field_name in entry["changes"]:
+        # Keep the value before the first change
+        entry["changes"][field_name].update({"new": new_value, "type": change_type})
+    else:
+        entry["changes"][field_name] = {"old": old_value, "new": new_value, "type": change_type}
+    return entry["change_id"]
+
+def buffered_change(db: Session, order_id: str) -> Optional[Dict[str, Any]]:
+    """Audit entry buffered for an order in the current transaction (None once written)"""
+    return db.info.get("audit_buffer", {}).get(order_id)
+
+@event.listens_for(Session, "before_commit")
+def _write_audit_buffer(session: Session):
+    buffer = session.info.pop("audit_buffer", None)
+    if not buffer:
+        return
+
+    # Flush first so the order change sets (utils/order_events.py) exist to link to
+    session.flush()
+    change_set_ids = (session.info.get("order_change_context") or {}).get("change_set_ids", {})
+
+    session.execute(insert(models.OrderChangeHistory), [
+        {
+            "change_id": entry["change_id"],
+            "change_set_id": change_set_ids.get(entry["order_id"]),
+            "order_id": entry["order_id"],
+            "plant": entry["plant"],
+            "change_type": entry["change_types"][0] if len(entry["change_types"]) == 1 else "BULK",
+            "field_name": ",".join(entry["changes"]),
+            "changes": entry["changes"],
+            "reason": "; ".join(entry["reasons"]) or None,
+            "changed_by": entry["changed_by"],
+            "change_timestamp": entry["change_timestamp"]
+        } for entry in buffer.values()
+    ])
+    mixed_types = [
+        {"change_id": entry["change_id"], "change_type": change_type}
+        for entry in buffer.values() if len(entry["change_types"]) > 1
+        for change_type in entry["change_types"]
+    ]
+    if mixed_types:
+        session.execute(insert(models.OrderChangeHistoryType), mixed_types)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_audit_buffer(session: Session):
+    session.info.pop("audit_buffer", None)
+
+def expand_history_row(change: models.OrderChangeHistory) -> List[Dict[str, Any]]:
+    """Per-field history entries of a compact or legacy audit row"""
+    base = {
+        "change_id": change.change_id,
+        "change_set_id": change.change_set_id,
+        "order_id": change.order_id,
+        "plant": change.plant,
+        "change_type": change.change_type,
+        "reason": change.reason,
+        "changed_by": change.changed_by,
+        "change_timestamp": change.change_timestamp
+    }
+    if not change.changes:
+        return [{**base, "field_name": change.field_name, "old_value": change.old_value, "new_value": change.new_value}]
+    return [
+        {**base, "change_type": diff.get("type", change.change_type), "field_name": field,
+         "old_value": diff.get("old"), "new_value": diff.get("new")}
+        for field, diff in change.changes.items()
+    ]
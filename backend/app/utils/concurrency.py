@@ -0,0 +1,41 @@
+"""
+OPTIMISTIC CONCURRENCY CONTROL
+
+Versioned rows (ProductionOrder, Stock) carry a `version` column that SQLAlchemy
+checks and increments on every UPDATE (version_id_col). Clients send the version they
+read back in an If-Match header; a mismatch - or a concurrent update caught at flush
+time as StaleDataError - is answered with 409 and the row's current state, so the
+client can merge and retry. No lock is held between reading and writing a row.
+"""
+
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, Response
+
+def etag(version: Optional[int]) -> str:
+    return f'"{version}"'
+
+def set_etag(response: Response, version: Optional[int]):
+    response.headers["ETag"] = etag(version)
+
+def conflict(message: str, current: Dict[str, Any]) -> HTTPException:
+    """409 response carrying the current state (JSON-serializable dict) of the row"""
+    return HTTPException(
+        status_code=409,
+        detail={
+            "message": message,
+            "current_version": current.get("version"),
+            "current": current
+        }
+    )
+
+def check_if_match(if_match: Optional[str], version: Optional[int], current: Dict[str, Any]):
+    """Raise 409 unless the If-Match header (if any) matches the row's version"""
+    if not if_match or if_match.strip() == "*":
+        return
+    accepted = {tag.strip().removeprefix("W/").strip('"') for tag in if_match.split(",")}
+    if str(version) not in accepted:
+        raise conflict(
+            f"Version mismatch: If-Match {if_match} but current version is {version}",
+            current
+        )
@@ -3,6 +3,34 @@ import os
 
 class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///default.db")
+    # CO11N high-rate ingestion journal
+    confirmation_journal_path: str = os.getenv("CONFIRMATION_JOURNAL_PATH", "confirmation_journal.ndjson")
+    confirmation_journal_batch_size: int = int(os.getenv("CONFIRMATION_JOURNAL_BATCH_SIZE", "500"))
+    confirmation_journal_max_wait: float = float(os.getenv("CONFIRMATION_JOURNAL_MAX_WAIT", "0.2"))
+    confirmation_journal_max_attempts: int = int(os.getenv("CONFIRMATION_JOURNAL_MAX_ATTEMPTS", "5"))
+    # Routing master data cache
+    routing_cache_size: int = int(os.getenv("ROUTING_CACHE_SIZE", "1024"))
+    routing_cache_revalidate_seconds: float = float(os.getenv("ROUTING_CACHE_REVALIDATE_SECONDS", "5"))
+    # Finite capacity scheduling
+    scheduling_shift_start_hour: float = float(os.getenv("SCHEDULING_SHIFT_START_HOUR", "6"))
+    # MRP lead times when master data has none (days)
+    mrp_default_production_days: int = int(os.getenv("MRP_DEFAULT_PRODUCTION_DAYS", "7"))
+    mrp_default_delivery_days: int = int(os.getenv("MRP_DEFAULT_DELIVERY_DAYS", "3"))
+    # WebSocket delivery: per-connection outbound queue, policy when it is full (drop, coalesce, disconnect)
+    ws_send_queue_size: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    ws_slow_consumer_policy: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "coalesce")
+    ws_send_timeout_seconds: float = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+    ws_replay_buffer_size: int = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))  # Events kept for resume
+    ws_coalesce_window_ms: int = int(os.getenv("WS_COALESCE_WINDOW_MS", "250"))  # Batch protocol clients
+    # Event sharing between workers: local (single worker) or postgres (LISTEN/NOTIFY)
+    event_bus_backend: str = os.getenv("EVENT_BUS_BACKEND", "local")
+    event_bus_channel: str = os.getenv("EVENT_BUS_CHANNEL", "sap_events")
+    # Dashboard KPI results (per worker process)
+    kpi_cache_ttl_seconds: float = float(os.getenv("KPI_CACHE_TTL_SECONDS", "30"))
+    # OEE: shift length (shifts start at SCHEDULING_SHIFT_START_HOUR) and closed days kept in memory
+    oee_shift_hours: float = float(os.getenv("OEE_SHIFT_HOURS", "8"))
+    oee_cache_days: int = int(os.getenv("OEE_CACHE_DAYS", "400"))
+    oee_revalidate_seconds: float = float(os.getenv("OEE_REVALIDATE_SECONDS", "5"))
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), ".env")
@@ -0,0 +1,403 @@
+"""
+CONFIRMATION INGESTION JOURNAL (CO11N high-rate mode)
+
+Machine terminals post a confirmation per cycle. Instead of one DB commit per call,
+ingested confirmations are appended to a local append-only journal (NDJSON) and
+acknowledged once fsync'ed. A single consumer thread drains the journal in
+micro-batches, posts each batch in one DB transaction and then publishes the results.
+
+- Appends from concurrent requests share fsyncs (group commit)
+- Several worker processes can append to the same journal; an exclusive file lock
+  elects exactly one of them as the consumer
+- The committed byte offset and line count are checkpointed after every batch, and
+  the journal is truncated once fully drained
+- Each entry carries an ingest_id so a batch replayed after a crash is not posted twice
+- A batch that keeps failing is posted entry by entry; entries that still fail are
+  reported as FAILED instead of blocking the journal
+- FAILED results are kept in a failed-entries file (with their payload), written before
+  the checkpoint moves past them, so every worker can answer for them after a restart
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils import config
+from utils.event_bus import bus
+
+logger = logging.getLogger(__name__)
+
+class ConfirmationJournal:
+    def __init__(self, path: str, batch_size: int = 500, max_wait: float = 0.2,
+                 compact_threshold: int = 64 * 1024 * 1024, recent_results: int = 10000,
+                 max_attempts: int = 5):
+        self.path = path
+        self.checkpoint_path = f"{path}.checkpoint"
+        self.lock_path = f"{path}.lock"
+        self.failed_path = f"{path}.failed"
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.compact_threshold = compact_threshold
+        self.max_attempts = max_attempts  # failed attempts before a batch is posted entry by entry
+
+        self._fd: Optional[int] = None
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0  # bytes appended by this process
+        self._synced = 0   # bytes appended by this process that are known to be fsync'ed
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._processor: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+        self._is_consumer = False
+
+        self._scan_lock = threading.Lock()
+        self._scanned_bytes = 0  # journal bytes whose lines are counted in _scanned_lines (stats)
+        self._scanned_lines = 0
+        self._scanned_committed_lines = 0
+
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._recent_results = recent_results
+        self._counters = {
+            "entries_ingested": 0,
+            "entries_processed": 0,
+            "entries_failed": 0,
+            "batches_committed": 0,
+            "last_batch_size": 0,
+            "last_commit_ms": 0.0,
+        }
+
+    # Producer side
+    def _open(self) -> int:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def append(self, payloads: List[Dict[str, Any]]) -> List[str]:
+        """Durably append confirmation payloads and return their ingest IDs"""
+        now = datetime.now().isoformat()
+        ingest_ids = []
+        lines = []
+        for payload in payloads:
+            ingest_id = f"ING{uuid.uuid4().hex[:12].upper()}"
+            ingest_ids.append(ingest_id)
+            lines.append(json.dumps({"ingest_id": ingest_id, "enqueued_at": now, "payload": payload}, default=str))
+        data = ("\n".join(lines) + "\n").encode()
+
+        with self._write_lock:
+            fd = self._open()
+            # Shared lock: appenders never block each other, only the consumer's truncation
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            try:
+                os.write(fd, data)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._written += len(data)
+            position = self._written
+            self._counters["entries_ingested"] += len(payloads)
+
+        self._sync_up_to(position)
+        self._wakeup.set()
+        return ingest_ids
+
+    def _sync_up_to(self, position: int):
+        """Group commit: one fsync covers every append that happened before it started"""
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._write_lock:
+                target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+
+    # Consumer side
+    def start(self, processor: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]):
+        """Start the background consumer (it idles unless it wins the consumer lock)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._processor = processor
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="confirmation-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _read_checkpoint(self) -> Tuple[int, int]:
+        """(committed byte offset, committed line count); checkpoints without a count count as 0 lines"""
+        try:
+            with open(self.checkpoint_path) as f:
+                fields = f.read().split()
+            return int(fields[0]) if fields else 0, int(fields[1]) if len(fields) > 1 else 0
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+
+    def _write_checkpoint(self, offset: int, lines: int):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{offset} {lines}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _read_batch(self, offset: int):
+        """Read up to batch_size complete lines starting at offset; returns (entries, next offset, lines read)"""
+        entries = []
+        lines = 0
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                while len(entries) < self.batch_size:
+                    line = f.readline()
+                    if not line or not line.endswith(b"\n"):
+                        break  # nothing more, or a line still being written
+                    offset += len(line)
+                    lines += 1
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.error(f"Skipping corrupt journal line ending at offset {offset}")
+        except FileNotFoundError:
+            pass
+        return entries, offset, lines
+
+    def _lines_before(self, offset: int) -> int:
+        lines = 0
+        try:
+            with open(self.path, "rb") as f:
+                for chunk in iter(lambda: f.read(min(1024 * 1024, offset - f.tell())), b""):
+                    lines += chunk.count(b"\n")
+        except FileNotFoundError:
+            pass
+        return lines
+
+    def _compact(self, offset: int) -> int:
+        """Truncate the journal once everything in it has been committed"""
+        if offset < self.compact_threshold:
+            return offset
+        with open(self.path, "rb+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_size != offset:
+                    return offset
+                # Checkpoint first: a crash before the truncation only replays committed
+                # entries (deduplicated by ingest_id), never skips new ones
+                self._write_checkpoint(0, 0)
+                f.truncate(0)
+                return 0
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _run(self):
+        lock_file = open(self.lock_path, "w")
+        while not self._stop.is_set():
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                self._stop.wait(5.0)  # another worker is the consumer
+        else:
+            lock_file.close()
+            return
+
+        self._is_consumer = True
+        logger.info("Confirmation journal consumer started")
+        offset, lines = self._read_checkpoint()
+        if offset and not lines:
+            lines = self._lines_before(offset)  # checkpoint written before line counts were kept
+        retry_delay = self.max_wait
+        attempts = 0
+
+        try:
+            while not self._stop.is_set():
+                entries, next_offset, batch_lines = self._read_batch(offset)
+                if not entries:
+                    if next_offset != offset:
+                        # Only corrupt lines were read; skip past them
+                        lines += batch_lines
+                        self._write_checkpoint(next_offset, lines)
+                        offset = next_offset
+                    offset = self._compact(offset)
+                    if offset == 0:
+                        lines = 0
+                    self._wakeup.wait(self.max_wait)
+                    self._wakeup.clear()
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    if attempts < self.max_attempts:
+                        results = self._processor(entries)
+                    else:
+                        results = self._process_isolated(entries)
+                except Exception as e:
+                    attempts += 1
+                    logger.error(f"Confirmation batch failed (attempt {attempts}), retrying in {retry_delay:.1f}s: {e}")
+                    self._stop.wait(retry_delay)
+                    retry_delay = min(retry_delay * 2, 30.0)
+                    continue
+                attempts = 0
+                retry_delay = self.max_wait
+
+                by_id = {entry["ingest_id"]: entry for entry in entries}
+                self._write_failed([
+                    {**r, "entry": by_id.get(r["ingest_id"])} for r in results if r["status"] == "FAILED"
+                ])
+                lines += batch_lines
+                self._write_checkpoint(next_offset, lines)
+                offset = next_offset
+                self._record(results, (time.perf_counter() - started) * 1000)
+                self._publish(results)
+        finally:
+            self._is_consumer = False
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _process_isolated(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Post a batch that keeps failing one entry at a time.
+
+        Entries that still fail on their own are reported as FAILED.
+        """
+        results = []
+        for entry in entries:
+            try:
+                results.extend(self._processor([entry]))
+            except Exception as e:
+                logger.error(f"Rejecting journal entry {entry['ingest_id']}: {e}")
+                results.append({
+                    "ingest_id": entry["ingest_id"],
+                    "order_id": entry.get("payload", {}).get("order_id"),
+                    "status": "FAILED",
+                    "errors": [str(e)]
+                })
+        return results
+
+    def _write_failed(self, failed: List[Dict[str, Any]]):
+        if not failed:
+            return
+        data = "".join(json.dumps(f, default=str) + "\n" for f in failed).encode()
+        fd = os.open(self.failed_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _record(self, results: List[Dict[str, Any]], commit_ms: float):
+        failed = sum(1 for r in results if r["status"] == "FAILED")
+        with self._write_lock:  # appends update the counters from threadpool workers
+            self._counters["entries_processed"] += len(results)
+            self._counters["entries_failed"] += failed
+            self._counters["batches_committed"] += 1
+            self._counters["last_batch_size"] = len(results)
+            self._counters["last_commit_ms"] = round(commit_ms, 2)
+        for result in results:
+            self._results[result["ingest_id"]] = result
+        while len(self._results) > self._recent_results:
+            self._results.popitem(last=False)
+
+    def _publish(self, results: List[Dict[str, Any]]):
+        message = {
+            "type": "confirmations_ingested",
+            "processed": len(results),
+            "failed": sum(1 for r in results if r["status"] == "FAILED"),
+            "confirmations": [
+                {
+                    "ingest_id": r["ingest_id"],
+                    "confirmation_id": r.get("confirmation_id"),
+                    "order_id": r.get("order_id"),
+                    "status": r["status"]
+                } for r in results
+            ]
+        }
+        # Delivered to subscribers of any of the batch's orders
+        topics = {"order": [r["order_id"] for r in results if r.get("order_id")]}
+        bus.publish(message, topics)
+
+    # Monitoring
+    def get_result(self, ingest_id: str) -> Optional[Dict[str, Any]]:
+        """Result of a recently processed entry (only kept by the consumer process, bounded)"""
+        return self._results.get(ingest_id)
+
+    def get_failed_result(self, ingest_id: str) -> Optional[Dict[str, Any]]:
+        """FAILED result of an entry from the failed-entries file (any process)"""
+        key = json.dumps(ingest_id).encode()
+        result = None
+        try:
+            with open(self.failed_path, "rb") as f:
+                for line in f:
+                    if key in line:
+                        result = json.loads(line)  # a replayed entry may be listed again; keep the last
+        except FileNotFoundError:
+            return None
+        if result:
+            result.pop("entry", None)
+        return result
+
+    def _count_lines(self, journal_bytes: int, committed_lines: int) -> int:
+        """Complete lines in the journal, counting only bytes appended since the last call"""
+        with self._scan_lock:
+            if journal_bytes < self._scanned_bytes or committed_lines < self._scanned_committed_lines:
+                self._scanned_bytes = self._scanned_lines = 0  # truncated after being drained
+            self._scanned_committed_lines = committed_lines
+            if journal_bytes > self._scanned_bytes:
+                with open(self.path, "rb") as f:
+                    f.seek(self._scanned_bytes)
+                    for chunk in iter(lambda: f.read(min(1024 * 1024, journal_bytes - f.tell())), b""):
+                        self._scanned_lines += chunk.count(b"\n")
+                self._scanned_bytes = journal_bytes
+            return self._scanned_lines
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog and lag metrics for the ingestion queue"""
+        committed_offset, committed_lines = self._read_checkpoint()
+        try:
+            journal_bytes = os.path.getsize(self.path)
+        except FileNotFoundError:
+            journal_bytes = 0
+
+        backlog_entries = 0
+        lag_seconds = 0.0
+        if journal_bytes > committed_offset:
+            backlog_entries = max(0, self._count_lines(journal_bytes, committed_lines) - committed_lines)
+            with open(self.path, "rb") as f:
+                f.seek(committed_offset)
+                first = f.readline()
+            try:
+                enqueued_at = datetime.fromisoformat(json.loads(first)["enqueued_at"])
+                lag_seconds = max(0.0, (datetime.now() - enqueued_at).total_seconds())
+            except (ValueError, KeyError):
+                pass
+
+        with self._write_lock:
+            counters = dict(self._counters)
+        return {
+            "journal_path": self.path,
+            "consumer_active": self._is_consumer,
+            "journal_bytes": journal_bytes,
+            "committed_offset": committed_offset,
+            "backlog_bytes": max(0, journal_bytes - committed_offset),
+            "backlog_entries": backlog_entries,
+            "lag_seconds": round(lag_seconds, 3),
+            **counters
+        }
+
+# Global journal instance
+journal = ConfirmationJournal(
+    config.settings.confirmation_journal_path,
+    batch_size=config.settings.confirmation_journal_batch_size,
+    max_wait=config.settings.confirmation_journal_max_wait,
+    max_attempts=config.settings.confirmation_journal_max_attempts
+)
@@ -0,0 +1,313 @@
+"""
+IN-PROCESS EVENT BUS (sync endpoints -> WebSocket loop)
+
+Most routers are sync endpoints that FastAPI runs in a threadpool, where there is
+no running event loop to schedule a broadcast on. Any thread publishes here
+instead: publish() appends the event to a queue and, if no drain is pending,
+schedules one on the application loop with call_soon_threadsafe. The drain hands
+every queued event to the handlers (the WebSocket ConnectionManager) in one
+callback, so a burst of events costs one loop wakeup.
+
+Events describing DB changes are published with publish_after_commit(db, ...):
+they are kept on the session and released by its after_commit hook, or discarded
+on rollback, so clients never see a change that did not persist.
+
+Several workers (uvicorn --workers N, replicas) share events through a pub/sub
+backend chosen with EVENT_BUS_BACKEND:
+
+- local:    in-process broker; enough for a single worker
+- postgres: LISTEN/NOTIFY on EVENT_BUS_CHANNEL of the application database. A
+            sender thread NOTIFYs in batches over its own connection, a listener
+            thread receives; payloads above the NOTIFY limit are sent in chunks
+
+The publishing worker delivers its own events directly from memory (the event
+dict is never re-parsed); the copy that comes back from the backend is
+recognized by the worker ID prefix and skipped before decoding.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import re
+import select
+import threading
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from utils import config, websocket_manager
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any], Optional[Dict[str, Any]]], None]
+Deliver = Callable[[str, Dict[str, Any], Optional[Dict[str, Any]]], None]  # (origin worker, message, topics)
+
+MAX_PENDING = 10000  # Events kept while the loop is busy; the oldest are dropped beyond
+
+class LocalBackend:
+    """In-process broker: buses attached to the same instance see each other's events"""
+
+    name = "local"
+
+    def __init__(self):
+        self._subscribers: Dict[str, Deliver] = {}
+
+    def start(self, worker_id: str, deliver: Deliver):
+        self._subscribers[worker_id] = deliver
+
+    def stop(self, worker_id: str):
+        self._subscribers.pop(worker_id, None)
+
+    def publish(self, worker_id: str, message: Dict[str, Any], topics: Optional[Dict[str, Any]]):
+        for subscriber_id, deliver in list(self._subscribers.items()):
+            if subscriber_id != worker_id:
+                deliver(worker_id, dict(message), topics)
+
+class PostgresBackend:
+    """PostgreSQL LISTEN/NOTIFY; wire format {"o": worker ID, "e": [message, topics]}"""
+
+    name = "postgres"
+    MAX_PAYLOAD = 7900  # NOTIFY payloads must stay below 8000 bytes
+    CHUNK_SIZE = 3500  # Characters of an oversized event per NOTIFY (JSON escaping may double it)
+
+    def __init__(self, database_url: str, channel: str, max_outbox: int = MAX_PENDING):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]{0,62}", channel):
+            raise ValueError(f"EVENT_BUS_CHANNEL must be a plain identifier, got '{channel}'")
+        # libpq accepts postgresql:// URLs, but not SQLAlchemy's +driver suffix
+        self.dsn = re.sub(r"^postgres(ql)?\+\w+://", "postgresql://", database_url)
+        self.channel = channel
+        self._outbox: "queue.Queue[Tuple[str, str]]" = queue.Queue(max_outbox)
+        self._chunks: "OrderedDict[str, list]" = OrderedDict()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._deliver: Optional[Deliver] = None
+        self.counters = {"sent": 0, "received": 0, "send_errors": 0, "outbox_dropped": 0}
+
+    def start(self, worker_id: str, deliver: Deliver):
+        import psycopg2  # noqa: F401 - fail at startup, not in the threads
+
+        self._own_prefix = json.dumps({"o": worker_id})[:-1]
+        self._deliver = deliver
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._send_loop, name="event-bus-notify", daemon=True),
+            threading.Thread(target=self._listen_loop, name="event-bus-listen", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, worker_id: str):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(2.0)
+
+    def publish(self, worker_id: str, message: Dict[str, Any], topics: Optional[Dict[str, Any]]):
+        # Serialized by the caller: the local delivery adds fields to the same dict
+        try:
+            self._outbox.put_nowait((worker_id, json.dumps([message, topics], default=str)))
+        except queue.Full:
+            self.counters["outbox_dropped"] += 1
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def payloads(self, worker_id: str, event_text: str) -> Iterator[str]:
+        payload = '{"o": %s, "e": %s}' % (json.dumps(worker_id), event_text)
+        if len(payload) <= self.MAX_PAYLOAD:  # json.dumps output is ASCII
+            yield payload
+            return
+        chunk_id = uuid.uuid4().hex
+        parts = [event_text[i:i + self.CHUNK_SIZE] for i in range(0, len(event_text), self.CHUNK_SIZE)]
+        for index, part in enumerate(parts):
+            yield json.dumps({"o": worker_id, "id": chunk_id, "i": index, "n": len(parts), "c": part})
+
+    def _send_loop(self):
+        connection = None
+        while not self._stop.is_set():
+            try:
+                batch = [self._outbox.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < 100:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                connection = connection or self._connect()
+                with connection.cursor() as cursor:
+                    # One transaction: chunks of an event arrive together and in order
+                    cursor.execute("BEGIN")
+                    for worker_id, event_text in batch:
+                        for payload in self.payloads(worker_id, event_text):
+                            cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                    cursor.execute("COMMIT")
+                self.counters["sent"] += len(batch)
+            except Exception as e:
+                self.counters["send_errors"] += len(batch)
+                logger.error(f"Event bus NOTIFY failed, {len(batch)} events not shared with other workers: {e}")
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                connection = None
+                self._stop.wait(1.0)
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.receive(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Event bus LISTEN connection lost, reconnecting: {e}")
+                self._stop.wait(1.0)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def receive(self, payload: str):
+        """Handle one NOTIFY payload (listener thread)"""
+        if payload.startswith(self._own_prefix):
+            return  # Already delivered locally
+        try:
+            envelope = json.loads(payload)
+            if "c" in envelope:
+                parts = self._chunks.setdefault(envelope["id"], [None] * envelope["n"])
+                parts[envelope["i"]] = envelope["c"]
+                while len(self._chunks) > 100:
+                    self._chunks.popitem(last=False)
+                if any(part is None for part in parts):
+                    return
+                del self._chunks[envelope["id"]]
+                message, topics = json.loads("".join(parts))
+            else:
+                message, topics = envelope["e"]
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            logger.warning(f"Ignoring malformed event bus payload: {e}")
+            return
+        self.counters["received"] += 1
+        self._deliver(envelope["o"], message, topics)
+
+def create_backend(name: str):
+    if name == "local":
+        return LocalBackend()
+    if name == "postgres":
+        return PostgresBackend(config.settings.database_url, config.settings.event_bus_channel)
+    raise ValueError(f"EVENT_BUS_BACKEND must be local or postgres, got '{name}'")
+
+class EventBus:
+    def __init__(self, backend=None, max_pending: int = MAX_PENDING):
+        self._handlers: List[Handler] = []
+        self._pending = deque()
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.backend = backend or LocalBackend()
+        self.worker_id = uuid.uuid4().hex
+        self._counters = {"published": 0, "received": 0, "delivered": 0, "dropped": 0, "drains": 0}
+
+    def add_handler(self, handler: Handler):
+        """Register a callable run on the event loop for every event"""
+        self._handlers.append(handler)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Attach the loop events are delivered on and join the backend (application startup)"""
+        self._loop = loop
+        self.backend.start(self.worker_id, self._receive)
+
+    def stop(self):
+        self.backend.stop(self.worker_id)
+        self._loop = None
+
+    def publish(self, message: Dict[str, Any], topics: Optional[Dict[str, Any]] = None):
+        """Deliver an event to this worker's clients and share it with the other workers.
+
+        Non-blocking and safe from any thread.
+        """
+        if self._loop is not None:
+            self.backend.publish(self.worker_id, message, topics)
+        self._enqueue(message, topics, "published")
+
+    def _receive(self, origin: str, message: Dict[str, Any], topics: Optional[Dict[str, Any]]):
+        """Event published by another worker (backend thread)"""
+        if origin != self.worker_id:
+            self._enqueue(message, topics, "received")
+
+    def _enqueue(self, message: Dict[str, Any], topics: Optional[Dict[str, Any]], counter: str):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            logger.debug(f"No event loop attached, dropping event {message.get('type')}")
+            self._counters["dropped"] += 1
+            return
+        with self._lock:
+            if len(self._pending) >= self._max_pending:
+                self._pending.popleft()
+                self._counters["dropped"] += 1
+            self._pending.append((message, topics))
+            self._counters[counter] += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:  # Loop closed while shutting down
+            with self._lock:
+                self._scheduled = False
+
+    def _drain(self):
+        with self._lock:
+            events = list(self._pending)
+            self._pending.clear()
+            self._scheduled = False
+            self._counters["drains"] += 1
+        for message, topics in events:
+            for handler in self._handlers:
+                try:
+                    handler(message, topics)
+                except Exception as e:
+                    logger.error(f"Event handler failed for {message.get('type')}: {e}")
+            self._counters["delivered"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {"pending": len(self._pending), "attached": self._loop is not None, **self._counters}
+        return {"backend": self.backend.name, "worker_id": self.worker_id, **stats,
+                **getattr(self.backend, "counters", {})}
+
+def publish_after_commit(db: Session, message: Dict[str, Any], topics: Optional[Dict[str, Any]] = None):
+    """Publish an event once the session's current transaction commits"""
+    db.info.setdefault("pending_bus_events", []).append((message, topics))
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session):
+    for message, topics in session.info.pop("pending_bus_events", ()):
+        bus.publish(message, topics)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session):
+    session.info.pop("pending_bus_events", None)
+
+# Global event bus instance
+bus = EventBus(create_backend(config.settings.event_bus_backend))
+bus.add_handler(websocket_manager.manager.dispatch)
@@ -0,0 +1,126 @@
+"""
+KPI RESULT CACHE
+
+Dashboard KPIs are aggregated over all production orders and requested by every
+open dashboard. Results are kept per key for KPI_CACHE_TTL_SECONDS; concurrent
+requests for a missing key share one computation (single flight) instead of each
+running the aggregation.
+
+A committed transaction that creates or deletes an order, or changes one of the
+KPI_FIELDS the dashboard aggregates (through the unit of work or a bulk UPDATE),
+invalidates the cache of this worker process. Other workers pick the change up
+when their entries expire.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from database import models
+from utils import config
+
+# Order columns the dashboard KPIs are computed from (routers/analytics.order_kpi_groups)
+KPI_FIELDS = (
+    "plant", "status", "priority", "quantity", "dueDate",
+    "actualStartDate", "actualEndDate", "plannedStartDate"
+)
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "generation")
+
+    def __init__(self, generation: int):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.generation = generation
+
+class TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, tuple] = {}  # key -> (expires_at, generation, value)
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "shared": 0, "invalidations": 0}
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic() and entry[1] == self._generation:
+                self._counters["hits"] += 1
+                return entry[2]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(self._generation)
+                self._counters["misses"] += 1
+            else:
+                self._counters["shared"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                # A result computed across an invalidation is handed to its waiters but not kept
+                if flight.error is None and flight.generation == self._generation:
+                    self._entries[key] = (time.monotonic() + self.ttl, flight.generation, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "ttl_seconds": self.ttl, **self._counters}
+
+@event.listens_for(Session, "after_flush")
+def _detect_order_transitions(session: Session, flush_context):
+    if session.info.get("kpi_stale"):
+        return
+    for order in session.new | session.deleted:
+        if isinstance(order, models.ProductionOrder):
+            session.info["kpi_stale"] = True
+            return
+    for order in session.dirty:
+        if not isinstance(order, models.ProductionOrder):
+            continue
+        attrs = inspect(order).attrs
+        if any(attrs[field].history.has_changes() for field in KPI_FIELDS):
+            session.info["kpi_stale"] = True
+            return
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_bulk_order_updates(orm_execute_state):
+    """Batched UPDATEs (utils/order_events.bulk_update_orders) bypass the flush"""
+    if orm_execute_state.is_update and orm_execute_state.statement.table.name == models.ProductionOrder.__tablename__:
+        orm_execute_state.session.info["kpi_stale"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session):
+    if session.info.pop("kpi_stale", False):
+        kpi_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session):
+    session.info.pop("kpi_stale", None)
+
+# Global KPI cache instance
+kpi_cache = TTLCache(config.settings.kpi_cache_ttl_seconds)
@@ -0,0 +1,188 @@
+"""
+DAILY KPI ROLLUPS
+
+Daily totals per (day, plant, work center, material) in daily_kpi_rollups, so trend
+charts over months read a few thousand rollup rows instead of scanning confirmation
+and goods movement history:
+- confirmations, yield_qty, scrap_qty: CO11N confirmations, on the day they ended.
+  Reversals subtract the confirmation from its original day
+- goods_movements, receipt_qty, issue_qty: goods movements on their posting day,
+  attributed to the work center of the CO11N confirmation that posted them ("" for
+  movements posted without one). Reversal movements carry negated quantities
+
+Totals are updated incrementally inside the posting transaction with one upsert
+(INSERT ... ON CONFLICT DO UPDATE adding the deltas) per batch, so they commit or
+roll back with the postings. Goods movements and confirmations added through the
+ORM are picked up by a flush hook; bulk postings with Core INSERT/UPDATE statements
+call record_confirmations / record_goods_movements themselves. Rebuilds from history
+lock the totals table first (lock_totals), so no posting's delta is lost or counted
+twice while they run.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import event, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import models
+
+KEY = ("day", "plant", "work_center_id", "material_id")
+MEASURES = ("confirmations", "yield_qty", "scrap_qty", "goods_movements", "receipt_qty", "issue_qty")
+
+def _field(row: Any, name: str) -> Any:
+    """Column value of an ORM object, result row or dict of column values"""
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+def _day(value: Optional[datetime]) -> date:
+    return (value or datetime.now()).date()
+
+def _order_attributes(db: Session, order_ids: set) -> Dict[str, tuple]:
+    """(plant, material) per order, read on the session's connection (usable in flush hooks)"""
+    order_ids.discard(None)
+    if not order_ids:
+        return {}
+    po = models.ProductionOrder
+    return {
+        order_id: (plant, material_id)
+        for order_id, plant, material_id in db.connection().execute(
+            select(po.orderId, po.plant, po.materialId).where(po.orderId.in_(order_ids))
+        )
+    }
+
+def _confirmation_work_centers(db: Session, confirmation_ids: set) -> Dict[str, str]:
+    """Work center per confirmation, read on the session's connection (usable in flush hooks)"""
+    confirmation_ids.discard(None)
+    if not confirmation_ids:
+        return {}
+    conf = models.OperationConfirmation
+    return dict(db.connection().execute(
+        select(conf.confirmation_id, conf.work_center_id).where(conf.confirmation_id.in_(confirmation_ids))
+    ).all())
+
+def upsert_totals(db: Session, table, key: tuple, measures: tuple, deltas: Dict[tuple, Dict[str, float]]):
+    """Add {measure: delta} per key tuple to a totals table with a unique key and a "day" column.
+
+    Tables with a "revision" column get it incremented on every row touched.
+    """
+    if not deltas:
+        return
+    now = datetime.now()
+    revision = {"revision": 1} if "revision" in table.c else {}
+    rows = [
+        {**dict(zip(key, k)), **{m: values.get(m, 0) for m in measures}, **revision, "updated_at": now}
+        for k, values in deltas.items()
+    ]
+    increments = {"revision": table.c.revision + 1} if revision else {}
+    connection = db.connection()
+
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={
+                **{m: table.c[m] + statement.excluded[m] for m in measures},
+                **increments,
+                "updated_at": statement.excluded.updated_at
+            }
+        )
+        connection.execute(statement, rows)
+        return
+
+    # Other databases: lock the existing rows, then update or insert
+    existing = {
+        tuple(row[:len(key)]): row[len(key)]
+        for row in connection.execute(
+            select(*(table.c[k] for k in key), table.c.id).where(
+                table.c.day.in_({row["day"] for row in rows})
+            ).with_for_update()
+        )
+    }
+    for row in rows:
+        row_id = existing.get(tuple(row[k] for k in key))
+        if row_id is None:
+            connection.execute(table.insert(), row)
+        else:
+            connection.execute(table.update().where(table.c.id == row_id).values(
+                {**{m: table.c[m] + row[m] for m in measures}, **increments, "updated_at": now}
+            ))
+
+def lock_totals(db: Session, table):
+    """Hold off postings' upserts into a totals table until the caller's transaction ends.
+
+    Call before reading the history a rebuild recomputes the table from. On PostgreSQL
+    SHARE ROW EXCLUSIVE conflicts with the lock every INSERT/UPDATE takes: a posting has
+    either committed before the rebuild reads, or adds its delta to the rebuilt totals
+    after it commits. Other databases are locked by deleting the old totals first
+    (SQLite has a single writer).
+    """
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"LOCK TABLE {connection.dialect.identifier_preparer.format_table(table)} "
+                                "IN SHARE ROW EXCLUSIVE MODE"))
+
+def _upsert(db: Session, deltas: Dict[tuple, Dict[str, float]]):
+    upsert_totals(db, models.DailyKpiRollup.__table__, KEY, MEASURES, deltas)
+
+def record_confirmations(db: Session, confirmations: Iterable[Any], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1, reversal) confirmations from the rollups in the caller's transaction.
+
+    Each confirmation needs order_id, work_center_id, yield_qty, scrap_qty and end_time.
+    """
+    confirmations = list(confirmations)
+    if not confirmations:
+        return
+    orders = _order_attributes(db, {_field(c, "order_id") for c in confirmations})
+    deltas = defaultdict(lambda: defaultdict(float))
+    for confirmation in confirmations:
+        plant, material_id = orders.get(_field(confirmation, "order_id"), (None, None))
+        values = deltas[(
+            _day(_field(confirmation, "end_time")), plant or "", _field(confirmation, "work_center_id") or "",
+            material_id or ""
+        )]
+        values["confirmations"] += sign
+        values["yield_qty"] += sign * (_field(confirmation, "yield_qty") or 0.0)
+        values["scrap_qty"] += sign * (_field(confirmation, "scrap_qty") or 0.0)
+    _upsert(db, deltas)
+
+def record_goods_movements(db: Session, movements: Iterable[Any], work_centers: Optional[Dict[str, str]] = None):
+    """Add goods movements to the rollups in the caller's transaction.
+
+    Each movement needs movement_type, material_id, qty, plant, confirmation_id and
+    timestamp. `work_centers` ({confirmation_id: work center}) spares the lookup of
+    confirmations the caller has at hand; the others are read.
+    """
+    movements = list(movements)
+    if not movements:
+        return
+    work_centers = dict(work_centers or {})
+    work_centers.update(_confirmation_work_centers(
+        db, {_field(m, "confirmation_id") for m in movements} - work_centers.keys()
+    ))
+    deltas = defaultdict(lambda: defaultdict(float))
+    for movement in movements:
+        work_center_id = work_centers.get(_field(movement, "confirmation_id"))
+        values = deltas[(
+            _day(_field(movement, "timestamp")), _field(movement, "plant") or "", work_center_id or "",
+            _field(movement, "material_id") or ""
+        )]
+        values["goods_movements"] += 1
+        if _field(movement, "movement_type") == "RECEIPT":
+            values["receipt_qty"] += _field(movement, "qty") or 0.0
+        elif _field(movement, "movement_type") == "ISSUE":
+            values["issue_qty"] += _field(movement, "qty") or 0.0
+    _upsert(db, deltas)
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_postings(session: Session, flush_context):
+    movements, confirmations = [], []
+    for obj in session.new:
+        if isinstance(obj, models.GoodsMovement):
+            movements.append(obj)
+        elif isinstance(obj, models.OperationConfirmation) and obj.status != "REVERSED":
+            confirmations.append(obj)
+    record_goods_movements(session, movements, {c.confirmation_id: c.work_center_id for c in confirmations})
+    record_confirmations(session, confirmations)
@@ -0,0 +1,112 @@
+"""
+LEAD-TIME SCHEDULING FOR MRP PROPOSALS
+
+In-house production time is derived from the material's active routing:
+
+    sum over operations of (setup + quantity x max(machine, labor)) / 60 hours
+        / (work center efficiency / 100) / work center capacity (hours per day)
+
+rounded up to whole days (at least one). Purchased materials use
+Material.plannedDeliveryTime. Materials without either fall back to
+MRP_DEFAULT_PRODUCTION_DAYS / MRP_DEFAULT_DELIVERY_DAYS.
+
+The production time is linear in the quantity, so a routing is reduced once to its
+setup days and run days per unit, cached process-wide per material and stamped with
+the routing revision and work center data they were computed from. Each proposal is
+then evaluated at its actual quantity; an MRP run evaluates a routing once per
+material, not once per proposal.
+"""
+
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import models
+from utils import config
+from utils.routing_cache import active_routing_ids, routing_cache
+
+IN_HOUSE_TYPES = (models.MaterialType.FINISHED, models.MaterialType.SEMI_FINISHED)
+
+class LeadTime(NamedTuple):
+    days: int
+    procurement: str  # IN_HOUSE, EXTERNAL
+    source: str  # ROUTING, MATERIAL, DEFAULT
+    routing_id: Optional[str] = None
+
+# material -> (stamp, (setup days, run days per unit))
+_cache: Dict[str, Tuple[tuple, Tuple[float, float]]] = {}
+_cache_lock = threading.Lock()
+_CACHE_MAX_SIZE = 20000
+
+class LeadTimes:
+    """Lead-time lookups for one MRP run; master data is read once per material"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        work_centers = db.query(models.WorkCenter).all()
+        self.work_centers = {wc.workCenterId: wc for wc in work_centers}
+        self.work_center_stamp = hash(tuple(sorted(
+            (wc.workCenterId, wc.capacity, wc.efficiency) for wc in work_centers
+        )))
+        self._materials: Dict[str, Optional[models.Material]] = {}
+        self._routing_ids: Dict[str, Optional[str]] = {}
+
+    def material(self, material_id: str) -> Optional[models.Material]:
+        if material_id not in self._materials:
+            self._materials[material_id] = self.db.query(models.Material).filter(
+                models.Material.materialId == material_id
+            ).first()
+        return self._materials[material_id]
+
+    def lead_time(self, material_id: str, quantity: float) -> LeadTime:
+        material = self.material(material_id)
+        if material is not None and material.type not in IN_HOUSE_TYPES:
+            if material.plannedDeliveryTime is not None:
+                return LeadTime(material.plannedDeliveryTime, "EXTERNAL", "MATERIAL")
+            return LeadTime(config.settings.mrp_default_delivery_days, "EXTERNAL", "DEFAULT")
+        return self.production_time(material_id, quantity)
+
+    def production_time(self, material_id: str, quantity: float) -> LeadTime:
+        if material_id not in self._routing_ids:
+            self._routing_ids[material_id] = active_routing_ids(self.db, [material_id]).get(material_id)
+        routing = routing_cache.get(self.db, self._routing_ids[material_id])
+        if routing is None or not routing.operations:
+            return LeadTime(config.settings.mrp_default_production_days, "IN_HOUSE", "DEFAULT")
+
+        stamp = (routing.routing_id, routing.id, routing.revision, self.work_center_stamp)
+        with _cache_lock:
+            cached = _cache.get(material_id)
+        if cached and cached[0] == stamp:
+            setup_days, run_days_per_unit = cached[1]
+        else:
+            setup_days = run_days_per_unit = 0.0
+            for op in routing.operations:
+                wc = self.work_centers.get(op.work_center_id)
+                efficiency = (wc.efficiency if wc and wc.efficiency else 100.0) / 100.0
+                minutes_per_day = (float(wc.capacity) if wc and wc.capacity else 24.0) * 60.0 * efficiency
+                setup_days += (op.setup_time or 0.0) / minutes_per_day
+                run_days_per_unit += max(op.machine_time or 0.0, op.labor_time or 0.0) / minutes_per_day
+            with _cache_lock:
+                if len(_cache) >= _CACHE_MAX_SIZE:
+                    _cache.clear()
+                _cache[material_id] = (stamp, (setup_days, run_days_per_unit))
+
+        days = setup_days + max(quantity, 0.0) * run_days_per_unit
+        return LeadTime(max(1, math.ceil(days - 1e-9)), "IN_HOUSE", "ROUTING", routing.routing_id)
+
+    def schedule(self, material_id: str, quantity: float, need_date: datetime,
+                 today: Optional[datetime] = None) -> Tuple[datetime, datetime, LeadTime, bool]:
+        """Backward-schedule a proposal from its need date: (start, finish, lead time, forward).
+
+        When the start would lie in the past the proposal is scheduled forward from
+        today instead and `forward` is True (the need date cannot be met).
+        """
+        lead_time = self.lead_time(material_id, quantity)
+        today = today or datetime.now()
+        start = need_date - timedelta(days=lead_time.days)
+        if start < today:
+            return today, today + timedelta(days=lead_time.days), lead_time, True
+        return start, need_date, lead_time, False
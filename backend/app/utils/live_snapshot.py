@@ -0,0 +1,53 @@
+"""
+LIVE STATE SNAPSHOTS FOR WEBSOCKET CLIENTS
+
+State a client loads before it applies live events (utils/websocket_manager.py):
+order board rows for an order-board subscription, and the open production orders
+after a reconnect whose missed events can no longer be replayed. Rows have the
+shape of ProductionOrderResponse in JSON mode, so they match GET
+/api/production-orders, and are read with plain column tuples in one query.
+"""
+
+import enum
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from database import models, schemas, SessionLocal
+
+BOARD_FIELDS = list(schemas.ProductionOrderResponse.model_fields)
+
+OPEN_STATUSES = [
+    models.OrderStatus.CREATED, models.OrderStatus.RELEASED,
+    models.OrderStatus.IN_PROGRESS, models.OrderStatus.DELAYED
+]
+
+def board_value(value: Any) -> Any:
+    """JSON representation of an order field, as in the REST response"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def board_row(order: models.ProductionOrder) -> Dict[str, Any]:
+    return {field: board_value(getattr(order, field)) for field in BOARD_FIELDS}
+
+def board_rows(plants: Optional[Set[str]] = None, statuses: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """Order board rows, optionally limited to plants and statuses, by order ID"""
+    po = models.ProductionOrder
+    db = SessionLocal()
+    try:
+        query = db.query(*(getattr(po, field) for field in BOARD_FIELDS))
+        if plants is not None:
+            query = query.filter(po.plant.in_(plants))
+        if statuses is not None:
+            query = query.filter(po.status.in_([models.OrderStatus(s) for s in statuses]))
+        return [
+            {field: board_value(value) for field, value in zip(BOARD_FIELDS, row)}
+            for row in query.order_by(po.orderId)
+        ]
+    finally:
+        db.close()
+
+def order_snapshot(plants: Optional[Set[str]] = None) -> Dict[str, Any]:
+    return {"production_orders": board_rows(plants, {s.value for s in OPEN_STATUSES})}
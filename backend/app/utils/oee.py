@@ -0,0 +1,314 @@
+"""
+OEE ENGINE (availability x performance x quality per work center and shift/day)
+
+Inputs come from CO11N confirmations, standard times and work center capacity:
+- Planned time: WorkCenter.capacity (available hours per day) x efficiency / 100, as in
+  capacity planning, laid out from the start of the first shift; a shift gets what is
+  left of the day's capacity, up to OEE_SHIFT_HOURS. Shift 1 starts at
+  SCHEDULING_SHIFT_START_HOUR, and shifts running past midnight belong to the day they
+  started. Periods in progress count only their elapsed time, future ones none
+- Availability = run time (actual machine time) / planned time
+- Performance = ideal time (standard machine time x (yield + scrap)) / run time
+- Quality = yield / (yield + scrap)
+Availability and performance are capped at 100%. Totals over several periods are
+ratios of summed minutes, not averages of ratios. Planned time uses the current
+work center master data.
+
+Confirmations are attributed to the shift their end_time falls in. Per (day, shift,
+work center) the input totals are kept in oee_shift_stats, updated incrementally by
+the posting transactions (record_oee_inputs, with sign=-1 on reversal) and rebuilt
+from history in one vectorized pass (rebuild_oee_inputs).
+
+OEEEngine keeps the inputs of closed days as NumPy arrays in a bounded LRU, so
+queries only read the open day and days that changed since they were cached:
+- A commit with new inputs drops the affected days from this process's cache
+- Every update bumps the row's revision; cached days older than
+  OEE_REVALIDATE_SECONDS are revalidated against their (row count, revision sum)
+  stamp with one grouped query, so other workers notice changes cheaply
+The factors of all work centers and periods are then computed at once on a
+(work center x day x shift) array.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import and_, event, func, select
+from sqlalchemy.orm import Session
+
+from database import models
+from utils import config
+from utils.kpi_rollups import lock_totals, upsert_totals
+
+KEY = ("day", "shift", "work_center_id")
+MEASURES = ("confirmations", "setup_minutes", "run_minutes", "ideal_minutes", "yield_qty", "scrap_qty")
+CONFIRMATIONS, SETUP, RUN, IDEAL, YIELD, SCRAP = range(len(MEASURES))
+
+# (work_center_id, end_time, setup_minutes, run_minutes, ideal_minutes, yield_qty, scrap_qty)
+Sample = Tuple[str, datetime, float, float, float, float, float]
+
+def shift_hours() -> float:
+    return config.settings.oee_shift_hours
+
+def shifts_per_day() -> int:
+    return math.ceil(24 / shift_hours())
+
+def shift_lengths() -> np.ndarray:
+    """Hours of each shift of a day; the last one may be shorter"""
+    return np.minimum(shift_hours(), 24 - np.arange(shifts_per_day()) * shift_hours())
+
+def shift_start_time(day: date, shift: int) -> datetime:
+    return datetime.combine(day, datetime.min.time()) + timedelta(
+        hours=config.settings.scheduling_shift_start_hour + (shift - 1) * shift_hours()
+    )
+
+def shift_of(moment: datetime) -> Tuple[date, int]:
+    """(production day, shift number) a moment falls in"""
+    shifted = moment - timedelta(hours=config.settings.scheduling_shift_start_hour)
+    hours = (shifted - datetime.combine(shifted.date(), datetime.min.time())).total_seconds() / 3600
+    return shifted.date(), int(hours // shift_hours()) + 1
+
+def oee_sample(confirmation: Any, operation: Any) -> Sample:
+    """OEE inputs of a confirmation (ORM object or dict of columns) and its routing operation (or None)"""
+    get = confirmation.get if isinstance(confirmation, dict) else lambda name: getattr(confirmation, name)
+    yield_qty, scrap_qty = get("yield_qty") or 0.0, get("scrap_qty") or 0.0
+    machine_time = (operation.machine_time or 0.0) if operation is not None else 0.0
+    return (
+        get("work_center_id"), get("end_time"), get("setup_time_actual") or 0.0, get("machine_time_actual") or 0.0,
+        machine_time * (yield_qty + scrap_qty), yield_qty, scrap_qty
+    )
+
+def record_oee_inputs(db: Session, samples: Iterable[Sample], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1, reversal) confirmations from the shift totals in the caller's transaction"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    for work_center_id, end_time, setup, run, ideal, yield_qty, scrap_qty in samples:
+        values = deltas[(*shift_of(end_time or datetime.now()), work_center_id or "")]
+        for index, value in ((CONFIRMATIONS, 1), (SETUP, setup), (RUN, run), (IDEAL, ideal),
+                             (YIELD, yield_qty), (SCRAP, scrap_qty)):
+            values[MEASURES[index]] += sign * value
+    upsert_totals(db, models.OEEShiftStatistic.__table__, KEY, MEASURES, deltas)
+    # This process drops the cached days on commit; other workers revalidate them
+    db.info.setdefault("oee_days", set()).update(key[0] for key in deltas)
+
+def rebuild_oee_inputs(db: Session) -> dict:
+    """Recompute all shift totals from the posted confirmations; nothing is committed here.
+
+    One column extract of the confirmations with their standard machine time, bucketed
+    and summed with NumPy. Revisions continue above the old maximum, so every worker's
+    cached days fail revalidation. The table is locked and emptied before the extract,
+    so postings either are in it or add their totals after the rebuild commits.
+    """
+    conf = models.OperationConfirmation
+    order = models.ProductionOrder
+    op = models.Operation
+    table = models.OEEShiftStatistic.__table__
+    lock_totals(db, table)
+    revision = (db.execute(select(func.max(table.c.revision))).scalar() or 0) + 1
+    db.execute(table.delete())
+
+    rows = db.execute(
+        select(
+            conf.work_center_id, conf.end_time, conf.setup_time_actual, conf.machine_time_actual,
+            op.machine_time, conf.yield_qty, conf.scrap_qty
+        ).select_from(conf).outerjoin(
+            order, order.orderId == conf.order_id
+        ).outerjoin(
+            op, and_(op.routing_id == order.routingId, op.operation_id == conf.operation_id)
+        ).where(conf.status == "CONFIRMED", conf.end_time.isnot(None))
+    ).all()
+    if not rows:
+        return {"confirmations": 0, "shift_rows": 0}
+
+    columns = list(zip(*rows))
+    work_center_ids, work_center_index = np.unique(np.array([wc or "" for wc in columns[0]], dtype=object),
+                                                   return_inverse=True)
+    seconds = np.array(columns[1], dtype="datetime64[s]").astype(np.int64) - int(
+        config.settings.scheduling_shift_start_hour * 3600
+    )
+    epoch_days = seconds // 86400
+    shift_index = (seconds % 86400) // int(shift_hours() * 3600)
+    values = np.array(columns[2:], dtype=np.float64).T
+    values = np.nan_to_num(values)  # NULL times/quantities, operations missing from the routing
+    setup, run, machine_time, yield_qty, scrap_qty = values.T
+    measures = np.column_stack([
+        np.ones(len(rows)), setup, run, machine_time * (yield_qty + scrap_qty), yield_qty, scrap_qty
+    ])
+
+    n_shifts, n_work_centers = shifts_per_day(), len(work_center_ids)
+    day_offset = epoch_days - epoch_days.min()
+    bucket = (day_offset * n_shifts + shift_index) * n_work_centers + work_center_index
+    buckets, bucket_index = np.unique(bucket, return_inverse=True)
+    totals = np.zeros((len(buckets), len(MEASURES)))
+    np.add.at(totals, bucket_index, measures)
+
+    first_day = date(1970, 1, 1) + timedelta(days=int(epoch_days.min()))
+    now = datetime.now()
+    inserts = []
+    for key, row in zip(buckets.tolist(), totals.tolist()):
+        day_shift, wc = divmod(key, n_work_centers)
+        day, shift = divmod(day_shift, n_shifts)
+        inserts.append({
+            "day": first_day + timedelta(days=day), "shift": shift + 1, "work_center_id": work_center_ids[wc],
+            **dict(zip(MEASURES, row)), "revision": revision, "updated_at": now
+        })
+    for start in range(0, len(inserts), 5000):
+        db.execute(table.insert(), inserts[start:start + 5000])
+    return {"confirmations": len(rows), "shift_rows": len(inserts)}
+
+def oee_factors(planned: np.ndarray, totals: np.ndarray) -> Dict[str, np.ndarray]:
+    """Availability, performance, quality and OEE (fractions, NaN where undefined) for arrays of
+    planned minutes [...] and input totals [..., MEASURES]"""
+    run, ideal = totals[..., RUN], totals[..., IDEAL]
+    good, total = totals[..., YIELD], totals[..., YIELD] + totals[..., SCRAP]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        availability = np.where(planned > 0, np.minimum(run / planned, 1.0), np.nan)
+        performance = np.where(run > 0, np.minimum(ideal / run, 1.0), np.nan)
+        quality = np.where(total > 0, good / total, np.nan)
+    oee = availability * performance * quality
+    # Planned time without any production: nothing but availability loss
+    oee = np.where((planned > 0) & (run <= 0), 0.0, oee)
+    return {"availability": availability, "performance": performance, "quality": quality, "oee": oee}
+
+class OEEEngine:
+    def __init__(self, max_days: int = 400, revalidate_after: float = 5.0):
+        self.max_days = max_days
+        self.revalidate_after = revalidate_after
+        # day -> [stamp, checked_at, inputs as a [work center x shift x MEASURES] array]
+        self._days: "OrderedDict[date, list]" = OrderedDict()
+        self._work_centers: Dict[str, int] = {}  # Row of each work center in the day arrays (append-only)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "loads": 0, "revalidations": 0, "evictions": 0}
+
+    def _stamps(self, db: Session, days: List[date]) -> Dict[date, tuple]:
+        stat = models.OEEShiftStatistic
+        return {
+            day: (count, revisions) for day, count, revisions in db.execute(
+                select(stat.day, func.count(), func.sum(stat.revision)).where(stat.day.in_(days)).group_by(stat.day)
+            )
+        }
+
+    def _load(self, db: Session, days: List[date]) -> Dict[date, np.ndarray]:
+        stat = models.OEEShiftStatistic
+        n_shifts = shifts_per_day()
+        stamps = self._stamps(db, days)  # Read first: a concurrent update leaves the stamp behind, not the data
+        rows = db.execute(
+            select(stat.day, stat.shift, stat.work_center_id, *(getattr(stat, m) for m in MEASURES)).where(
+                stat.day.in_(days)
+            )
+        ).all()
+        checked_at = time.monotonic()
+        open_day = shift_of(datetime.now())[0]
+        with self._lock:
+            for row in rows:
+                self._work_centers.setdefault(row[2], len(self._work_centers))
+            arrays = {day: np.zeros((len(self._work_centers), n_shifts, len(MEASURES))) for day in days}
+            for row in rows:
+                if 1 <= row[1] <= n_shifts:
+                    arrays[row[0]][self._work_centers[row[2]], row[1] - 1] = [v or 0.0 for v in row[3:]]
+            for day in days:
+                self._counters["loads"] += 1
+                if day < open_day:
+                    self._days[day] = [stamps.get(day), checked_at, arrays[day]]
+                    self._days.move_to_end(day)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+                self._counters["evictions"] += 1
+        return arrays
+
+    def inputs(self, db: Session, date_from: date, date_to: date, work_center_ids: List[str]) -> np.ndarray:
+        """Input totals as a [work center x day x shift x MEASURES] array for date_from..date_to"""
+        days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+        open_day = shift_of(datetime.now())[0]
+        now = time.monotonic()
+
+        arrays, stale, missing = {}, [], []
+        with self._lock:
+            for day in days:
+                entry = self._days.get(day)
+                if entry is None or day >= open_day:
+                    missing.append(day)
+                    continue
+                self._days.move_to_end(day)
+                if now - entry[1] > self.revalidate_after:
+                    stale.append(day)
+                else:
+                    arrays[day] = entry[2]
+                    self._counters["hits"] += 1
+
+        if stale:
+            # Cached days older than revalidate_after: one grouped query on the (row count, revision sum) stamps
+            stamps = self._stamps(db, stale)
+            with self._lock:
+                self._counters["revalidations"] += 1
+                for day in stale:
+                    entry = self._days.get(day)
+                    if entry is not None and entry[0] == stamps.get(day):
+                        entry[1] = now
+                        arrays[day] = entry[2]
+                        self._counters["hits"] += 1
+                    else:
+                        missing.append(day)
+        if missing:
+            arrays.update(self._load(db, missing))
+
+        with self._lock:
+            rows = np.array([self._work_centers.get(wc, -1) for wc in work_center_ids], dtype=np.int64)
+            width = len(self._work_centers)
+        # Days loaded before a work center was first seen have fewer rows: pad with zeros
+        stacked = np.stack([
+            np.pad(arrays[day], ((0, width - arrays[day].shape[0]), (0, 0), (0, 0)))
+            if arrays[day].shape[0] < width else arrays[day]
+            for day in days
+        ], axis=1)  # [work center x day x shift x MEASURES]
+        result = stacked[np.maximum(rows, 0)] if width else np.zeros((len(rows), *stacked.shape[1:]))
+        result[rows < 0] = 0.0
+        return result
+
+    def planned_minutes(self, work_centers: List[models.WorkCenter], date_from: date, date_to: date) -> np.ndarray:
+        """Planned production minutes as a [work center x day x shift] array"""
+        n_days, n_shifts, lengths = (date_to - date_from).days + 1, shifts_per_day(), shift_lengths()
+        capacity = np.array([
+            float(wc.capacity or 0) * float(wc.efficiency if wc.efficiency is not None else 100.0) / 100.0
+            for wc in work_centers
+        ]).reshape(-1, 1)
+        per_shift = np.clip(capacity - np.arange(n_shifts) * shift_hours(), 0.0, lengths)  # [work center x shift] hours
+
+        # Hours of each shift already past: all for closed shifts, part of the running one
+        starts = np.arange(n_days).reshape(-1, 1) * 24 + np.arange(n_shifts) * shift_hours()
+        since_first = (datetime.now() - shift_start_time(date_from, 1)).total_seconds() / 3600
+        elapsed = np.clip(since_first - starts, 0.0, lengths)  # [day x shift]
+        return np.minimum(per_shift[:, None, :], elapsed[None, :, :]) * 60
+
+    def discard(self, days: Iterable[date]):
+        """Drop cached days, e.g. after this process committed new inputs for them"""
+        with self._lock:
+            for day in days:
+                self._days.pop(day, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._days.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached_days": len(self._days), "max_days": self.max_days,
+                "revalidate_after_seconds": self.revalidate_after, **self._counters
+            }
+
+@event.listens_for(Session, "after_commit")
+def _discard_committed_days(session: Session):
+    days = session.info.pop("oee_days", None)
+    if days:
+        oee_engine.discard(days)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_days(session: Session):
+    session.info.pop("oee_days", None)
+
+# Global OEE engine instance
+oee_engine = OEEEngine(config.settings.oee_cache_days, config.settings.oee_revalidate_seconds)
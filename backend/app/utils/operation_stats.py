@@ -0,0 +1,186 @@
+"""
+ROLLING STATISTICS OF ACTUAL OPERATION TIMES
+
+Keeps online statistics of the actual setup/machine/labor times confirmed per
+routing operation and work center:
+- Welford running mean and variance (supports removing samples on reversal)
+- A log-bucketed quantile sketch (relative accuracy SKETCH_ACCURACY) for percentiles
+
+Statistics are updated incrementally inside the confirmation posting transaction, so
+reading them never rescans confirmation history.
+"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import models
+
+METRICS = ("setup", "machine", "labor")
+SKETCH_ACCURACY = 0.02
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# (routing_id, operation_id, work_center_id, setup_time, machine_time, labor_time)
+Sample = Tuple[str, str, str, float, float, float]
+
+def welford_update(count: int, mean: float, m2: float, value: float, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one value; returns the new (count, mean, m2)"""
+    if sign > 0:
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+        return count, mean, m2
+
+    if count <= 1:
+        return 0, 0.0, 0.0
+    new_mean = (count * mean - value) / (count - 1)
+    m2 -= (value - new_mean) * (value - mean)
+    return count - 1, new_mean, max(m2, 0.0)
+
+def sketch_add(sketch: dict, value: float, sign: int = 1) -> dict:
+    """Add or remove a value from a quantile sketch; returns a new sketch dict"""
+    sketch = {"zero": sketch.get("zero", 0), "buckets": dict(sketch.get("buckets", {}))}
+    if value <= 0:
+        sketch["zero"] = max(0, sketch["zero"] + sign)
+        return sketch
+
+    key = str(math.ceil(math.log(value) / _LOG_GAMMA))
+    count = sketch["buckets"].get(key, 0) + sign
+    if count > 0:
+        sketch["buckets"][key] = count
+    else:
+        sketch["buckets"].pop(key, None)
+    return sketch
+
+def sketch_quantile(sketch: Optional[dict], q: float) -> Optional[float]:
+    """Estimate the q-quantile (0..1) from a sketch"""
+    if not sketch:
+        return None
+    buckets = sorted((int(k), c) for k, c in sketch.get("buckets", {}).items())
+    total = sketch.get("zero", 0) + sum(c for _, c in buckets)
+    if total == 0:
+        return None
+
+    rank = q * (total - 1)
+    seen = sketch.get("zero", 0)
+    if rank < seen:
+        return 0.0
+    for index, count in buckets:
+        seen += count
+        if rank < seen:
+            return 2 * _GAMMA ** index / (_GAMMA + 1)
+    return 2 * _GAMMA ** buckets[-1][0] / (_GAMMA + 1)
+
+KEY = ("routing_id", "operation_id", "work_center_id")
+
+def _empty_row(key: tuple) -> dict:
+    return {
+        **dict(zip(KEY, key)),
+        "sample_count": 0,
+        **{f"{metric}_{field}": 0.0 for metric in METRICS for field in ("mean", "m2")},
+        "sketches": {metric: {"zero": 0, "buckets": {}} for metric in METRICS}
+    }
+
+def _ensure_rows(db: Session, keys: list):
+    """Insert empty statistics rows for keys that have none yet.
+
+    Concurrent first postings of a key must not both INSERT it: PostgreSQL and SQLite
+    skip existing keys with ON CONFLICT DO NOTHING, other databases insert each
+    missing key in a savepoint and ignore a duplicate key error.
+    """
+    table = models.OperationTimeStatistic.__table__
+    dialect = db.connection().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+        db.execute(statement.on_conflict_do_nothing(index_elements=list(KEY)), [_empty_row(k) for k in keys])
+        return
+
+    existing = set(db.execute(
+        select(*(table.c[k] for k in KEY)).where(tuple_(*(table.c[k] for k in KEY)).in_(keys))
+    ).all())
+    for key in keys:
+        if key in existing:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(table.insert(), _empty_row(key))
+        except IntegrityError:
+            pass  # inserted concurrently
+
+def apply_sample(stat: models.OperationTimeStatistic, times: Tuple[float, float, float], sign: int = 1):
+    """Add or remove one confirmation's actual times from a statistics row"""
+    sketches = dict(stat.sketches or {})
+    count = stat.sample_count or 0
+    new_count = count
+    for metric, value in zip(METRICS, times):
+        value = value or 0.0
+        new_count, mean, m2 = welford_update(
+            count, getattr(stat, f"{metric}_mean") or 0.0, getattr(stat, f"{metric}_m2") or 0.0, value, sign
+        )
+        setattr(stat, f"{metric}_mean", mean)
+        setattr(stat, f"{metric}_m2", m2)
+        sketches[metric] = sketch_add(sketches.get(metric, {}), value, sign)
+    stat.sample_count = new_count
+    stat.sketches = sketches  # reassign so the JSON change is persisted
+
+def record_operation_times(db: Session, samples: Iterable[Sample], sign: int = 1):
+    """Fold confirmations into the statistics rows in the caller's transaction.
+
+    Missing rows are created first, then the rows of exactly the affected (routing,
+    operation, work center) keys are loaded and locked in one query, so postings for
+    other operations of the routing do not wait. Use sign=-1 when confirmations are
+    reversed.
+    """
+    grouped: Dict[tuple, list] = defaultdict(list)
+    for routing_id, operation_id, work_center_id, setup, machine, labor in samples:
+        if routing_id:
+            grouped[(routing_id, operation_id, work_center_id)].append((setup, machine, labor))
+    if not grouped:
+        return
+
+    if sign > 0:
+        _ensure_rows(db, list(grouped))
+
+    stat = models.OperationTimeStatistic
+    existing = {
+        (s.routing_id, s.operation_id, s.work_center_id): s
+        for s in db.query(stat).filter(
+            tuple_(stat.routing_id, stat.operation_id, stat.work_center_id).in_(list(grouped))
+        ).with_for_update().all()
+    }
+
+    for key, times_list in grouped.items():
+        row = existing.get(key)
+        if row is None:
+            continue  # reversal of a confirmation posted before statistics were kept
+        for times in times_list:
+            apply_sample(row, times, sign)
+
+def summarize(stat: models.OperationTimeStatistic, percentiles=(50, 90)) -> dict:
+    """Mean, standard deviation and percentiles per metric"""
+    summary = {
+        "routing_id": stat.routing_id,
+        "operation_id": stat.operation_id,
+        "work_center_id": stat.work_center_id,
+        "sample_count": stat.sample_count,
+        "updated_at": stat.updated_at
+    }
+    for metric in METRICS:
+        count = stat.sample_count or 0
+        m2 = getattr(stat, f"{metric}_m2") or 0.0
+        summary[metric] = {
+            "mean": getattr(stat, f"{metric}_mean"),
+            "stddev": math.sqrt(m2 / (count - 1)) if count > 1 else 0.0,
+            **{
+                f"p{p:g}": sketch_quantile((stat.sketches or {}).get(metric), p / 100.0)
+                for p in percentiles
+            }
+        }
+    return summary
@@ -0,0 +1,102 @@
+"""
+ORDER BOARD DELTAS
+
+Row-level changes of production orders for live order boards. A flush hook diffs
+every inserted, updated and deleted ProductionOrder (bulk_update_orders reports its
+Core updates the same way), changes are merged per order over the transaction,
+and the committed set is published as one "order_board_changes" event on the event
+bus. The WebSocket ConnectionManager turns each change into the insert, update
+(changed fields only) or delete a board subscription sees under its plant/status
+filter - an order whose status leaves the filter is deleted from the board.
+
+The event carries {"changes": {orderId: change}}, a change being {"op", "orderId",
+"plant", "status", "previous_plant", "previous_status", "changes": {field: new
+value}, "row": full board row}; "previous_*" are the values before the transaction
+and "row" is absent for deletes.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from database import models
+from utils.event_bus import publish_after_commit
+from utils.live_snapshot import BOARD_FIELDS, board_row, board_value
+from utils.websocket_manager import BOARD_CHANGES
+
+def _pending(session: Session) -> "OrderedDict[str, Dict[str, Any]]":
+    pending = session.info.get("order_board_changes")
+    if pending is None:
+        # Published by reference: changes flushed later in the transaction are included
+        pending = session.info["order_board_changes"] = OrderedDict()
+        publish_after_commit(session, {"type": BOARD_CHANGES, "changes": pending})
+    return pending
+
+def _record(session: Session, op: str, order_id: str, previous: Tuple[Any, Any], row: Dict[str, Any],
+            changes: Dict[str, Any]):
+    pending = _pending(session)
+    change = pending.pop(order_id, None)
+    if change is None:
+        change = {"op": op, "orderId": order_id, "previous_plant": previous[0], "previous_status": previous[1],
+                  "changes": {}}
+    elif op == "delete" and change["op"] == "insert":
+        return  # Created and deleted in the same transaction
+    elif op == "delete":
+        change["op"] = "delete"
+    change["changes"].update(changes)
+    if row is None:
+        change.pop("row", None)
+        change["plant"], change["status"] = previous
+    else:
+        change["row"] = row
+        change["plant"], change["status"] = row["plant"], row["status"]
+    pending[order_id] = change
+
+@event.listens_for(Session, "after_flush")
+def _collect_board_changes(session: Session, flush_context):
+    for order in session.new:
+        if isinstance(order, models.ProductionOrder):
+            row = board_row(order)
+            _record(session, "insert", order.orderId, (None, None), row, {})
+
+    for order in session.dirty:
+        if not isinstance(order, models.ProductionOrder):
+            continue
+        state = inspect(order)
+        changes, previous = {}, {}
+        for field in BOARD_FIELDS:
+            history = state.attrs[field].history
+            if history.has_changes():
+                changes[field] = board_value(getattr(order, field))
+                previous[field] = board_value(history.deleted[0]) if history.deleted else None
+        if changes.keys() - {"version"}:
+            row = board_row(order)
+            changes["version"] = row["version"]  # Bumped by the flush; clients need it for If-Match
+            _record(session, "update", order.orderId, (
+                previous.get("plant", row["plant"]), previous.get("status", row["status"])
+            ), row, changes)
+
+    for order in session.deleted:
+        if isinstance(order, models.ProductionOrder):
+            _record(session, "delete", order.orderId, (order.plant, board_value(order.status)), None, {})
+
+def record_bulk_update(session: Session, rows: List[Tuple[models.ProductionOrder, Dict[str, Any]]]):
+    """Board changes of (order, {field: new value}) applied by a Core UPDATE that bumped the versions"""
+    for order, values in rows:
+        row = board_row(order)
+        changes = {field: board_value(value) for field, value in values.items() if field in row}
+        changes["version"] = (order.version or 0) + 1
+        previous = (row["plant"], row["status"])
+        row.update(changes)
+        _record(session, "update", order.orderId, previous, row, changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_board_changes(session: Session):
+    session.info.pop("order_board_changes", None)
+
+@event.listens_for(Session, "after_commit")
+def _reset_board_changes(session: Session):
+    # Already handed to the event bus; start the next transaction empty
+    session.info.pop("order_board_changes", None)
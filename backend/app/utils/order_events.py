@@ -0,0 +1,299 @@
+"""
+EVENT-SOURCED PRODUCTION ORDER CHANGE LOG
+
+Every flush that changes a ProductionOrder records a typed change-set event
+(OrderChangeEvent: {field: {"old": ..., "new": ...}}) with a per-order sequence
+number, whichever endpoint made the change. A full state snapshot (OrderSnapshot) is
+written when an order is created, before the first event of an order that predates
+the log, and after every SNAPSHOT_INTERVAL events. Rebuilding an order as of a point
+in time replays only the events after the nearest snapshot. The base snapshot of an
+order that predates the log is dated at its earliest start date (the log does not know
+when it was created), or at its first change if it has none in the past.
+
+Endpoints describe their changes with set_change_context(); the context applies to
+every order change flushed until the transaction ends.
+
+Changes are captured from the unit of work, so ProductionOrder rows must only be
+updated through the ORM or bulk_update_orders(). Session-level UPDATE statements on
+production_orders (query.update(), session.execute(update(...))) are rejected.
+"""
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Enum, bindparam, case, event, insert, inspect, literal, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from database import models
+from utils.order_board import record_bulk_update
+
+SNAPSHOT_INTERVAL = 20
+
+# Fields that are part of the order's event-sourced state
+_UNTRACKED_FIELDS = {"id", "orderId", "eventSequence", "version"}
+TRACKED_FIELDS = [
+    c.name for c in models.ProductionOrder.__table__.columns if c.name not in _UNTRACKED_FIELDS
+]
+
+# Planning fields a rollback restores (status, progress and confirmation totals stay with CO11N)
+ROLLBACK_FIELDS = [
+    "materialId", "description", "quantity", "priority", "plannedStartDate", "plannedEndDate",
+    "dueDate", "workCenterId", "routingId", "costCenter", "plant"
+]
+
+def encode_value(field: str, value: Any) -> Any:
+    """JSON-safe representation of an order field value"""
+    if value is None:
+        return None
+    column_type = models.ProductionOrder.__table__.columns[field].type
+    if isinstance(column_type, DateTime) and isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(column_type, Enum):
+        return value.value if hasattr(value, "value") else value
+    return value
+
+def decode_value(field: str, value: Any) -> Any:
+    """Typed order field value from its JSON representation"""
+    if value is None:
+        return None
+    column_type = models.ProductionOrder.__table__.columns[field].type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(column_type, Enum) and column_type.enum_class:
+        return column_type.enum_class(value)
+    return value
+
+def encode_state(order: models.ProductionOrder) -> Dict[str, Any]:
+    return {field: encode_value(field, getattr(order, field)) for field in TRACKED_FIELDS}
+
+def decode_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: decode_value(field, value) for field, value in state.items()}
+
+def set_change_context(db: Session, change_type: str, reason: Optional[str] = None,
+                       changed_by: str = "SYSTEM") -> str:
+    """Describe the order changes of the current transaction.
+
+    Returns the change set ID given to the first changed order's event. Merges into the
+    existing context, so change sets already flushed in the transaction stay linked.
+    """
+    change_set_id = f"CS{uuid.uuid4().hex[:10].upper()}"
+    db.info.setdefault("order_change_context", {}).update({
+        "change_set_id": change_set_id,
+        "change_type": change_type,
+        "reason": reason,
+        "changed_by": changed_by
+    })
+    return change_set_id
+
+def _snapshot(order_id: str, sequence: int, state: Dict[str, Any], timestamp: datetime) -> dict:
+    return {"order_id": order_id, "sequence": sequence, "state": state, "snapshot_timestamp": timestamp}
+
+def _base_snapshot(order_id: str, state: Dict[str, Any], now: datetime) -> dict:
+    """Base snapshot of an order that predates the log, dated as early as its state is known to hold"""
+    starts = [decode_value(field, state.get(field)) for field in ("actualStartDate", "plannedStartDate")]
+    return _snapshot(order_id, 0, state, min([start for start in starts if start is not None] + [now]))
+
+_BULK_UPDATE_OPTION = "order_events_recorded"
+
+@event.listens_for(Session, "do_orm_execute")
+def _reject_untracked_order_updates(orm_execute_state):
+    """UPDATE statements bypass before_flush, so their order changes would never be logged"""
+    if not orm_execute_state.is_update or orm_execute_state.execution_options.get(_BULK_UPDATE_OPTION):
+        return
+    if orm_execute_state.statement.table.name == models.ProductionOrder.__tablename__:
+        raise RuntimeError(
+            "UPDATE of production_orders outside the unit of work; use utils.order_events.bulk_update_orders"
+        )
+
+@event.listens_for(Session, "before_flush")
+def _record_order_changes(session: Session, flush_context, instances):
+    """Collect change sets of the orders about to be flushed (written in after_flush)"""
+    now = datetime.now()
+    context = session.info.setdefault("order_change_context", {})
+    events, snapshots = [], []
+    session.info["pending_order_events"] = (events, snapshots)
+
+    for obj in list(session.new):
+        if isinstance(obj, models.ProductionOrder):
+            obj.eventSequence = 0
+            snapshots.append(_snapshot(obj.orderId, 0, encode_state(obj), now))
+
+    for obj in list(session.dirty):
+        if not isinstance(obj, models.ProductionOrder) or obj in session.new:
+            continue
+
+        state = inspect(obj)
+        changes = {}
+        for field in TRACKED_FIELDS:
+            history = state.attrs[field].history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            if encode_value(field, old) != encode_value(field, new):
+                changes[field] = {"old": encode_value(field, old), "new": encode_value(field, new)}
+        if not changes:
+            continue
+
+        if obj.eventSequence is None:
+            # Order predates the change log: its state before this change is the base snapshot
+            before = encode_state(obj)
+            before.update({field: diff["old"] for field, diff in changes.items()})
+            snapshots.append(_base_snapshot(obj.orderId, before, now))
+            obj.eventSequence = 0
+
+        sequence = obj.eventSequence + 1
+        obj.eventSequence = sequence
+        change_set_id = context.pop("change_set_id", None) or f"CS{uuid.uuid4().hex[:10].upper()}"
+        context.setdefault("change_set_ids", {})[obj.orderId] = change_set_id
+        events.append({
+            "change_set_id": change_set_id,
+            "order_id": obj.orderId,
+            "sequence": sequence,
+            "change_type": context.get("change_type", "UPDATE"),
+            "changes": changes,
+            "reason": context.get("reason"),
+            "changed_by": context.get("changed_by", "SYSTEM"),
+            "change_timestamp": now
+        })
+
+        if sequence % SNAPSHOT_INTERVAL == 0:
+            snapshots.append(_snapshot(obj.orderId, sequence, encode_state(obj), now))
+
+@event.listens_for(Session, "after_flush")
+def _write_order_changes(session: Session, flush_context):
+    """Bulk insert the collected change sets once the (version-checked) order rows are written"""
+    events, snapshots = session.info.pop("pending_order_events", ([], []))
+    if events:
+        session.execute(insert(models.OrderChangeEvent), events)
+    if snapshots:
+        session.execute(insert(models.OrderSnapshot), snapshots)
+
+def _check_matched(matched: int, expected: int):
+    if matched != expected:
+        raise StaleDataError(
+            f"UPDATE statement on table 'production_orders' expected to update {expected} row(s); "
+            f"{matched} were matched."
+        )
+
+def bulk_update_orders(db: Session, updates: List[Tuple[models.ProductionOrder, Dict[str, Any]]], change_type: str,
+                       reason: Optional[str] = None, changed_by: str = "SYSTEM", chunk_size: int = 500) -> int:
+    """Apply {field: value} updates to many loaded orders in batched UPDATE statements.
+
+    Bypasses the unit of work (which updates versioned rows one statement at a time)
+    but keeps its guarantees: every statement checks and increments the orders'
+    versions - StaleDataError if one was changed concurrently - and each changed order
+    gets its change-set event. Returns the number of orders changed.
+    """
+    now = datetime.now()
+    table = models.ProductionOrder.__table__
+    events, snapshots, rows = [], [], []
+    for order, values in updates:
+        changes = {}
+        for field, value in values.items():
+            old, new = encode_value(field, getattr(order, field)), encode_value(field, value)
+            if old != new:
+                changes[field] = {"old": old, "new": new}
+        if not changes:
+            continue
+
+        sequence = order.eventSequence
+        if sequence is None:
+            snapshots.append(_base_snapshot(order.orderId, encode_state(order), now))
+            sequence = 0
+        sequence += 1
+        events.append({
+            "change_set_id": f"CS{uuid.uuid4().hex[:10].upper()}",
+            "order_id": order.orderId,
+            "sequence": sequence,
+            "change_type": change_type,
+            "changes": changes,
+            "reason": reason,
+            "changed_by": changed_by,
+            "change_timestamp": now
+        })
+        if sequence % SNAPSHOT_INTERVAL == 0:
+            state = encode_state(order)
+            state.update({field: diff["new"] for field, diff in changes.items()})
+            snapshots.append(_snapshot(order.orderId, sequence, state, now))
+        rows.append((order, {**{field: values[field] for field in changes}, "eventSequence": sequence}))
+
+    if db.get_bind().dialect.supports_sane_multi_rowcount:
+        # One executemany per set of changed fields; the driver reports the matched rows
+        by_fields: Dict[Tuple[str, ...], list] = {}
+        for order, values in rows:
+            by_fields.setdefault(tuple(sorted(values)), []).append(
+                {"order_pk": order.id, "order_version": order.version, **{f"new_{f}": v for f, v in values.items()}}
+            )
+        for fields, params in by_fields.items():
+            statement = update(table).where(
+                table.c.id == bindparam("order_pk"), table.c.version == bindparam("order_version")
+            ).values(
+                {"version": table.c.version + 1, **{field: bindparam(f"new_{field}") for field in fields}}
+            ).execution_options(**{_BULK_UPDATE_OPTION: True})
+            for i in range(0, len(params), chunk_size):
+                _check_matched(db.execute(statement, params[i:i + chunk_size]).rowcount, len(params[i:i + chunk_size]))
+    else:
+        # One UPDATE ... SET field = CASE id WHEN ... per chunk
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            assignments = {"version": table.c.version + 1}
+            for field in {field for _, values in chunk for field in values}:
+                assignments[field] = case(
+                    {order.id: literal(values[field], table.c[field].type) for order, values in chunk if field in values},
+                    value=table.c.id, else_=table.c[field]
+                )
+            result = db.execute(
+                update(table).where(
+                    table.c.id.in_([order.id for order, _ in chunk]),
+                    table.c.version == case({order.id: order.version for order, _ in chunk}, value=table.c.id)
+                ).values(assignments).execution_options(**{_BULK_UPDATE_OPTION: True})
+            )
+            _check_matched(result.rowcount, len(chunk))
+
+    if events:
+        db.execute(insert(models.OrderChangeEvent), events)
+    if snapshots:
+        db.execute(insert(models.OrderSnapshot), snapshots)
+    record_bulk_update(db, rows)
+    return len(rows)
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _clear_change_context(session: Session):
+    session.info.pop("order_change_context", None)
+    session.info.pop("pending_order_events", None)
+
+def replay_order_state(db: Session, order_id: str, as_of: Optional[datetime] = None,
+                       sequence: Optional[int] = None) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Rebuild an order's state as of a timestamp or up to a sequence number.
+
+    Starts from the nearest snapshot at or before the target and applies only the
+    events after it. Returns (decoded state, sequence) or None when the log does not
+    reach back that far.
+    """
+    snapshot_query = db.query(models.OrderSnapshot).filter(models.OrderSnapshot.order_id == order_id)
+    event_query = db.query(models.OrderChangeEvent).filter(models.OrderChangeEvent.order_id == order_id)
+    if as_of is not None:
+        snapshot_query = snapshot_query.filter(models.OrderSnapshot.snapshot_timestamp <= as_of)
+        event_query = event_query.filter(models.OrderChangeEvent.change_timestamp <= as_of)
+    if sequence is not None:
+        snapshot_query = snapshot_query.filter(models.OrderSnapshot.sequence <= sequence)
+        event_query = event_query.filter(models.OrderChangeEvent.sequence <= sequence)
+
+    snapshot = snapshot_query.order_by(models.OrderSnapshot.sequence.desc()).first()
+    if not snapshot:
+        return None
+
+    state = dict(snapshot.state)
+    current_sequence = snapshot.sequence
+    for change_event in event_query.filter(
+        models.OrderChangeEvent.sequence > snapshot.sequence
+    ).order_by(models.OrderChangeEvent.sequence).all():
+        for field, diff in change_event.changes.items():
+            state[field] = diff["new"]
+        current_sequence = change_event.sequence
+
+    return decode_state(state), current_sequence
@@ -0,0 +1,163 @@
+"""
+READ-THROUGH ROUTING CACHE
+
+Routings and their operations are master data that change rarely but are read on
+every CO11N posting. This process-local cache keeps each routing with its operations
+(sorted by sequence) as immutable named tuples in a bounded LRU.
+
+- Every routing write bumps `Routing.revision` and invalidates the local entry
+- Entries older than `revalidate_after` seconds are revalidated against the DB with
+  one `routing_id IN (...)` query on the (id, revision) stamp, so other worker
+  processes notice changes cheaply; only routings whose stamp moved are reloaded
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import models
+from utils import config
+
+OPERATION_FIELDS = (
+    "id", "operation_id", "routing_id", "work_center_id", "description", "sequence",
+    "setup_time", "machine_time", "labor_time", "status", "control_key", "created_at", "updated_at"
+)
+ROUTING_FIELDS = (
+    "id", "routing_id", "material_id", "description", "version", "status", "plant",
+    "valid_from", "valid_to", "created_at", "updated_at", "revision"
+)
+
+CachedOperation = namedtuple("CachedOperation", OPERATION_FIELDS)
+
+class CachedRouting(namedtuple("CachedRouting", ROUTING_FIELDS + ("operations",))):
+    __slots__ = ()
+
+    def find_operation(self, operation_id: str) -> Optional[CachedOperation]:
+        for operation in self.operations:
+            if operation.operation_id == operation_id:
+                return operation
+        return None
+
+class RoutingCache:
+    def __init__(self, max_size: int = 1024, revalidate_after: float = 5.0):
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self._entries: "OrderedDict[str, list]" = OrderedDict()  # routing_id -> [routing, checked_at]
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "revalidations": 0, "reloads": 0, "evictions": 0}
+
+    def get(self, db: Session, routing_id: Optional[str]) -> Optional[CachedRouting]:
+        if not routing_id:
+            return None
+        return self.get_many(db, [routing_id]).get(routing_id)
+
+    def get_many(self, db: Session, routing_ids: Iterable[str]) -> Dict[str, CachedRouting]:
+        """Cached routings by ID; unknown routings are absent from the result"""
+        now = time.monotonic()
+        result: Dict[str, CachedRouting] = {}
+        missing = []
+        stale: Dict[str, CachedRouting] = {}
+
+        with self._lock:
+            for routing_id in {r for r in routing_ids if r}:
+                entry = self._entries.get(routing_id)
+                if entry is None:
+                    missing.append(routing_id)
+                    continue
+                self._entries.move_to_end(routing_id)
+                if now - entry[1] > self.revalidate_after:
+                    stale[routing_id] = entry[0]
+                else:
+                    result[routing_id] = entry[0]
+            self._counters["hits"] += len(result)
+            self._counters["misses"] += len(missing)
+
+        if stale:
+            # (row id, revision) also detects a routing deleted and re-created under the same ID
+            current = {
+                routing_id: (row_id, revision)
+                for routing_id, row_id, revision in db.query(
+                    models.Routing.routing_id, models.Routing.id, models.Routing.revision
+                ).filter(models.Routing.routing_id.in_(stale)).all()
+            }
+            with self._lock:
+                self._counters["revalidations"] += len(stale)
+                for routing_id, routing in stale.items():
+                    if current.get(routing_id) == (routing.id, routing.revision):
+                        result[routing_id] = routing
+                        entry = self._entries.get(routing_id)
+                        if entry is not None and entry[0] is routing:
+                            entry[1] = now
+                    else:
+                        self._entries.pop(routing_id, None)
+                        if routing_id in current:
+                            missing.append(routing_id)
+
+        if missing:
+            loaded = self._load(db, missing)
+            with self._lock:
+                self._counters["reloads"] += len(loaded)
+                for routing_id, routing in loaded.items():
+                    self._entries[routing_id] = [routing, now]
+                    self._entries.move_to_end(routing_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self._counters["evictions"] += 1
+            result.update(loaded)
+
+        return result
+
+    def _load(self, db: Session, routing_ids) -> Dict[str, CachedRouting]:
+        routings = db.query(models.Routing).filter(models.Routing.routing_id.in_(routing_ids)).all()
+        operations: Dict[str, list] = {r.routing_id: [] for r in routings}
+        for op in db.query(models.Operation).filter(
+            models.Operation.routing_id.in_(operations)
+        ).order_by(models.Operation.routing_id, models.Operation.sequence).all():
+            operations[op.routing_id].append(CachedOperation(*(getattr(op, f) for f in OPERATION_FIELDS)))
+
+        return {
+            r.routing_id: CachedRouting(
+                *(getattr(r, f) for f in ROUTING_FIELDS), tuple(operations[r.routing_id])
+            ) for r in routings
+        }
+
+    def invalidate(self, routing_id: Optional[str] = None):
+        """Drop one routing (or everything) from this process's cache"""
+        with self._lock:
+            if routing_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(routing_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, **self._counters}
+
+def active_routing_ids(db: Session, material_ids: Iterable[str]) -> Dict[str, str]:
+    """Active routing per material (highest version, then lowest routing ID), one query"""
+    material_ids = {m for m in material_ids if m}
+    if not material_ids:
+        return {}
+    result: Dict[str, str] = {}
+    for material_id, routing_id in db.query(models.Routing.material_id, models.Routing.routing_id).filter(
+        models.Routing.material_id.in_(material_ids),
+        models.Routing.status == models.RoutingStatus.ACTIVE
+    ).order_by(models.Routing.material_id, models.Routing.version.desc(), models.Routing.routing_id):
+        result.setdefault(material_id, routing_id)
+    return result
+
+def bump_revision(db: Session, routing_id: str):
+    """Mark a routing as changed for every worker's cache (in the caller's transaction)"""
+    db.query(models.Routing).filter(models.Routing.routing_id == routing_id).update(
+        {models.Routing.revision: func.coalesce(models.Routing.revision, 1) + 1}, synchronize_session=False
+    )
+
+# Global routing cache instance
+routing_cache = RoutingCache(
+    max_size=config.settings.routing_cache_size,
+    revalidate_after=config.settings.routing_cache_revalidate_seconds
+)
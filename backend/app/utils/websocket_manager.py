@@ -1,72 +1,609 @@
+"""
+WEBSOCKET CONNECTIONS AND TOPIC SUBSCRIPTIONS
+
+Clients subscribe to topics over four dimensions: event type, plant, work center
+and order. A topic constrains one or more dimensions, e.g. "plant:1000" or
+{"plant": "1000", "type": ["order_created", "order_completed"]} (a list means
+any of the values); a client receives an event when any of its topics matches.
+Bare strings such as "goods_receipt" are event types and "*" matches everything.
+Until a client subscribes it receives all events.
+
+Subscriptions live in an inverted index from topic key - the sorted
+(dimension, value) pairs it constrains - to connections. An event of type T in
+plant P (work center W, order O) can only match the 2^4 keys built from subsets of
+its own (dimension, value) pairs, so a broadcast does a fixed number of index
+lookups and touches only the matching connections.
+
+Delivery is decoupled from broadcasting: every connection has a bounded outbound
+queue drained by its own writer task. A broadcast serializes the event once and
+only appends the shared text to the subscribers' queues, so it never waits for a
+client. When a client's queue is full, WS_SLOW_CONSUMER_POLICY decides:
+
+- drop:       discard the oldest queued message
+- coalesce:   replace a queued message for the same event type and topic (e.g. an
+              older status of the same order), otherwise drop the oldest
+- disconnect: close the connection; the client reconnects and resubscribes
+
+Broadcast events carry a sequence number, increasing per stream (one stream per
+worker process, announced in connection_established), and are kept in a ring
+buffer of WS_REPLAY_BUFFER_SIZE events. A client sees gaps in the numbers (it
+only receives its topics); after a reconnect it subscribes again and sends
+{"type": "resume", "stream": ..., "last_seq": n}. If the buffer still holds every
+event after n, the matching ones are replayed, followed by "resumed"; otherwise
+(evicted, or another stream) it receives a "snapshot" of the current state taken
+at "seq", with live events held back until the snapshot has been queued.
+
+Busy dashboards can opt into batched delivery by requesting a WebSocket
+subprotocol at connect: "sap.batch.msgpack" (MessagePack binary frames, offered
+when msgpack is installed) or "sap.batch.json". Their events are coalesced per
+event type and topic over WS_COALESCE_WINDOW_MS - the latest event wins,
+quantity deltas are summed - and sent as one columnar frame per window:
+
+    {"type": "batch", "seq": <last seq>, "received": <events>,
+     "events": {"<event type>": {"fields": [...], "rows": [[...], ...]}}}
+
+Rows carry "coalesced" when they merge several events. Other server messages use
+the same encoding; client messages stay JSON text. Frames are compressed with
+permessage-deflate where the client supports it (uvicorn's default).
+
+Order boards replace polling the order list: {"type": "subscribe_board", "plant":
+..., "status": [...]} (both optional, single value or list) answers with a
+"board_snapshot" of the matching rows, then every committed transaction that
+touches matching orders sends one "board_delta" with row operations
+(utils/order_board.py): insert (full row), update (changed fields) and delete,
+including orders that enter or leave the filter. Clients apply them as upserts;
+deltas committed while the snapshot was read may repeat rows it already has.
+After a reconnect a client subscribes to its board again.
+"""
+
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Callable, Iterable, Optional, Set, Tuple
+from collections import OrderedDict, deque
+from utils import config
+import itertools
 import json
 import asyncio
 import logging
+import uuid
+
+try:
+    import msgpack
+except ImportError:  # Optional: without it only the JSON batch protocol is offered
+    msgpack = None
 
 logger = logging.getLogger(__name__)
 
-class ConnectionManager:
+TopicKey = Tuple[Tuple[str, str], ...]
+
+TOPIC_DIMENSIONS = ("type", "plant", "work_center", "order")
+# Message field each topic dimension is read from
+MESSAGE_TOPIC_FIELDS = {"type": "type", "plant": "plant", "work_center": "work_center", "order": "order_id"}
+TOPIC_ALIASES = {"event": "type", "event_type": "type", "work_center_id": "work_center", "order_id": "order"}
+MAX_KEYS_PER_TOPIC = 256
+ALL_EVENTS: TopicKey = ()
+SLOW_CONSUMER_POLICIES = ("drop", "coalesce", "disconnect")
+BOARD_CHANGES = "order_board_changes"  # Event type of committed order row changes (utils/order_board.py)
+BATCH_PROTOCOLS = ("sap.batch.msgpack", "sap.batch.json")
+# Fields holding deltas: summed, not replaced, when events are coalesced
+COALESCE_SUM_FIELDS = {"goods_receipt": ("qty",), "confirmations_ingested": ("processed", "failed")}
+COALESCE_APPEND_FIELDS = {"confirmations_ingested": ("confirmations",)}
+
+def _values(value) -> List[str]:
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return sorted({str(v) for v in values if v is not None and str(v) != ""})
+
+def parse_topic(topic) -> List[TopicKey]:
+    """Index keys of a client topic (string or {dimension: value(s)}); raises ValueError"""
+    if isinstance(topic, str):
+        topic = topic.strip()
+        if topic == "*":
+            return [ALL_EVENTS]
+        if ":" not in topic:
+            topic = {"type": topic}
+        else:
+            dimension, _, value = topic.partition(":")
+            topic = {dimension.strip(): value.strip()}
+    if not isinstance(topic, dict) or not topic:
+        raise ValueError(f"Invalid topic: {topic!r}")
+
+    choices = []
+    for dimension, value in topic.items():
+        dimension = TOPIC_ALIASES.get(dimension, dimension)
+        if dimension not in TOPIC_DIMENSIONS:
+            raise ValueError(f"Unknown topic dimension '{dimension}' (expected one of {', '.join(TOPIC_DIMENSIONS)})")
+        values = _values(value)
+        if not values:
+            raise ValueError(f"Topic dimension '{dimension}' has no value")
+        choices.append([(dimension, v) for v in values])
+
+    keys = [tuple(sorted(combination, key=lambda pair: TOPIC_DIMENSIONS.index(pair[0])))
+            for combination in itertools.islice(itertools.product(*choices), MAX_KEYS_PER_TOPIC + 1)]
+    if len(keys) > MAX_KEYS_PER_TOPIC:
+        raise ValueError(f"Topic expands to more than {MAX_KEYS_PER_TOPIC} combinations")
+    return keys
+
+def format_topic(key: TopicKey) -> str:
+    return "/".join(f"{dimension}:{value}" for dimension, value in key) or "*"
+
+def event_keys(attributes: Dict[str, Any]) -> Iterable[TopicKey]:
+    """All index keys an event with these topic attributes matches"""
+    choices = [[None] + [(dimension, v) for v in _values(attributes.get(dimension))] for dimension in TOPIC_DIMENSIONS]
+    for combination in itertools.product(*choices):
+        yield tuple(pair for pair in combination if pair is not None)
+
+class SendQueue:
+    """Bounded outbound queue of serialized messages (text or binary frames) for one connection"""
+
+    def __init__(self, max_size: int, policy: str):
+        self.max_size = max_size
+        self.policy = policy
+        self._items = deque()  # [coalesce key, text] slots
+        self._latest: Dict[Any, list] = {}  # coalesce key -> newest queued slot
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, text, key: Any = None) -> bool:
+        """Queue a message; False when the queue is full and the policy is disconnect"""
+        if len(self._items) >= self.max_size:
+            if self.policy == "disconnect":
+                return False
+            slot = self._latest.get(key) if key is not None and self.policy == "coalesce" else None
+            if slot is not None:
+                slot[1] = text
+                self.coalesced += 1
+                return True
+            self._forget(self._items.popleft())
+            self.dropped += 1
+        slot = [key, text]
+        self._items.append(slot)
+        if key is not None:
+            self._latest[key] = slot
+        self._ready.set()
+        return True
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        slot = self._items.popleft()
+        self._forget(slot)
+        return slot[1]
+
+    def _forget(self, slot: list):
+        if slot[0] is not None and self._latest.get(slot[0]) is slot:
+            del self._latest[slot[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._items), "sent": self.sent, "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped, "coalesced": self.coalesced
+        }
+
+class EventBatch:
+    """Events coalesced for one batching connection until its window closes"""
+
     def __init__(self):
+        self.entries: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()  # coalesce key -> event
+        self.received = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, message: Dict[str, Any], key: Any):
+        self.received += 1
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            event_type = message.get("type")
+            merged = dict(message)
+            for field in COALESCE_SUM_FIELDS.get(event_type, ()):
+                merged[field] = (previous.get(field) or 0) + (message.get(field) or 0)
+            for field in COALESCE_APPEND_FIELDS.get(event_type, ()):
+                merged[field] = list(previous.get(field) or ()) + list(message.get(field) or ())
+            merged["coalesced"] = previous.get("coalesced", 1) + 1
+            message = merged
+        self.entries[key] = message  # (Re)inserted last: entries stay in sequence order
+
+    def frame(self) -> Dict[str, Any]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for message in self.entries.values():
+            groups.setdefault(message.get("type"), []).append(message)
+        events = {}
+        for event_type, messages in groups.items():
+            fields = sorted({field for message in messages for field in message} - {"type"})
+            events[event_type] = {"fields": fields, "rows": [[m.get(f) for f in fields] for m in messages]}
+        return {
+            "type": "batch",
+            "seq": max((m.get("seq") or 0 for m in self.entries.values()), default=0),
+            "received": self.received,
+            "events": events
+        }
+
+class ConnectionManager:
+    def __init__(self, queue_size: int = None, slow_consumer_policy: str = None, send_timeout: float = None,
+                 replay_size: int = None, coalesce_window_ms: int = None):
         self.active_connections: List[WebSocket] = []
         self.connection_info: Dict[WebSocket, Dict[str, Any]] = {}
+        self.subscribers: Dict[TopicKey, Set[WebSocket]] = {}  # Inverted index: topic key -> connections
+        self.connection_topics: Dict[WebSocket, Set[TopicKey]] = {}
+        self.queues: Dict[WebSocket, SendQueue] = {}
+        self.writers: Dict[WebSocket, asyncio.Task] = {}
+        self.queue_size = queue_size or config.settings.ws_send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy or config.settings.ws_slow_consumer_policy
+        self.send_timeout = send_timeout or config.settings.ws_send_timeout_seconds
+        if self.slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"WS_SLOW_CONSUMER_POLICY must be one of {', '.join(SLOW_CONSUMER_POLICIES)}")
+        self.slow_consumer_disconnects = 0
+        # Batching connections (opt-in subprotocol) and their pending window
+        self.batches: Dict[WebSocket, EventBatch] = {}
+        self.coalesce_window = (coalesce_window_ms or config.settings.ws_coalesce_window_ms) / 1000.0
+        # Event stream: sequence numbers and the replay ring buffer of (seq, topic attributes, text, key, message)
+        self.stream_id = uuid.uuid4().hex
+        self.sequence = 0
+        self.replay_buffer = deque(maxlen=replay_size or config.settings.ws_replay_buffer_size)
+        self.held: Dict[WebSocket, list] = {}  # Deliveries held back while a snapshot is built
+        # Callable(plants or None for all) -> JSON-serializable state; set by the application
+        self.snapshot_provider: Optional[Callable[[Optional[Set[str]]], Dict[str, Any]]] = None
+        # Order boards: filter per connection, connections by plant (None: all plants)
+        self.boards: Dict[WebSocket, Dict[str, Optional[Set[str]]]] = {}
+        self.board_index: Dict[Optional[str], Set[WebSocket]] = {}
+        # Callable(plants, statuses) -> board rows; set by the application
+        self.board_snapshot_provider: Optional[Callable[[Optional[Set[str]], Optional[Set[str]]], List[Dict[str, Any]]]] = None
 
     async def connect(self, websocket: WebSocket, client_id: str = None):
-        """Accept a new WebSocket connection"""
-        await websocket.accept()
+        """Accept a new WebSocket connection, negotiating the batch protocol if requested"""
+        supported = [p for p in BATCH_PROTOCOLS if p != "sap.batch.msgpack" or msgpack is not None]
+        protocol = next((p for p in websocket.scope.get("subprotocols") or () if p in supported), None)
+        await websocket.accept(subprotocol=protocol)
         self.active_connections.append(websocket)
         self.connection_info[websocket] = {
             "client_id": client_id,
-            "connected_at": asyncio.get_event_loop().time()
+            "connected_at": asyncio.get_event_loop().time(),
+            "explicit_subscriptions": False,
+            "protocol": protocol or "json"
         }
+        if protocol:
+            self.batches[websocket] = EventBatch()
+        self._add_keys(websocket, [ALL_EVENTS])  # Everything until the client subscribes
+        self.queues[websocket] = SendQueue(self.queue_size, self.slow_consumer_policy)
+        self.writers[websocket] = asyncio.create_task(self._writer(websocket, self.queues[websocket]))
         logger.info(f"WebSocket connection established. Client ID: {client_id}")
         
         # Send welcome message
         await self.send_personal_message({
             "type": "connection_established",
             "message": "Connected to SAP Manufacturing System",
-            "client_id": client_id
+            "client_id": client_id,
+            "stream": self.stream_id,
+            "seq": self.sequence,
+            "protocol": protocol or "json"
         }, websocket)
 
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+            self._remove_keys(websocket, list(self.connection_topics.get(websocket, ())))
+            self.connection_topics.pop(websocket, None)
+            self.queues.pop(websocket, None)
+            self.held.pop(websocket, None)
+            self._remove_board(websocket)
+            batch = self.batches.pop(websocket, None)
+            if batch is not None and batch.timer is not None:
+                batch.timer.cancel()
+            writer = self.writers.pop(websocket, None)
+            if writer is not None and writer is not asyncio.current_task():
+                writer.cancel()
             client_info = self.connection_info.pop(websocket, {})
             client_id = client_info.get("client_id", "unknown")
             logger.info(f"WebSocket connection closed. Client ID: {client_id}")
 
-    async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
-        """Send a message to a specific WebSocket connection"""
+    # Delivery
+    async def _writer(self, websocket: WebSocket, queue: SendQueue):
+        """Drain one connection's queue; a failed or timed-out send drops the connection"""
         try:
-            await websocket.send_text(json.dumps(message))
+            while True:
+                data = await queue.get()
+                if isinstance(data, bytes):
+                    await asyncio.wait_for(websocket.send_bytes(data), self.send_timeout)
+                else:
+                    await asyncio.wait_for(websocket.send_text(data), self.send_timeout)
+                queue.sent += 1
+                queue.bytes_sent += len(data)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
+            logger.warning(f"Dropping WebSocket connection after failed send: {e!r}")
             self.disconnect(websocket)
+            await self._close(websocket)
+
+    def _enqueue(self, websocket: WebSocket, text: str, key: Any = None):
+        queue = self.queues.get(websocket)
+        if queue is None:
+            return
+        if not queue.put(text, key):
+            client_id = self.connection_info.get(websocket, {}).get("client_id", "unknown")
+            logger.warning(f"Disconnecting slow WebSocket consumer {client_id} ({len(queue)} messages queued)")
+            self.slow_consumer_disconnects += 1
+            self.disconnect(websocket)
+            asyncio.ensure_future(self._close(websocket))
+
+    def _encode(self, websocket: WebSocket, message: Dict[str, Any]):
+        if self.connection_info.get(websocket, {}).get("protocol") == "sap.batch.msgpack":
+            return msgpack.packb(message, default=str)
+        return json.dumps(message, default=str)
+
+    def _deliver(self, websocket: WebSocket, text: str, key: Any, message: Dict[str, Any]):
+        """Queue a broadcast event: directly, or into the connection's coalescing window"""
+        batch = self.batches.get(websocket)
+        if batch is None:
+            self._enqueue(websocket, text, key)
+            return
+        batch.add(message, key)
+        if batch.timer is None:
+            batch.timer = asyncio.get_event_loop().call_later(self.coalesce_window, self._flush, websocket)
+
+    def _flush(self, websocket: WebSocket):
+        batch = self.batches.get(websocket)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self.batches[websocket] = EventBatch()
+        if batch.entries:
+            self._enqueue(websocket, self._encode(websocket, batch.frame()))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    # Subscriptions
+    def _add_keys(self, websocket: WebSocket, keys: Iterable[TopicKey]):
+        topics = self.connection_topics.setdefault(websocket, set())
+        for key in keys:
+            self.subscribers.setdefault(key, set()).add(websocket)
+            topics.add(key)
+
+    def _remove_keys(self, websocket: WebSocket, keys: Iterable[TopicKey]):
+        topics = self.connection_topics.get(websocket, set())
+        for key in keys:
+            connections = self.subscribers.get(key)
+            if connections is not None:
+                connections.discard(websocket)
+                if not connections:
+                    del self.subscribers[key]
+            topics.discard(key)
+
+    def subscribe(self, websocket: WebSocket, topics: List[Any]) -> List[str]:
+        """Add topics to a connection; the first explicit subscription replaces the implicit '*'.
+
+        Raises ValueError without changing the subscriptions when no topic is given.
+        """
+        keys = [key for topic in topics for key in parse_topic(topic)]
+        if not keys:
+            raise ValueError("subscribe requires at least one topic")
+        info = self.connection_info.get(websocket)
+        if info is not None and not info["explicit_subscriptions"]:
+            info["explicit_subscriptions"] = True
+            self._remove_keys(websocket, [ALL_EVENTS])
+        self._add_keys(websocket, keys)
+        return self.get_subscriptions(websocket)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Optional[List[Any]] = None) -> List[str]:
+        """Remove topics from a connection (all topics when none are given)"""
+        if topics is None:
+            keys = list(self.connection_topics.get(websocket, ()))
+        else:
+            keys = [key for topic in topics for key in parse_topic(topic)]
+        self._remove_keys(websocket, keys)
+        return self.get_subscriptions(websocket)
+
+    def get_subscriptions(self, websocket: WebSocket) -> List[str]:
+        return sorted(format_topic(key) for key in self.connection_topics.get(websocket, ()))
+
+    def subscribers_for(self, attributes: Dict[str, Any]) -> Set[WebSocket]:
+        """Connections with a topic matching an event's topic attributes"""
+        matched: Set[WebSocket] = set()
+        for key in event_keys(attributes):
+            connections = self.subscribers.get(key)
+            if connections:
+                matched |= connections
+        return matched
+
+    async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
+        """Queue a message for a specific WebSocket connection"""
+        self._send(websocket, message)
+
+    def _send(self, websocket: WebSocket, message: Dict[str, Any]):
+        if websocket in self.batches:
+            self._flush(websocket)  # Keep events queued before this message ahead of it
+        self._enqueue(websocket, self._encode(websocket, message))
+
+    async def broadcast(self, message: Dict[str, Any], topics: Optional[Dict[str, Any]] = None):
+        """Send a message to the clients subscribed to it (from the event loop)"""
+        self.dispatch(message, topics)
+
+    def dispatch(self, message: Dict[str, Any], topics: Optional[Dict[str, Any]] = None):
+        """Queue a message for the clients subscribed to it; must run on the event loop.
+
+        The event's topic attributes are read from the message (type, plant,
+        work_center, order_id); `topics` adds or overrides them, e.g. the list of
+        orders of a batch event. Other threads publish through utils/event_bus.py.
+        """
+        if message.get("type") == BOARD_CHANGES:
+            self.dispatch_board(message)
+            return
+
+        attributes = {dimension: message.get(field) for dimension, field in MESSAGE_TOPIC_FIELDS.items()}
+        attributes.update(topics or {})
+
+        # Sequence and timestamp; serialized once, shared by all queues and the replay buffer
+        self.sequence += 1
+        message["seq"] = self.sequence
+        message["timestamp"] = asyncio.get_event_loop().time()
+        text = json.dumps(message, default=str)
+        key = (message.get("type"),) + tuple(tuple(_values(attributes.get(d))) for d in TOPIC_DIMENSIONS)
+        self.replay_buffer.append((self.sequence, attributes, text, key, message))
 
-    async def broadcast(self, message: Dict[str, Any]):
-        """Broadcast a message to all connected clients"""
         if not self.active_connections:
             logger.debug("No active connections for broadcast")
             return
+        for connection in list(self.subscribers_for(attributes)):
+            held = self.held.get(connection)
+            if held is not None:
+                held.append(lambda connection=connection: self._deliver(connection, text, key, message))
+            else:
+                self._deliver(connection, text, key, message)
 
-        # Add timestamp to message
-        message["timestamp"] = asyncio.get_event_loop().time()
-        
-        disconnected_connections = []
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except WebSocketDisconnect:
-                disconnected_connections.append(connection)
-            except Exception as e:
-                logger.error(f"Error broadcasting to connection: {e}")
-                disconnected_connections.append(connection)
-        
-        # Clean up disconnected connections
-        for connection in disconnected_connections:
-            self.disconnect(connection)
+    # Order boards
+    def _remove_board(self, websocket: WebSocket):
+        board = self.boards.pop(websocket, None)
+        if board is None:
+            return
+        for plant in board["plants"] or [None]:
+            connections = self.board_index.get(plant)
+            if connections is not None:
+                connections.discard(websocket)
+                if not connections:
+                    del self.board_index[plant]
+
+    async def subscribe_board(self, websocket: WebSocket, plants: Optional[Set[str]], statuses: Optional[Set[str]]):
+        """Replace the connection's board: send a snapshot, then deltas"""
+        if self.board_snapshot_provider is None:
+            raise ValueError("Order board is not available")
+        if websocket in self.held:
+            raise ValueError("A snapshot for this connection is already in progress")
+        self._remove_board(websocket)
+        self.boards[websocket] = {"plants": plants, "statuses": statuses}
+        for plant in plants or [None]:
+            self.board_index.setdefault(plant, set()).add(websocket)
+
+        self.held[websocket] = []  # Deltas wait until the snapshot is queued
+        try:
+            rows = await run_in_threadpool(self.board_snapshot_provider, plants, statuses)
+        except Exception as e:
+            self._remove_board(websocket)
+            self._release(websocket)
+            if isinstance(e, ValueError):
+                raise
+            logger.error(f"Order board snapshot failed: {e}")
+            raise ValueError("Order board snapshot failed")
+        self._send(websocket, {
+            "type": "board_snapshot",
+            "plants": sorted(plants) if plants is not None else None,
+            "statuses": sorted(statuses) if statuses is not None else None,
+            "rows": rows
+        })
+        self._release(websocket)
+
+    def _release(self, websocket: WebSocket):
+        """Deliver what was held back while a snapshot was built"""
+        for deliver in self.held.pop(websocket, None) or ():
+            deliver()
+
+    def unsubscribe_board(self, websocket: WebSocket):
+        self._remove_board(websocket)
+
+    def dispatch_board(self, message: Dict[str, Any]):
+        """Route committed order row changes to the boards they are visible on"""
+        changes = message.get("changes") or {}
+        if not self.boards or not changes:
+            return
+
+        def visible(board, plant, status) -> bool:
+            return ((board["plants"] is None or plant in board["plants"])
+                    and (board["statuses"] is None or status in board["statuses"]))
+
+        operations: Dict[WebSocket, list] = {}
+        for change in (changes.values() if isinstance(changes, dict) else changes):
+            candidates = set(self.board_index.get(None, ()))
+            candidates.update(self.board_index.get(change.get("plant"), ()))
+            candidates.update(self.board_index.get(change.get("previous_plant"), ()))
+            variants = {}
+            for connection in candidates:
+                board = self.boards[connection]
+                before = change["op"] != "insert" and visible(board, change.get("previous_plant"), change.get("previous_status"))
+                after = change["op"] != "delete" and visible(board, change.get("plant"), change.get("status"))
+                if before and after:
+                    op = "update"
+                elif after:
+                    op = "insert"
+                elif before:
+                    op = "delete"
+                else:
+                    continue
+                if op not in variants:
+                    variants[op] = {"op": op, "orderId": change["orderId"]}
+                    if op == "update":
+                        variants[op]["fields"] = change.get("changes") or {}
+                    elif op == "insert":
+                        variants[op]["row"] = change.get("row")
+                operations.setdefault(connection, []).append(variants[op])
+
+        timestamp = asyncio.get_event_loop().time()
+        for connection, ops in operations.items():
+            held = self.held.get(connection)
+            message = {"type": "board_delta", "timestamp": timestamp, "operations": ops}
+            if held is not None:
+                held.append(lambda connection=connection, message=message: self._send(connection, message))
+            else:
+                self._send(connection, message)
+
+    # Reconnects
+    def _matches(self, websocket: WebSocket, attributes: Dict[str, Any]) -> bool:
+        topics = self.connection_topics.get(websocket, ())
+        return any(key in topics for key in event_keys(attributes))
+
+    async def resume(self, websocket: WebSocket, stream: Optional[str], last_seq: int):
+        """Replay the events a reconnecting client missed, or send a snapshot when they are gone"""
+        oldest = self.replay_buffer[0][0] if self.replay_buffer else self.sequence + 1
+        if stream != self.stream_id or last_seq > self.sequence:
+            await self.send_snapshot(websocket, "stream_changed")
+        elif last_seq < oldest - 1:
+            await self.send_snapshot(websocket, "gap_evicted")
+        else:
+            replayed = 0
+            for seq, attributes, text, key, message in self.replay_buffer:
+                if seq > last_seq and self._matches(websocket, attributes):
+                    self._deliver(websocket, text, key, message)
+                    replayed += 1
+            await self.send_personal_message({
+                "type": "resumed", "stream": self.stream_id, "from_seq": last_seq, "seq": self.sequence,
+                "replayed": replayed
+            }, websocket)
+
+    def snapshot_plants(self, websocket: WebSocket) -> Optional[Set[str]]:
+        """Plants a connection's topics are limited to, or None when any topic covers all plants"""
+        plants = set()
+        for key in self.connection_topics.get(websocket, ()):
+            values = [value for dimension, value in key if dimension == "plant"]
+            if not values:
+                return None
+            plants.update(values)
+        return plants
+
+    async def send_snapshot(self, websocket: WebSocket, reason: str):
+        seq = self.sequence
+        if self.snapshot_provider is None or websocket in self.held:
+            await self.send_personal_message({
+                "type": "resync_required", "reason": reason, "stream": self.stream_id, "seq": seq
+            }, websocket)
+            return
+        self.held[websocket] = []
+        try:
+            data = await run_in_threadpool(self.snapshot_provider, self.snapshot_plants(websocket))
+            message = {"type": "snapshot", "reason": reason, "stream": self.stream_id, "seq": seq, "data": data}
+        except Exception as e:
+            logger.error(f"Snapshot for WebSocket resume failed: {e}")
+            message = {"type": "resync_required", "reason": reason, "stream": self.stream_id, "seq": seq}
+        await self.send_personal_message(message, websocket)
+        self._release(websocket)
 
     async def send_to_client(self, client_id: str, message: Dict[str, Any]):
         """Send a message to a specific client by ID"""
@@ -84,6 +621,20 @@ class ConnectionManager:
         """Get list of connected client IDs"""
         return [info.get("client_id") for info in self.connection_info.values() if info.get("client_id")]
 
+    def get_delivery_stats(self) -> Dict[str, Any]:
+        """Outbound queue counters, totals and per client"""
+        clients = {
+            self.connection_info.get(ws, {}).get("client_id") or "unknown": queue.stats()
+            for ws, queue in self.queues.items()
+        }
+        return {
+            "policy": self.slow_consumer_policy,
+            "queue_size": self.queue_size,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            **{field: sum(c[field] for c in clients.values()) for field in ("queued", "sent", "bytes_sent", "dropped", "coalesced")},
+            "clients": clients
+        }
+
 # Global connection manager instance
 manager = ConnectionManager()
 
@@ -119,20 +670,57 @@ async def handle_client_message(websocket: WebSocket, message: Dict[str, Any]):
             "timestamp": asyncio.get_event_loop().time()
         }, websocket)
     
-    elif message_type == "subscribe":
-        # Handle subscription to specific events
-        topics = message.get("topics", [])
+    elif message_type in ("subscribe", "unsubscribe"):
+        topics = message.get("topics")
+        if topics is not None and not isinstance(topics, list):
+            topics = [topics]
+        try:
+            if message_type == "subscribe":
+                subscriptions = manager.subscribe(websocket, topics or [])
+            else:
+                subscriptions = manager.unsubscribe(websocket, topics)
+        except ValueError as e:
+            await manager.send_personal_message({"type": "error", "message": str(e)}, websocket)
+            return
         await manager.send_personal_message({
             "type": "subscription_confirmed",
-            "topics": topics
+            "topics": subscriptions
         }, websocket)
     
+    elif message_type == "resume":
+        last_seq = message.get("last_seq")
+        if not isinstance(last_seq, int) or isinstance(last_seq, bool):
+            await manager.send_personal_message({"type": "error", "message": "resume requires an integer last_seq"}, websocket)
+            return
+        await manager.resume(websocket, message.get("stream"), last_seq)
+
+    elif message_type == "subscribe_board":
+        def values(name):
+            value = message.get(name)
+            if value is None:
+                return None
+            return set(_values(value)) or None
+        try:
+            await manager.subscribe_board(websocket, values("plant"), values("status"))
+        except ValueError as e:
+            await manager.send_personal_message({"type": "error", "message": str(e)}, websocket)
+
+    elif message_type == "unsubscribe_board":
+        manager.unsubscribe_board(websocket)
+        await manager.send_personal_message({"type": "board_unsubscribed"}, websocket)
+
     elif message_type == "get_status":
         # Send current system status
         await manager.send_personal_message({
             "type": "system_status",
             "active_connections": manager.get_connection_count(),
-            "connected_clients": manager.get_connected_clients()
+            "connected_clients": manager.get_connected_clients(),
+            "subscriptions": manager.get_subscriptions(websocket),
+            "delivery": manager.queues[websocket].stats() if websocket in manager.queues else None,
+            "board": {
+                key: sorted(value) if value is not None else None
+                for key, value in manager.boards[websocket].items()
+            } if websocket in manager.boards else None
         }, websocket)
     
     else:
@@ -0,0 +1,89 @@
+"""
+Shared setup of the API tests (pytest).
+
+The app runs in-process (TestClient) on a throwaway SQLite database and ingestion
+journal, so no server or PostgreSQL is needed. Master data - one finished material
+with two components, two work centers, a BOM and a two-operation routing - is
+created once per session; every test makes its own orders.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+_tmp_dir = tempfile.mkdtemp(prefix="sap-mfg-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ["CONFIRMATION_JOURNAL_PATH"] = os.path.join(_tmp_dir, "confirmation_journal.ndjson")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+PLANT = "1000"
+FINISHED = "TFG1"
+WORK_CENTERS = ("TWC1", "TWC2")
+ROUTING = "TRT1"
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        _seed(test_client)
+        yield test_client
+
+def _seed(client: TestClient):
+    for material_id, material_type in [(FINISHED, "FINISHED"), ("TRM1", "RAW"), ("TRM2", "RAW")]:
+        client.post("/api/materials", json={
+            "material_id": material_id, "description": material_id, "type": material_type,
+            "unitOfMeasure": "EA", "unitPrice": 1, "plant": PLANT, "storageLocation": "0001"
+        })
+    for work_center_id in WORK_CENTERS:
+        client.post("/api/work-centers", json={
+            "work_center_id": work_center_id, "name": work_center_id, "description": work_center_id,
+            "capacity": 16, "efficiency": 95.0, "costCenter": "CC", "plant": PLANT
+        })
+    client.post("/api/bom", json={
+        "bom_id": "TB1", "parent_material_id": FINISHED, "items": [
+            {"component_material_id": "TRM1", "quantity": 2, "position": 1},
+            {"component_material_id": "TRM2", "quantity": 1, "position": 2}
+        ]
+    })
+    client.post("/api/routing", json={
+        "routing_id": ROUTING, "material_id": FINISHED, "description": "Test routing", "plant": PLANT,
+        "operations": [
+            {"operation_id": "0010", "work_center_id": WORK_CENTERS[0], "description": "Assemble",
+             "sequence": 10, "setup_time": 10, "machine_time": 5, "labor_time": 4},
+            {"operation_id": "0020", "work_center_id": WORK_CENTERS[1], "description": "Test",
+             "sequence": 20, "setup_time": 5, "machine_time": 3, "labor_time": 2}
+        ]
+    })
+
+@pytest.fixture
+def make_order(client):
+    """Create a released order on the test routing; returns its order ID"""
+    def make(quantity: int = 50) -> str:
+        order = client.post("/api/production-orders", json={
+            "material_id": FINISHED, "quantity": quantity, "priority": "HIGH", "plant": PLANT,
+            "due_date": (datetime.now() + timedelta(days=10)).isoformat()
+        }).json()
+        order_id = order["orderId"]
+        client.post(f"/api/order-changes/{order_id}/change", json={
+            "order_id": order_id, "change_type": "ROUTING", "field_name": "routingId", "new_value": ROUTING
+        })
+        client.post(f"/api/production-orders/{order_id}/release")
+        return order_id
+    return make
+
+def confirmation(order_id: str, operation_id: str = "0010", work_center_id: str = WORK_CENTERS[0],
+                 confirmation_type: str = "PARTIAL", yield_qty: float = 5, scrap_qty: float = 1) -> dict:
+    """CO11N confirmation payload ending now"""
+    now = datetime.now()
+    return {
+        "order_id": order_id, "operation_id": operation_id, "work_center_id": work_center_id,
+        "yield_qty": yield_qty, "scrap_qty": scrap_qty,
+        "setup_time_actual": 11, "machine_time_actual": 6, "labor_time_actual": 4,
+        "start_time": (now - timedelta(hours=1)).isoformat(), "end_time": now.isoformat(),
+        "confirmation_type": confirmation_type
+    }
@@ -0,0 +1,36 @@
+"""
+Capacity load (CM01): which orders the summary reports as having no routing.
+"""
+from conftest import PLANT, WORK_CENTERS, confirmation
+from database import models
+from database.database import SessionLocal
+
+def unrouted_orders(client) -> int:
+    response = client.get("/api/capacity/load", params={"plant": PLANT, "include_daily": False})
+    assert response.status_code == 200
+    return response.json()["summary"]["orders_without_routing"]
+
+def update_order(order_id: str, **values):
+    db = SessionLocal()
+    try:
+        order = db.query(models.ProductionOrder).filter_by(orderId=order_id).one()
+        for name, value in values.items():
+            setattr(order, name, value)
+        db.commit()
+    finally:
+        db.close()
+
+def test_only_orders_without_routing_are_counted_as_unrouted(client, make_order):
+    finished_order = make_order()
+    before = unrouted_orders(client)
+
+    client.post("/api/operation-confirmations/batch", json=[
+        confirmation(finished_order, "0010", WORK_CENTERS[0], "FINAL"),
+        confirmation(finished_order, "0020", WORK_CENTERS[1], "FINAL")
+    ])
+    # Still open although every operation is finished, e.g. awaiting goods receipt
+    update_order(finished_order, status=models.OrderStatus.IN_PROGRESS)
+    assert unrouted_orders(client) == before
+
+    update_order(make_order(), routingId="NO-SUCH-ROUTING")
+    assert unrouted_orders(client) == before + 1
@@ -0,0 +1,152 @@
+"""
+CO11N ingestion journal: entries are posted once, the backlog is tracked from the
+checkpoint, an entry that keeps failing does not block the rest, and a batch
+replayed after a crash is not posted twice.
+"""
+import json
+import os
+import time
+
+from conftest import confirmation
+from database import models
+from database.database import SessionLocal
+from routers.operation_confirmations import process_journal_entries
+from utils.confirmation_journal import ConfirmationJournal
+from utils.event_bus import bus
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+def posted_ingest_ids(ingest_ids: list) -> list:
+    db = SessionLocal()
+    try:
+        return [row.ingest_id for row in db.query(models.OperationConfirmation.ingest_id).filter(
+            models.OperationConfirmation.ingest_id.in_(ingest_ids)
+        )]
+    finally:
+        db.close()
+
+def test_backlog_is_counted_from_the_checkpoint(tmp_path):
+    journal = ConfirmationJournal(str(tmp_path / "journal.ndjson"), batch_size=2, max_wait=0.01)
+    journal.append([{"n": i} for i in range(5)])
+    assert journal.stats()["backlog_entries"] == 5
+
+    processed = []
+    journal.start(lambda entries: [processed.append(e) or {"ingest_id": e["ingest_id"], "status": "SUCCESS"}
+                                   for e in entries])
+    try:
+        wait_for(lambda: journal.stats()["backlog_entries"] == 0)
+        journal.append([{"n": 5}])
+        wait_for(lambda: len(processed) == 6)
+    finally:
+        journal.stop()
+    assert [e["payload"]["n"] for e in processed] == list(range(6))
+    assert journal.stats()["entries_processed"] == 6
+
+def test_entry_that_keeps_failing_is_set_aside(tmp_path):
+    journal = ConfirmationJournal(str(tmp_path / "journal.ndjson"), max_wait=0.01, max_attempts=2)
+    ingest_ids = journal.append([{"n": 1}, {"n": 2, "order_id": "PO-BAD"}, {"n": 3}])
+
+    def processor(entries):
+        if any(e["payload"]["n"] == 2 for e in entries):
+            raise RuntimeError("constraint violated")
+        return [{"ingest_id": e["ingest_id"], "status": "SUCCESS"} for e in entries]
+
+    journal.start(processor)
+    try:
+        wait_for(lambda: journal.stats()["backlog_entries"] == 0)
+    finally:
+        journal.stop()
+    assert [journal.get_result(i)["status"] for i in ingest_ids] == ["SUCCESS", "FAILED", "SUCCESS"]
+    with open(journal.failed_path) as f:
+        failed = [json.loads(line) for line in f]
+    assert [(f["ingest_id"], f["order_id"], f["entry"]["payload"]["n"]) for f in failed] == [(ingest_ids[1], "PO-BAD", 2)]
+
+def test_failed_results_survive_a_restart(client, tmp_path):
+    path = str(tmp_path / "journal.ndjson")
+    journal = ConfirmationJournal(path, max_wait=0.01)
+    [ingest_id] = journal.append([confirmation("NO-SUCH-ORDER")])
+    journal.start(process_journal_entries)
+    try:
+        wait_for(lambda: journal.get_result(ingest_id))
+    finally:
+        journal.stop()
+
+    # Another worker, or the consumer after a restart, has no results in memory
+    restarted = ConfirmationJournal(path)
+    assert restarted.get_result(ingest_id) is None
+    failed = restarted.get_failed_result(ingest_id)
+    assert (failed["status"], failed["order_id"]) == ("FAILED", "NO-SUCH-ORDER")
+    assert failed["errors"]
+
+def test_failed_ingest_is_reported_by_the_api(client):
+    [ingest_id] = client.post("/api/operation-confirmations/ingest",
+                              json=[confirmation("NO-SUCH-ORDER")]).json()["ingest_ids"]
+    url = f"/api/operation-confirmations/ingest/{ingest_id}"
+    wait_for(lambda: client.get(url).status_code == 200)
+    assert client.get(url).json()["status"] == "FAILED"
+
+def test_published_topics_skip_results_without_order(tmp_path, monkeypatch):
+    published = []
+    monkeypatch.setattr(bus, "publish", lambda message, topics=None: published.append(topics))
+    journal = ConfirmationJournal(str(tmp_path / "journal.ndjson"), max_wait=0.01)
+    journal.append([{"order_id": "PO1"}, {}])
+    journal.start(lambda entries: [{"ingest_id": e["ingest_id"], "order_id": e["payload"].get("order_id"),
+                                    "status": "DUPLICATE"} for e in entries])
+    try:
+        wait_for(lambda: published)
+    finally:
+        journal.stop()
+    assert published == [{"order": ["PO1"]}]
+
+def test_compaction_checkpoints_before_truncating(tmp_path, monkeypatch):
+    journal = ConfirmationJournal(str(tmp_path / "journal.ndjson"), max_wait=0.01, compact_threshold=1)
+    checkpoints = []
+    write_checkpoint = journal._write_checkpoint
+    def record(offset, lines):
+        checkpoints.append((offset, os.path.getsize(journal.path)))
+        write_checkpoint(offset, lines)
+    monkeypatch.setattr(journal, "_write_checkpoint", record)
+
+    journal.append([{"n": 1}])
+    journal.start(lambda entries: [{"ingest_id": e["ingest_id"], "status": "SUCCESS"} for e in entries])
+    try:
+        wait_for(lambda: checkpoints and checkpoints[-1][0] == 0)
+    finally:
+        journal.stop()
+    # Reset to offset 0 while the drained entries were still in the file
+    assert checkpoints[-1][1] > 0
+    assert os.path.getsize(journal.path) == 0
+
+def test_replayed_batch_is_not_posted_twice(client, make_order, tmp_path):
+    order_id = make_order()
+    path = str(tmp_path / "journal.ndjson")
+    journal = ConfirmationJournal(path, max_wait=0.01)
+    ingest_ids = journal.append([confirmation(order_id), confirmation(order_id, yield_qty=2)])
+
+    journal.start(process_journal_entries)
+    try:
+        wait_for(lambda: all(journal.get_result(i) for i in ingest_ids))
+    finally:
+        journal.stop()
+    assert [journal.get_result(i)["status"] for i in ingest_ids] == ["SUCCESS", "SUCCESS"]
+
+    # Crash after the commit but before the checkpoint: the consumer starts over from offset 0
+    with open(f"{path}.checkpoint", "w") as f:
+        f.write("0 0")
+    restarted = ConfirmationJournal(path, max_wait=0.01)
+    restarted.start(process_journal_entries)
+    try:
+        wait_for(lambda: all(restarted.get_result(i) for i in ingest_ids))
+    finally:
+        restarted.stop()
+    assert [restarted.get_result(i)["status"] for i in ingest_ids] == ["DUPLICATE", "DUPLICATE"]
+    assert sorted(posted_ingest_ids(ingest_ids)) == sorted(ingest_ids)
+
+    # Not in the app journal's memory: answered from the posted confirmation
+    response = client.get(f"/api/operation-confirmations/ingest/{ingest_ids[0]}")
+    assert response.status_code == 200
+    assert (response.json()["order_id"], response.json()["status"]) == (order_id, "SUCCESS")
@@ -0,0 +1,207 @@
+"""
+CO11N postings and CO02 changes under concurrency: batch posting, reversal, the
+409 answers of optimistic locking (If-Match and versions caught at flush time) and
+the order fields CO02 may change.
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from conftest import WORK_CENTERS, confirmation
+from database import models, schemas
+from database.database import SessionLocal
+from routers.goods_movements import goods_issue, goods_receipt
+from routers.operation_confirmations import batch_confirmation_processing, reverse_confirmations
+from routers.order_changes import submit_order_change
+
+def get_order(order_id: str) -> models.ProductionOrder:
+    db = SessionLocal()
+    try:
+        return db.query(models.ProductionOrder).filter_by(orderId=order_id).one()
+    finally:
+        db.close()
+
+def test_batch_posting_updates_totals_and_posts_movements(client, make_order):
+    order_id = make_order()
+    response = client.post("/api/operation-confirmations/batch", json=[
+        confirmation(order_id),
+        confirmation(order_id, "0020", WORK_CENTERS[1], yield_qty=4, scrap_qty=0)
+    ])
+    assert response.status_code == 200
+    results = response.json()["confirmations_processed"]
+    assert [r["status"] for r in results] == ["SUCCESS", "SUCCESS"]
+
+    order = get_order(order_id)
+    assert order.status == models.OrderStatus.IN_PROGRESS
+    assert order.progress == 18  # 9 of 50 confirmed
+
+    db = SessionLocal()
+    try:
+        issued = {}
+        for m in db.query(models.GoodsMovement).filter_by(order_id=order_id, movement_type="ISSUE"):
+            issued[m.material_id] = issued.get(m.material_id, 0) + m.qty
+        assert issued == {"TRM1": 18, "TRM2": 9}  # BOM quantities per confirmed unit
+    finally:
+        db.close()
+
+def test_batch_with_invalid_confirmation_posts_nothing(client, make_order):
+    order_id = make_order()
+    response = client.post("/api/operation-confirmations/batch", json=[
+        confirmation(order_id), confirmation("NO-SUCH-ORDER")
+    ])
+    assert response.status_code == 400
+    assert client.get(f"/api/operation-confirmations/order/{order_id}").json()["confirmations"] == []
+
+def test_reversal_restores_totals_and_cannot_be_repeated(client, make_order):
+    order_id = make_order()
+    posted = client.post("/api/operation-confirmations/batch", json=[confirmation(order_id)]).json()
+    confirmation_id = posted["confirmations_processed"][0]["confirmation_id"]
+
+    assert client.post(f"/api/operation-confirmations/{confirmation_id}/reverse").status_code == 200
+    order = get_order(order_id)
+    assert (order.confirmedYield, order.confirmedScrap) == (0, 0)
+
+    assert client.post(f"/api/operation-confirmations/{confirmation_id}/reverse").status_code == 400
+    assert client.post("/api/operation-confirmations/reverse", json={"order_id": order_id}).status_code == 404
+
+def test_reversal_rolls_back_completion_by_confirmations(client, make_order):
+    order_id = make_order()
+    posted = client.post("/api/operation-confirmations/batch", json=[
+        confirmation(order_id, confirmation_type="FINAL"),
+        confirmation(order_id, "0020", WORK_CENTERS[1], confirmation_type="FINAL")
+    ]).json()
+    assert get_order(order_id).status == models.OrderStatus.COMPLETED
+
+    last = posted["confirmations_processed"][1]["confirmation_id"]
+    assert client.post(f"/api/operation-confirmations/{last}/reverse").status_code == 200
+    order = get_order(order_id)
+    assert (order.status, order.actualEndDate) == (models.OrderStatus.IN_PROGRESS, None)
+
+def test_reversal_keeps_completion_by_other_means(client, make_order):
+    order_id = make_order()
+    posted = client.post("/api/operation-confirmations/batch", json=[confirmation(order_id)]).json()
+    assert client.post(f"/api/production-orders/{order_id}/complete").status_code == 200
+
+    confirmation_id = posted["confirmations_processed"][0]["confirmation_id"]
+    assert client.post(f"/api/operation-confirmations/{confirmation_id}/reverse").status_code == 200
+    order = get_order(order_id)
+    assert (order.status, order.progress, order.confirmedYield) == (models.OrderStatus.COMPLETED, 100, 0)
+
+def test_concurrent_reversal_conflicts(client, make_order):
+    order_id = make_order()
+    posted = client.post("/api/operation-confirmations/batch", json=[confirmation(order_id)]).json()
+    confirmation_id = posted["confirmations_processed"][0]["confirmation_id"]
+
+    db = SessionLocal()
+    try:
+        # Read as CONFIRMED, then reversed by another request before this reversal runs
+        stale = db.query(models.OperationConfirmation).filter_by(confirmation_id=confirmation_id).all()
+        assert client.post(f"/api/operation-confirmations/{confirmation_id}/reverse").status_code == 200
+
+        with pytest.raises(HTTPException) as raised:
+            reverse_confirmations(db, stale)
+        assert raised.value.status_code == 409
+        db.rollback()
+    finally:
+        db.close()
+
+    details = client.get(f"/api/operation-confirmations/order/{order_id}").json()
+    assert [c["status"] for c in details["confirmations"]] == ["REVERSED"]
+
+def test_if_match_mismatch_conflicts(client, make_order):
+    order_id = make_order()
+    version = get_order(order_id).version
+    change = {"order_id": order_id, "change_type": "QUANTITY", "field_name": "quantity", "new_value": "60"}
+
+    response = client.post(f"/api/order-changes/{order_id}/change", json=change,
+                           headers={"If-Match": f'"{version - 1}"'})
+    assert response.status_code == 409
+    assert response.json()["detail"]["current_version"] == version
+
+    response = client.post(f"/api/order-changes/{order_id}/change", json=change,
+                           headers={"If-Match": f'"{version}"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{version + 1}"'
+
+@pytest.mark.parametrize("field_name", ["version", "eventSequence", "status", "confirmedYield"])
+def test_system_maintained_fields_cannot_be_changed(client, make_order, field_name):
+    order_id = make_order()
+    before = get_order(order_id)
+    change = {"order_id": order_id, "change_type": "OTHER", "field_name": field_name, "new_value": "1"}
+    assert client.post(f"/api/order-changes/{order_id}/change", json=change).status_code == 400
+
+    description = {"order_id": order_id, "change_type": "DESCRIPTION", "field_name": "description", "new_value": "x"}
+    assert client.post(f"/api/order-changes/{order_id}/bulk-change", json=[description, change]).status_code == 400
+    after = get_order(order_id)
+    assert (after.version, after.eventSequence, after.description) == (before.version, before.eventSequence,
+                                                                       before.description)
+
+def test_planned_dates_can_be_changed(client, make_order):
+    order_id = make_order()
+    response = client.post(f"/api/order-changes/{order_id}/change", json={
+        "order_id": order_id, "change_type": "DATE", "field_name": "plannedStartDate", "new_value": "2030-01-02T06:00:00"
+    })
+    assert response.status_code == 200
+    assert get_order(order_id).plannedStartDate == datetime(2030, 1, 2, 6, 0)
+
+def test_stale_order_change_conflicts_at_flush(client, make_order):
+    order_id = make_order()
+    db = SessionLocal()
+    try:
+        # Loaded before a concurrent change; the session keeps the stale version
+        stale = db.query(models.ProductionOrder).filter_by(orderId=order_id).one()
+        client.post(f"/api/order-changes/{order_id}/change", json={
+            "order_id": order_id, "change_type": "QUANTITY", "field_name": "quantity", "new_value": "70"
+        })
+
+        with pytest.raises(HTTPException) as raised:
+            submit_order_change(order_id, schemas.OrderChangeRequest(
+                order_id=order_id, change_type="QUANTITY", field_name="quantity", new_value="80"
+            ), Response(), None, db)
+        assert raised.value.status_code == 409
+        assert raised.value.detail["current"]["quantity"] == 70
+        assert stale.version == raised.value.detail["current_version"]  # reloaded for the answer
+    finally:
+        db.close()
+
+def test_stale_batch_posting_conflicts(client, make_order):
+    order_id = make_order()
+    db = SessionLocal()
+    try:
+        stale = db.query(models.ProductionOrder).filter_by(orderId=order_id).one()  # noqa: F841 - kept in the session
+        client.post("/api/operation-confirmations/batch", json=[confirmation(order_id)])
+
+        with pytest.raises(HTTPException) as raised:
+            batch_confirmation_processing([schemas.OperationConfirmationCreate(**confirmation(order_id))], db)
+        assert raised.value.status_code == 409
+    finally:
+        db.close()
+    assert get_order(order_id).confirmedYield == 5
+
+def receipt(order_id: str, material_id: str, plant: str, qty: float) -> dict:
+    return {"order_id": order_id, "material_id": material_id, "qty": qty, "plant": plant, "storage_loc": "0001"}
+
+@pytest.mark.parametrize("post_movement", ["issue", "receipt"])
+def test_stale_goods_movement_conflicts(client, make_order, post_movement):
+    order_id = make_order()
+    plant = f"GM-{post_movement}"
+    assert client.post("/api/goods-movements/receipt", json=receipt(order_id, "TRM1", plant, 10)).status_code == 200
+    db = SessionLocal()
+    try:
+        # Loaded before a concurrent receipt; the session keeps the stale stock version
+        stale = db.query(models.Stock).filter_by(material_id="TRM1", plant=plant).one()
+        assert client.post("/api/goods-movements/receipt", json=receipt(order_id, "TRM1", plant, 5)).status_code == 200
+
+        with pytest.raises(HTTPException) as raised:
+            if post_movement == "issue":
+                goods_issue(schemas.GoodsIssueCreate(order_id=order_id, movements=[
+                    {"material_id": "TRM1", "qty": 2, "plant": plant, "storage_loc": "0001"}
+                ]), db)
+            else:
+                goods_receipt(schemas.GoodsReceiptCreate(**receipt(order_id, "TRM1", plant, 1)), db)
+        assert raised.value.status_code == 409
+        assert raised.value.detail["current"]["stock"][0]["on_hand"] == 15
+        assert stale.version == raised.value.detail["current"]["stock"][0]["version"]
+    finally:
+        db.close()
@@ -0,0 +1,109 @@
+"""
+Real-time delivery helpers: topic parsing and matching, per-connection send queue
+policies, event batch coalescing and the chunking of oversized event bus payloads.
+"""
+import asyncio
+import json
+
+import pytest
+
+from utils.event_bus import PostgresBackend
+from utils.websocket_manager import ALL_EVENTS, EventBatch, SendQueue, event_keys, format_topic, parse_topic
+
+def test_parse_topic():
+    assert parse_topic("*") == [ALL_EVENTS]
+    assert parse_topic("goods_receipt") == [(("type", "goods_receipt"),)]
+    assert parse_topic("plant: 1000") == [(("plant", "1000"),)]
+    # Aliases, and keys sorted by dimension whatever the order given
+    keys = parse_topic({"order_id": "PO1", "event": ["order_created", "order_completed"]})
+    assert [format_topic(key) for key in keys] == [
+        "type:order_completed/order:PO1", "type:order_created/order:PO1"
+    ]
+
+@pytest.mark.parametrize("topic", ["", {}, "color:red", {"plant": []}, {"plant": [str(i) for i in range(17)],
+                                                                      "order": [str(i) for i in range(17)]}])
+def test_parse_topic_rejects_invalid(topic):
+    with pytest.raises(ValueError):
+        parse_topic(topic)
+
+def test_event_keys_match_every_subset_of_attributes():
+    keys = set(event_keys({"type": "goods_receipt", "plant": "1000", "work_center": "WC1", "order": "PO1"}))
+    assert len(keys) == 16
+    assert ALL_EVENTS in keys
+    assert parse_topic({"plant": "1000", "type": "goods_receipt"})[0] in keys
+    assert parse_topic("plant:2000")[0] not in keys
+    # Missing attributes only match topics that do not constrain them
+    assert set(event_keys({"type": "order_created"})) == {ALL_EVENTS, (("type", "order_created"),)}
+
+def drain(queue: SendQueue) -> list:
+    async def get_all():
+        return [await queue.get() for _ in range(len(queue))]
+    return asyncio.run(get_all())
+
+def test_send_queue_drop_discards_oldest():
+    queue = SendQueue(2, "drop")
+    for text in ("a", "b", "c"):
+        assert queue.put(text)
+    assert drain(queue) == ["b", "c"]
+    assert queue.dropped == 1
+
+def test_send_queue_coalesce_replaces_same_key():
+    queue = SendQueue(2, "coalesce")
+    queue.put("order 1 released", key=("status", "PO1"))
+    queue.put("order 2 released", key=("status", "PO2"))
+    queue.put("order 1 completed", key=("status", "PO1"))  # full: replaces the queued PO1 message
+    queue.put("unrelated")  # full, nothing to coalesce with: drops the oldest
+    assert drain(queue) == ["order 2 released", "unrelated"]
+    assert (queue.coalesced, queue.dropped) == (1, 1)
+
+def test_send_queue_disconnect_refuses_when_full():
+    queue = SendQueue(1, "disconnect")
+    assert queue.put("a")
+    assert not queue.put("b")
+    assert drain(queue) == ["a"]
+
+def test_event_batch_coalesces_and_sums_deltas():
+    batch = EventBatch()
+    batch.add({"type": "goods_receipt", "material_id": "M1", "qty": 2.0, "seq": 1}, ("goods_receipt", "M1"))
+    batch.add({"type": "order_created", "order_id": "PO1", "seq": 2}, ("order_created", "PO1"))
+    batch.add({"type": "goods_receipt", "material_id": "M1", "qty": 3.0, "seq": 3}, ("goods_receipt", "M1"))
+
+    frame = batch.frame()
+    assert (frame["seq"], frame["received"]) == (3, 3)
+    receipts = frame["events"]["goods_receipt"]
+    row = dict(zip(receipts["fields"], receipts["rows"][0]))
+    assert (row["qty"], row["coalesced"], row["seq"]) == (5.0, 2, 3)
+    # The coalesced event moved behind the one received in between
+    assert list(frame["events"]) == ["order_created", "goods_receipt"]
+
+def backend() -> tuple:
+    """A backend wired to collect delivered events instead of listening on PostgreSQL"""
+    bus = PostgresBackend("postgresql+psycopg2://user@localhost/db", "sap_events")
+    received = []
+    bus._own_prefix = json.dumps({"o": "this-worker"})[:-1]
+    bus._deliver = lambda origin, message, topics: received.append((origin, message, topics))
+    return bus, received
+
+def test_event_bus_chunks_oversized_payloads():
+    sender, _ = backend()
+    receiver, received = backend()
+    small = json.dumps([{"type": "order_created"}, {"plant": "1000"}])
+    large = json.dumps([{"type": "snapshot", "rows": ["x" * 100] * 200}, None])
+
+    payloads = list(sender.payloads("other-worker", small)) + list(sender.payloads("other-worker", large))
+    assert len(payloads) > 2
+    assert all(len(payload) <= PostgresBackend.MAX_PAYLOAD for payload in payloads)
+    for payload in payloads:
+        receiver.receive(payload)
+    assert received == [
+        ("other-worker", {"type": "order_created"}, {"plant": "1000"}),
+        ("other-worker", json.loads(large)[0], None)
+    ]
+
+def test_event_bus_ignores_own_and_malformed_payloads():
+    bus, received = backend()
+    for payload in bus.payloads("this-worker", json.dumps([{"type": "order_created"}, None])):
+        bus.receive(payload)
+    bus.receive("not json")
+    bus.receive(json.dumps({"o": "other-worker"}))
+    assert received == []
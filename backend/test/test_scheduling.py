@@ -0,0 +1,42 @@
+"""
+Finite capacity scheduling (CM21): plant-scoped runs share work centers with the
+orders of other plants.
+"""
+from datetime import datetime, timedelta
+
+from conftest import PLANT, WORK_CENTERS
+from database import models
+from database.database import SessionLocal
+
+OTHER_PLANT = "2000"
+
+def test_plant_run_does_not_double_book_other_plants(client, make_order):
+    other_order = make_order()
+    db = SessionLocal()
+    try:
+        order = db.query(models.ProductionOrder).filter_by(orderId=other_order).one()
+        order.plant = OTHER_PLANT
+        db.commit()
+    finally:
+        db.close()
+    make_order()
+
+    start = (datetime.now() + timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+    for plant in (OTHER_PLANT, PLANT):
+        response = client.post("/api/scheduling/run", params={"plant": plant, "mode": "full", "start": start.isoformat()})
+        assert response.status_code == 200
+
+    for work_center_id in WORK_CENTERS:
+        bookings = {
+            plant: [
+                (datetime.fromisoformat(op["start_time"]), datetime.fromisoformat(op["end_time"]))
+                for op in client.get("/api/scheduling/operations", params={
+                    "plant": plant, "work_center_id": work_center_id
+                }).json()
+            ] for plant in (OTHER_PLANT, PLANT)
+        }
+        assert bookings[OTHER_PLANT] and bookings[PLANT]
+        assert not any(
+            booked_start < other_end and other_start < booked_end
+            for booked_start, booked_end in bookings[PLANT] for other_start, other_end in bookings[OTHER_PLANT]
+        )
@@ -0,0 +1,97 @@
+"""
+Incrementally maintained totals: daily KPI rollups and OEE shift totals must equal a
+rebuild from posting history, whatever mix of single, batch and reversal postings
+produced them. Also the shared upsert and the OEE factor arithmetic.
+"""
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from conftest import WORK_CENTERS, confirmation
+from database import models
+from database.database import SessionLocal
+from utils import config
+from utils.kpi_rollups import upsert_totals
+from utils.oee import MEASURES as OEE_MEASURES, oee_factors, shift_of
+
+ROLLUP_MEASURES = ("confirmations", "yield_qty", "scrap_qty", "goods_movements", "receipt_qty", "issue_qty")
+
+def totals(model, key: tuple, measures: tuple) -> dict:
+    """Non-zero totals of a table by key, rounded against float summation order"""
+    db = SessionLocal()
+    try:
+        result = {}
+        for row in db.query(model).all():
+            values = tuple(round(getattr(row, m) or 0.0, 6) for m in measures)
+            if any(values):
+                result[tuple(getattr(row, k) for k in key)] = values
+        return result
+    finally:
+        db.close()
+
+@pytest.fixture
+def postings(client, make_order):
+    """A single posting, a batch across both work centers and a reversal"""
+    first, second = make_order(), make_order(40)
+    assert client.post("/api/operation-confirmations", json=confirmation(first)).status_code == 200
+    batch = client.post("/api/operation-confirmations/batch", json=[
+        confirmation(first, "0020", WORK_CENTERS[1], confirmation_type="FINAL"),
+        confirmation(second, yield_qty=3)
+    ]).json()["confirmations_processed"]
+    assert client.post(f"/api/operation-confirmations/{batch[1]['confirmation_id']}/reverse").status_code == 200
+
+def test_rollups_equal_rebuild(client, postings):
+    key = ("day", "plant", "work_center_id", "material_id")
+    incremental = totals(models.DailyKpiRollup, key, ROLLUP_MEASURES)
+    # Goods movements count against the work center of the confirmation that posted them
+    # (movements posted directly through goods issue/receipt have none)
+    assert set(WORK_CENTERS) <= {k[2] for k, values in incremental.items() if values[3]}
+
+    assert client.post("/api/analytics/rollups/rebuild").status_code == 200
+    assert totals(models.DailyKpiRollup, key, ROLLUP_MEASURES) == incremental
+
+def test_oee_totals_equal_rebuild(client, postings):
+    key = ("day", "shift", "work_center_id")
+    incremental = totals(models.OEEShiftStatistic, key, OEE_MEASURES)
+    assert incremental
+
+    assert client.post("/api/oee/rebuild").status_code == 200
+    assert totals(models.OEEShiftStatistic, key, OEE_MEASURES) == incremental
+
+def test_upsert_totals_adds_deltas_and_bumps_revision(client):
+    table = models.OEEShiftStatistic.__table__
+    key = ("day", "shift", "work_center_id")
+    row_key = (date(1999, 1, 1), 1, "UPSERT-TEST")
+    db = SessionLocal()
+    try:
+        upsert_totals(db, table, key, OEE_MEASURES, {row_key: {"confirmations": 1, "yield_qty": 2.5}})
+        upsert_totals(db, table, key, OEE_MEASURES, {row_key: {"confirmations": 2, "scrap_qty": 1.0}})
+        row = db.execute(table.select().where(table.c.work_center_id == "UPSERT-TEST")).one()
+        assert (row.confirmations, row.yield_qty, row.scrap_qty, row.revision) == (3, 2.5, 1.0, 2)
+    finally:
+        db.rollback()
+        db.close()
+
+def test_oee_factors():
+    # [planned minutes], [confirmations, setup, run, ideal, yield, scrap]
+    planned = np.array([480.0, 480.0, 0.0, 100.0])
+    inputs = np.array([
+        [1, 0, 240, 120, 9, 1],   # 50% x 50% x 90%
+        [1, 0, 600, 900, 10, 0],  # availability and performance capped at 100%
+        [1, 0, 60, 60, 1, 0],     # no planned time: undefined
+        [0, 0, 0, 0, 0, 0],       # planned but nothing produced: 0
+    ], dtype=np.float64)
+    factors = oee_factors(planned, inputs)
+    assert factors["oee"][0] == pytest.approx(0.225)
+    assert factors["availability"][1] == 1.0 and factors["performance"][1] == 1.0
+    assert np.isnan(factors["availability"][2]) and np.isnan(factors["oee"][2])
+    assert factors["oee"][3] == 0.0
+
+def test_shift_of(monkeypatch):
+    monkeypatch.setattr(config.settings, "scheduling_shift_start_hour", 6)
+    monkeypatch.setattr(config.settings, "oee_shift_hours", 8.0)
+    assert shift_of(datetime(2024, 3, 5, 6, 0)) == (date(2024, 3, 5), 1)
+    assert shift_of(datetime(2024, 3, 5, 14, 30)) == (date(2024, 3, 5), 2)
+    # The night shift belongs to the day it started
+    assert shift_of(datetime(2024, 3, 6, 5, 59)) == (date(2024, 3, 5), 3)